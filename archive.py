@@ -0,0 +1,234 @@
+"""
+Архив закрытых сессий (archive.db).
+
+Заказы, позиции заказов и товары давно закрытых сессий в день продаж не
+нужны, но раздувают таблицы и индексы основной БД. database.archive_session
+переносит их в отдельный файл archive.db, который подключается к каждому
+соединению пула (ATTACH ... AS archive), database.restore_session возвращает
+сессию обратно. Сама сессия, счетчики (rollups.py) и пользователи остаются
+в основной БД.
+
+Транзакция с двумя файлами в режиме WAL не атомарна, поэтому перенос идет
+двумя транзакциями: строки копируются в архив, затем удаляются из основной
+БД. Заказ из архива виден только если его нет в основной БД (visible()),
+поэтому ни между шагами, ни после сбоя заказ не читается дважды, а повторный
+запуск доводит перенос до конца. Восстановление - в обратном порядке.
+
+Чтение обоих хранилищ:
+- временные представления all_orders, all_order_items, all_products;
+- visible(alias) - условие для запросов к archive.orders напрямую.
+
+Товары заказа одной строкой (items_summary) вычисляются при переносе и
+хранятся сжатыми zlib, если это выгодно (config.ARCHIVE_COMPRESS_ITEMS);
+SQL-функция archive_unpack() разворачивает их при чтении.
+"""
+import zlib
+
+import config
+
+# Колонки таблиц, которые переносятся в архив (одинаковые в обоих хранилищах)
+ORDER_COLUMNS = ("order_id, order_number, session_order_number, user_id, session_id, "
+                 "phone_number, full_name, total_amount, status, created_at")
+ORDER_ITEM_COLUMNS = "item_id, order_id, product_id, quantity, price"
+PRODUCT_COLUMNS = "product_id, session_id, product_name, price, boxes_count, created_at, created_by"
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS archive.products (
+        product_id INTEGER PRIMARY KEY,
+        session_id INTEGER NOT NULL,
+        product_name TEXT NOT NULL,
+        price REAL NOT NULL,
+        boxes_count INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP,
+        created_by INTEGER
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS archive.orders (
+        order_id INTEGER PRIMARY KEY,
+        order_number TEXT NOT NULL UNIQUE,
+        session_order_number INTEGER,
+        user_id INTEGER NOT NULL,
+        session_id INTEGER NOT NULL,
+        phone_number TEXT,
+        full_name TEXT,
+        total_amount REAL NOT NULL DEFAULT 0,
+        status TEXT,
+        created_at TIMESTAMP,
+        items_summary BLOB
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS archive.order_items (
+        item_id INTEGER PRIMARY KEY,
+        order_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        price REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_products_session ON products (session_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_orders_created_at ON orders (created_at)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_orders_user ON orders (user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_orders_session_created ON orders (session_id, created_at)",
+    """
+    CREATE INDEX IF NOT EXISTS archive.idx_archive_orders_session_keyset
+    ON orders (session_id, COALESCE(session_order_number, 0))
+    """,
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_order_items_order ON order_items (order_id, product_id, quantity)",
+)
+
+
+def visible(alias: str = "o") -> str:
+    """Условие видимости строки архива: заказа alias.order_id нет в основной БД"""
+    return f"{alias}.order_id NOT IN (SELECT order_id FROM main.orders)"
+
+
+# Представления обоих хранилищ; временные - создаются в каждом соединении
+VIEWS = (
+    f"""
+    CREATE TEMP VIEW IF NOT EXISTS all_orders AS
+    SELECT {ORDER_COLUMNS} FROM main.orders
+    UNION ALL
+    SELECT {ORDER_COLUMNS} FROM archive.orders o WHERE {visible('o')}
+    """,
+    f"""
+    CREATE TEMP VIEW IF NOT EXISTS all_order_items AS
+    SELECT {ORDER_ITEM_COLUMNS} FROM main.order_items
+    UNION ALL
+    SELECT {ORDER_ITEM_COLUMNS} FROM archive.order_items oi WHERE {visible('oi')}
+    """,
+    f"""
+    CREATE TEMP VIEW IF NOT EXISTS all_products AS
+    SELECT {PRODUCT_COLUMNS} FROM main.products
+    UNION ALL
+    SELECT {PRODUCT_COLUMNS} FROM archive.products p
+    WHERE p.product_id NOT IN (SELECT product_id FROM main.products)
+    """,
+)
+
+
+def pack(summary):
+    """Сжимает строку товаров заказа для архива (если сжатие включено и выгодно)"""
+    if summary is None or not config.ARCHIVE_COMPRESS_ITEMS:
+        return summary
+    data = summary.encode('utf-8')
+    compressed = zlib.compress(data, 9)
+    return compressed if len(compressed) < len(data) else summary
+
+
+def unpack(value):
+    """Обратное к pack: строка товаров заказа"""
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode('utf-8')
+    return value
+
+
+def attach(conn, path: str):
+    """
+    Подключает archive.db к соединению: ATTACH, схема архива, SQL-функции
+    archive_pack/archive_unpack и представления обоих хранилищ.
+
+    Вызывается для каждого нового соединения пула (database._on_connect).
+    """
+    conn.create_function('archive_pack', 1, pack, deterministic=True)
+    conn.create_function('archive_unpack', 1, unpack, deterministic=True)
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    # Режим журнала архива - как у основной БД
+    journal_mode = conn.execute("PRAGMA main.journal_mode").fetchone()[0]
+    conn.execute(f"PRAGMA archive.journal_mode = {journal_mode}")
+    for statement in SCHEMA + VIEWS:
+        conn.execute(statement)
+
+
+def copy_to_archive(cursor, session_id: int) -> int:
+    """Копирует товары, заказы и позиции сессии в архив; возвращает число заказов"""
+    cursor.execute(f"""
+        INSERT OR REPLACE INTO archive.products ({PRODUCT_COLUMNS})
+        SELECT {PRODUCT_COLUMNS} FROM main.products WHERE session_id = ?
+    """, (session_id,))
+    cursor.execute(f"""
+        INSERT OR REPLACE INTO archive.orders ({ORDER_COLUMNS}, items_summary)
+        SELECT {', '.join('o.' + c for c in ORDER_COLUMNS.split(', '))},
+               archive_pack((
+                   SELECT GROUP_CONCAT(p.product_name || ' x' || oi.quantity || ' (' || oi.price || '₽)')
+                   FROM main.order_items oi
+                   JOIN main.products p ON oi.product_id = p.product_id
+                   WHERE oi.order_id = o.order_id
+               ))
+        FROM main.orders o
+        WHERE o.session_id = ?
+    """, (session_id,))
+    orders = cursor.rowcount
+    cursor.execute(f"""
+        INSERT OR REPLACE INTO archive.order_items ({ORDER_ITEM_COLUMNS})
+        SELECT {', '.join('oi.' + c for c in ORDER_ITEM_COLUMNS.split(', '))}
+        FROM main.order_items oi
+        JOIN main.orders o ON o.order_id = oi.order_id
+        WHERE o.session_id = ?
+    """, (session_id,))
+    return orders
+
+
+def changed_since_copy(cursor, session_id: int) -> bool:
+    """Есть ли в основной БД строки сессии, которых нет в архиве (изменились после copy_to_archive)"""
+    cursor.execute(f"""
+        SELECT EXISTS (
+            SELECT {ORDER_COLUMNS} FROM main.orders WHERE session_id = ?
+            EXCEPT
+            SELECT {ORDER_COLUMNS} FROM archive.orders WHERE session_id = ?
+        ) OR EXISTS (
+            SELECT {', '.join('oi.' + c for c in ORDER_ITEM_COLUMNS.split(', '))}
+            FROM main.order_items oi JOIN main.orders o ON o.order_id = oi.order_id
+            WHERE o.session_id = ?
+            EXCEPT
+            SELECT {ORDER_ITEM_COLUMNS} FROM archive.order_items
+        ) OR EXISTS (
+            SELECT {PRODUCT_COLUMNS} FROM main.products WHERE session_id = ?
+            EXCEPT
+            SELECT {PRODUCT_COLUMNS} FROM archive.products WHERE session_id = ?
+        )
+    """, (session_id, session_id, session_id, session_id, session_id))
+    return bool(cursor.fetchone()[0])
+
+
+def delete_live(cursor, session_id: int):
+    """Удаляет позиции, заказы и товары сессии из основной БД (после copy_to_archive)"""
+    cursor.execute("""
+        DELETE FROM main.order_items
+        WHERE order_id IN (SELECT order_id FROM main.orders WHERE session_id = ?)
+    """, (session_id,))
+    cursor.execute("DELETE FROM main.orders WHERE session_id = ?", (session_id,))
+    cursor.execute("DELETE FROM main.products WHERE session_id = ?", (session_id,))
+
+
+def copy_to_live(cursor, session_id: int) -> int:
+    """Возвращает товары, заказы и позиции сессии из архива в основную БД; возвращает число заказов"""
+    cursor.execute(f"""
+        INSERT OR REPLACE INTO main.products ({PRODUCT_COLUMNS})
+        SELECT {PRODUCT_COLUMNS} FROM archive.products WHERE session_id = ?
+    """, (session_id,))
+    cursor.execute(f"""
+        INSERT OR REPLACE INTO main.orders ({ORDER_COLUMNS})
+        SELECT {ORDER_COLUMNS} FROM archive.orders WHERE session_id = ?
+    """, (session_id,))
+    orders = cursor.rowcount
+    cursor.execute(f"""
+        INSERT OR REPLACE INTO main.order_items ({ORDER_ITEM_COLUMNS})
+        SELECT {', '.join('oi.' + c for c in ORDER_ITEM_COLUMNS.split(', '))}
+        FROM archive.order_items oi
+        JOIN archive.orders o ON o.order_id = oi.order_id
+        WHERE o.session_id = ?
+    """, (session_id,))
+    return orders
+
+
+def delete_archived(cursor, session_id: int):
+    """Удаляет сессию из архива (после copy_to_live)"""
+    cursor.execute("""
+        DELETE FROM archive.order_items
+        WHERE order_id IN (SELECT order_id FROM archive.orders WHERE session_id = ?)
+    """, (session_id,))
+    cursor.execute("DELETE FROM archive.orders WHERE session_id = ?", (session_id,))
+    cursor.execute("DELETE FROM archive.products WHERE session_id = ?", (session_id,))
@@ -0,0 +1,58 @@
+"""Переносит закрытые сессии в архив (archive.db) и возвращает их обратно.
+
+Запуск:
+    python archive_sessions.py                                 - сколько заказов в БД и в архиве
+    python archive_sessions.py archive <session_id> [--vacuum]  - перенести сессию в архив
+    python archive_sessions.py restore <session_id>             - вернуть сессию из архива
+--vacuum после переноса сжимает файл основной БД (VACUUM).
+"""
+import sys
+import database
+
+ERRORS = {
+    'not_found': "Сессия не найдена.",
+    'trading_active': "Торговля в сессии открыта - сначала остановите ее.",
+    'open_orders': "В сессии есть незавершенные заказы: {open_orders}.",
+    'failed': "Ошибка, подробности в логе.",
+}
+
+
+def print_stats():
+    stats = database.get_archive_stats()
+    print(f"Заказов в основной БД: {stats['live_orders']} ({stats['database_size'] // 1024} КБ)")
+    print(f"Заказов в архиве: {stats['archived_orders']} ({stats['archive_size'] // 1024} КБ)")
+    sessions = ", ".join(map(str, stats['archived_sessions'])) or "нет"
+    print(f"Сессии в архиве: {sessions}")
+
+
+def main():
+    database.init_database()
+    args = sys.argv[1:]
+    if not args:
+        print_stats()
+        return
+    if len(args) < 2 or args[0] not in ('archive', 'restore'):
+        print(__doc__)
+        sys.exit(2)
+
+    session_id = int(args[1])
+    if args[0] == 'archive':
+        result = database.archive_session(session_id)
+    else:
+        result = database.restore_session(session_id)
+    if not result['success']:
+        print(ERRORS[result['error']].format(**result))
+        sys.exit(1)
+
+    action = "перенесена в архив" if args[0] == 'archive' else "восстановлена из архива"
+    print(f"Сессия {session_id} {action}, заказов: {result['orders']}.")
+    if args[0] == 'archive' and '--vacuum' in args[2:]:
+        if database.compact_database():
+            print("Файл основной БД сжат.")
+        else:
+            print("Ошибка при сжатии БД, подробности в логе.")
+    print_stats()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,14 @@
+import asyncio
 import logging
 from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
+from telegram.ext import Application, CommandHandler, MessageHandler, filters
 import config
 import database
-from handlers import commands, callbacks, messages
+import db_async
+import cpu_pool
+from handlers import commands, callbacks, messages, report_jobs
+from handlers.router import router
+from update_processor import UserOrderedUpdateProcessor
 
 # Настройка логирования
 logging.basicConfig(
@@ -12,14 +17,85 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Инициализируем базу данных при запуске
-database.init_database()
+
+async def flush_user_activity_periodically() -> None:
+    """Фоновая задача: записывает буфер активности пользователей в БД по таймеру"""
+    while True:
+        await asyncio.sleep(config.USER_ACTIVITY_FLUSH_INTERVAL)
+        try:
+            await db_async.flush_user_activity()
+        except Exception as e:
+            logger.error(f"Ошибка фоновой записи активности пользователей: {e}")
+
+
+async def purge_conversation_states_periodically() -> None:
+    """Фоновая задача: удаляет истекшие состояния диалогов пользователей"""
+    while True:
+        try:
+            purged = await db_async.purge_expired_conversation_states()
+            if purged:
+                logger.info(f"Удалено истекших состояний диалогов: {purged}")
+        except Exception as e:
+            logger.error(f"Ошибка очистки состояний диалогов: {e}")
+        await asyncio.sleep(config.CONVERSATION_STATE_PURGE_INTERVAL)
+
+
+async def on_startup(application: Application) -> None:
+    """Запуск фоновых задач после инициализации приложения"""
+    application.bot_data['activity_flusher'] = asyncio.create_task(flush_user_activity_periodically())
+    if config.CONVERSATION_STATE_PURGE_INTERVAL > 0:
+        application.bot_data['conversation_purger'] = asyncio.create_task(purge_conversation_states_periodically())
+    # Процессы для Excel-отчетов, картинок и QR-кодов
+    cpu_pool.start()
+
+
+async def on_shutdown(application: Application) -> None:
+    """Остановка фоновых задач и запись накопленных данных"""
+    for name in ('activity_flusher', 'conversation_purger'):
+        task = application.bot_data.pop(name, None)
+        if task is not None:
+            task.cancel()
+    report_stats = report_jobs.queue.stats()
+    await report_jobs.queue.shutdown()
+    cpu_pool.shutdown(wait=False)
+    if report_stats['submitted']:
+        logger.info(f"Очередь отчетов: сформировано {report_stats['completed']}, ошибок {report_stats['failed']}, "
+                    f"объединено запросов {report_stats['coalesced']}, отклонено {report_stats['rejected']}")
+    flushed = await db_async.flush_user_activity()
+    if flushed:
+        logger.info(f"При остановке записана активность {flushed} пользователей")
+    # Самые затратные кнопки за время работы
+    for route in router.stats()[:10]:
+        if route['calls']:
+            logger.info(f"Кнопка {route['pattern']}: {route['calls']} вызовов, ошибок {route['errors']}, "
+                        f"в среднем {route['avg_time']} с, максимум {route['max_time']} с")
 
 
 def main() -> None:
     """Запуск бота"""
+    if not config.BOT_TOKEN:
+        raise ValueError("BOT_TOKEN не найден в переменных окружения!")
+
+    # Инициализируем базу данных при запуске (в main, а не при импорте: процессы
+    # cpu_pool запускаются методом spawn и заново импортируют главный модуль)
+    database.init_database()
+
+    # Периодический checkpoint журнала WAL
+    database.start_checkpointer()
+
     # Создаем приложение
-    application = Application.builder().token(config.BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(config.BOT_TOKEN)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        # Обновления разных пользователей - параллельно, одного пользователя - по порядку
+        .concurrent_updates(UserOrderedUpdateProcessor(
+            config.UPDATE_CONCURRENCY,
+            config.UPDATE_MAX_PENDING,
+        ))
+        .build()
+    )
 
     # Регистрируем обработчики команд
     application.add_handler(CommandHandler("start", commands.start))
@@ -28,47 +104,14 @@ def main() -> None:
     application.add_handler(CommandHandler("admin", commands.admin_panel))
     application.add_handler(CommandHandler("panel", commands.manager_panel))
 
-    # Регистрируем обработчик callback кнопок
-    application.add_handler(CallbackQueryHandler(callbacks.handle_admin_callback, pattern="^admin_"))
+    # Регистрируем обработчик callback кнопок: один на все кнопки, маршруты - в handlers/routes
+    application.add_handler(callbacks.get_callback_handler())
 
     # Регистрируем обработчик текстовых сообщений
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, messages.handle_message))
     
     # Регистрируем обработчик фото (для сканирования QR-кодов)
     application.add_handler(MessageHandler(filters.PHOTO, messages.handle_photo))
-    
-    # Регистрируем обработчики для главного меню и личного кабинета
-    application.add_handler(CallbackQueryHandler(callbacks.handle_admin_callback, pattern="^main_"))
-    application.add_handler(CallbackQueryHandler(callbacks.handle_admin_callback, pattern="^cabinet_"))
-    
-    # Регистрируем обработчик callback для сессий
-    application.add_handler(CallbackQueryHandler(callbacks.handle_admin_callback, pattern="^session_"))
-    
-    # Регистрируем обработчики callback для покупок
-    application.add_handler(CallbackQueryHandler(callbacks.handle_admin_callback, pattern="^product_"))
-    application.add_handler(CallbackQueryHandler(callbacks.handle_admin_callback, pattern="^buy_"))
-    application.add_handler(CallbackQueryHandler(callbacks.handle_admin_callback, pattern="^qty_"))
-    application.add_handler(CallbackQueryHandler(callbacks.handle_admin_callback, pattern="^confirm_phone_"))
-    application.add_handler(CallbackQueryHandler(callbacks.handle_admin_callback, pattern="^cart_"))
-    
-    # Регистрируем обработчики callback для панели менеджера
-    application.add_handler(CallbackQueryHandler(callbacks.handle_admin_callback, pattern="^manager_"))
-    application.add_handler(CallbackQueryHandler(callbacks.handle_admin_callback, pattern="^admin_select_session_report_"))
-    application.add_handler(CallbackQueryHandler(callbacks.handle_admin_callback, pattern="^admin_remove_manager_"))
-    application.add_handler(CallbackQueryHandler(callbacks.handle_admin_callback, pattern="^admin_remove_admin_"))
-    
-    # Регистрируем обработчик для получения QR-кода
-    application.add_handler(CallbackQueryHandler(callbacks.handle_admin_callback, pattern="^get_qr_"))
-    
-    # Регистрируем обработчики для редактирования заказов
-    application.add_handler(CallbackQueryHandler(callbacks.handle_admin_callback, pattern="^admin_order_"))
-    application.add_handler(CallbackQueryHandler(callbacks.handle_admin_callback, pattern="^admin_edit_order_items_"))
-    application.add_handler(CallbackQueryHandler(callbacks.handle_admin_callback, pattern="^admin_delete_order_"))
-    application.add_handler(CallbackQueryHandler(callbacks.handle_admin_callback, pattern="^admin_confirm_delete_order_"))
-    application.add_handler(CallbackQueryHandler(callbacks.handle_admin_callback, pattern="^admin_edit_item_"))
-    application.add_handler(CallbackQueryHandler(callbacks.handle_admin_callback, pattern="^admin_delete_item_"))
-    application.add_handler(CallbackQueryHandler(callbacks.handle_admin_callback, pattern="^admin_add_item_to_order_"))
-    application.add_handler(CallbackQueryHandler(callbacks.handle_admin_callback, pattern="^admin_select_product_add_to_order_"))
 
     # Запускаем бота
     logger.info("Бот запущен...")
@@ -0,0 +1,150 @@
+"""
+Кэши в памяти процесса для данных, которые часто читаются и редко меняются.
+
+Кэш не знает, откуда берутся значения: функции database.py сами кладут
+в него результат запроса и сами сбрасывают его после изменения данных.
+Срок жизни записи (TTL) - страховка на случай изменений в обход бота
+(скрипты add_admin.py, clear_users.py и т.д.).
+"""
+import time
+import threading
+
+# Все созданные кэши - для общей статистики и сброса
+_registry = []
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Словарь с временем жизни записей и счетчиками попаданий и промахов"""
+
+    def __init__(self, name: str, ttl: float, max_size: int = 0):
+        """
+        Параметры:
+            name - имя кэша для статистики
+            ttl - время жизни записи в секундах (0 - без ограничения)
+            max_size - наибольшее число записей (0 - без ограничения); при
+                переполнении вытесняется запись, к которой дольше всего не обращались
+        """
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.enabled = True
+        self._data = {}
+        self._lock = threading.Lock()
+        # Увеличивается при каждом сбросе: значение, прочитанное из БД до сброса,
+        # не должно попасть в кэш после него
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _registry.append(self)
+
+    def get(self, key, default=None):
+        """Возвращает значение или default, если записи нет или она устарела"""
+        value = self.lookup(key)
+        return default if value is _MISSING else value
+
+    def lookup(self, key):
+        """Как get, но при отсутствии записи возвращает cache.MISSING"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if not expires_at or expires_at > time.monotonic():
+                    self.hits += 1
+                    if self.max_size:
+                        # Словарь хранит порядок вставки: последняя использованная запись - в конце
+                        self._data[key] = self._data.pop(key)
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return _MISSING
+
+    @property
+    def generation(self) -> int:
+        """Номер поколения кэша; запомнить перед чтением из БД и передать в set()"""
+        return self._generation
+
+    def set(self, key, value, generation=None):
+        """
+        Запоминает значение (если кэш включен).
+
+        Если передан generation и с тех пор кэш сбрасывался, значение
+        считается устаревшим и не запоминается.
+        """
+        if not self.enabled:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._store(key, (value, expires_at))
+
+    def update(self, key, value):
+        """
+        Запись "насквозь": запоминает значение, только что записанное в БД.
+
+        Увеличивает поколение, как и сброс, чтобы значение, прочитанное
+        из БД до этой записи, не заменило новое.
+        """
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0
+        with self._lock:
+            self._generation += 1
+            if self.enabled:
+                self._store(key, (value, expires_at))
+            else:
+                self._data.pop(key, None)
+
+    def _store(self, key, entry):
+        # Вызывается под self._lock
+        self._data.pop(key, None)
+        self._data[key] = entry
+        if self.max_size:
+            while len(self._data) > self.max_size:
+                del self._data[next(iter(self._data))]
+                self.evictions += 1
+
+    def invalidate(self, key=_MISSING):
+        """Сбрасывает одну запись или, без аргумента, весь кэш"""
+        with self._lock:
+            self._generation += 1
+            if key is _MISSING:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        """Статистика: имя, размер, попадания, промахи, вытеснения, доля попаданий"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'name': self.name,
+                'size': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+MISSING = _MISSING
+
+
+def all_stats() -> list:
+    """Статистика всех созданных кэшей"""
+    return [c.stats() for c in _registry]
+
+
+def invalidate_all():
+    """Сбрасывает все кэши"""
+    for c in _registry:
+        c.invalidate()
+
+
+def set_enabled(enabled: bool):
+    """Включает или выключает все кэши (выключенный кэш ничего не запоминает)"""
+    for c in _registry:
+        c.enabled = enabled
+        if not enabled:
+            c.invalidate()
@@ -4,8 +4,76 @@ from dotenv import load_dotenv
 # Загружаем переменные окружения
 load_dotenv()
 
-# Токен бота
+# Токен бота (наличие проверяется при запуске bot.py)
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 
-if not BOT_TOKEN:
-    raise ValueError("BOT_TOKEN не найден в переменных окружения!")
+# Профиль хранения SQLite: применяется к каждому соединению из пула
+# Режим журнала: WAL позволяет читать (отчеты) одновременно с записью (заказы)
+DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', 'WAL')
+# Синхронизация с диском: в режиме WAL достаточно NORMAL
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL')
+# Сколько миллисекунд ждать блокировку записи вместо ошибки "database is locked"
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+# Кэш страниц на соединение, в килобайтах
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', '16384'))
+# Размер отображения файла БД в память, в байтах (0 - выключено)
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(128 * 1024 * 1024)))
+# Где хранить временные таблицы и индексы: DEFAULT, FILE или MEMORY
+DB_TEMP_STORE = os.getenv('DB_TEMP_STORE', 'MEMORY')
+# Автоматический checkpoint WAL каждые N страниц
+DB_WAL_AUTOCHECKPOINT = int(os.getenv('DB_WAL_AUTOCHECKPOINT', '1000'))
+# Периодический checkpoint WAL в фоне: интервал в секундах (0 - выключено) и режим
+DB_CHECKPOINT_INTERVAL = int(os.getenv('DB_CHECKPOINT_INTERVAL', '300'))
+DB_CHECKPOINT_MODE = os.getenv('DB_CHECKPOINT_MODE', 'TRUNCATE')
+# Размер пула соединений
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))
+
+# Архив закрытых сессий (archive.py): файл архива (относительный путь - рядом
+# с основной БД) и сжатие строк товаров заказов в архиве (1 - включено, 0 - нет)
+ARCHIVE_DB_NAME = os.getenv('ARCHIVE_DB_NAME', 'archive.db')
+ARCHIVE_COMPRESS_ITEMS = os.getenv('ARCHIVE_COMPRESS_ITEMS', '1') == '1'
+
+# Время жизни кэша ролей (администраторы, менеджеры) и регистрации, в секундах.
+# Бот сбрасывает кэш сам при изменениях; TTL нужен для изменений в обход бота (скрипты)
+ROLE_CACHE_TTL = int(os.getenv('ROLE_CACHE_TTL', '300'))
+
+# Время жизни кэша каталога (сессии, товары, остатки), в секундах.
+# Бот обновляет кэш сам при изменениях; TTL нужен для изменений в обход бота (скрипты)
+CATALOG_CACHE_TTL = int(os.getenv('CATALOG_CACHE_TTL', '300'))
+
+# Кэш недавно открытых заказов (поиск по номеру и QR-коду на выдаче): время жизни
+# записи в секундах и наибольшее число заказов в памяти (вытесняются давно не открытые)
+ORDER_CACHE_TTL = int(os.getenv('ORDER_CACHE_TTL', '300'))
+ORDER_CACHE_SIZE = int(os.getenv('ORDER_CACHE_SIZE', '2000'))
+
+# Отложенная запись активности пользователей (/start): как часто записывать буфер в БД,
+# в секундах, и при каком числе пользователей в буфере записывать сразу
+USER_ACTIVITY_FLUSH_INTERVAL = int(os.getenv('USER_ACTIVITY_FLUSH_INTERVAL', '10'))
+USER_ACTIVITY_MAX_PENDING = int(os.getenv('USER_ACTIVITY_MAX_PENDING', '500'))
+
+# Сколько заказов читается из БД за один запрос при постраничном чтении
+# (отчеты, выгрузки): больше - меньше запросов, меньше - меньше памяти
+ORDER_BATCH_SIZE = int(os.getenv('ORDER_BATCH_SIZE', '500'))
+
+# Состояние диалога пользователя (handlers/conversation.py): сколько секунд без
+# действий хранится начатый диалог (покупка, ввод данных администратором) и как
+# часто удалять истекшие состояния из БД, в секундах
+CONVERSATION_STATE_TTL = int(os.getenv('CONVERSATION_STATE_TTL', '86400'))
+CONVERSATION_STATE_PURGE_INTERVAL = int(os.getenv('CONVERSATION_STATE_PURGE_INTERVAL', '3600'))
+
+# Параллельная обработка обновлений (update_processor.py): сколько обновлений разных
+# пользователей обрабатывается одновременно и сколько может ждать очереди всего.
+# Обновления одного пользователя всегда обрабатываются по порядку
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '16'))
+UPDATE_MAX_PENDING = int(os.getenv('UPDATE_MAX_PENDING', '256'))
+
+# Очередь отчетов (handlers/report_jobs.py): сколько отчетов формируется
+# одновременно и сколько разных отчетов может ждать в очереди
+REPORT_CONCURRENCY = int(os.getenv('REPORT_CONCURRENCY', '2'))
+REPORT_QUEUE_SIZE = int(os.getenv('REPORT_QUEUE_SIZE', '20'))
+
+# Пул процессов для тяжелых по CPU задач (cpu_pool.py: Excel-отчеты, картинки,
+# QR-коды): число процессов (по умолчанию - по числу ядер; 0 - без процессов,
+# задачи выполняются в пуле потоков БД) и наибольшее время задачи в секундах
+CPU_WORKERS = int(os.getenv('CPU_WORKERS', str(os.cpu_count() or 1)))
+CPU_JOB_TIMEOUT = float(os.getenv('CPU_JOB_TIMEOUT', '120'))
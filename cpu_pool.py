@@ -0,0 +1,266 @@
+"""
+Тяжелые по CPU задачи в отдельных процессах.
+
+Excel-отчеты (openpyxl), картинки отчета (Pillow), QR-коды и их
+распознавание (pyzbar) занимают процессор. В пуле потоков db_async они
+держат GIL и замедляют цикл событий, поэтому выполняются в пуле процессов
+(config.CPU_WORKERS, по умолчанию - по числу ядер), а обработчик получает
+awaitable:
+
+    excel_file = await cpu_pool.run(reports.generate_period_report_excel, period)
+
+В процесс передается описание задачи Job: имя функции модуля и аргументы.
+Аргументы и результат передаются через pickle, поэтому функция должна быть
+объявлена на уровне модуля (не лямбда и не вложенная функция).
+
+Каждый процесс пула выполняет одну задачу за раз и связан с ботом своим
+каналом (multiprocessing.Pipe), поэтому сбой одной задачи не задевает другие:
+
+- Задача дольше config.CPU_JOB_TIMEOUT секунд - CpuJobTimeout. Зависшую
+  задачу иначе не прервать, поэтому останавливается только процесс этой
+  задачи; вместо него запускается новый.
+- Падение процесса (например, в библиотеке на C) - процесс заменяется,
+  задача повторяется один раз, затем - CpuJobError.
+- Исключение самой функции передается вызывающему как есть.
+
+Процессы запускаются методом spawn (без копии памяти бота с открытыми
+соединениями и циклом событий). В них кэши database.py выключены: их
+сбрасывает при изменениях только основной процесс. CPU_WORKERS=0 - без
+процессов: задачи выполняются в пуле потоков db_async.
+"""
+import os
+import asyncio
+import logging
+import importlib
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+
+
+class CpuJobError(Exception):
+    """Задача не выполнена: процесс пула упал"""
+
+
+class CpuJobTimeout(CpuJobError):
+    """Задача не уложилась в отведенное время"""
+
+
+class Job(NamedTuple):
+    """Описание задачи для процесса пула: функция 'модуль:имя' и аргументы"""
+    func: str
+    args: tuple = ()
+    kwargs: Optional[dict] = None
+
+
+def job(func, *args, **kwargs) -> Job:
+    """Описание задачи для вызова func(*args, **kwargs); func - функция уровня модуля"""
+    name = f"{func.__module__}:{func.__qualname__}"
+    if '<' in func.__qualname__:
+        raise ValueError(f"Функцию {name} нельзя выполнить в другом процессе")
+    return Job(name, args, kwargs or None)
+
+
+def execute(task: Job):
+    """Выполняет задачу (в процессе пула)"""
+    module, _, qualname = task.func.partition(':')
+    func = importlib.import_module(module)
+    for part in qualname.split('.'):
+        func = getattr(func, part)
+    return func(*task.args, **(task.kwargs or {}))
+
+
+def _init_worker(database_path: str):
+    """Инициализация процесса пула: та же БД, что у бота, без кэшей"""
+    import cache
+    import database
+    # Модули задач загружаются сразу, а не при первом отчете
+    import reports
+    import qr_code
+    database.DB_NAME = database_path
+    cache.set_enabled(False)
+
+
+def _worker_main(conn, database_path: str):
+    """Цикл процесса пула: задача из канала -> ('ok', результат) или ('error', исключение)"""
+    _init_worker(database_path)
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            # Бот закрыл канал - процесс завершается
+            return
+        try:
+            reply = ('ok', execute(task))
+        except Exception as e:
+            reply = ('error', e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # Результат или исключение не передаются через pickle
+            conn.send(('error', CpuJobError(f"Результат задачи {task.func} нельзя передать: {e}")))
+
+
+class _Worker:
+    """Процесс пула и его канал"""
+
+    def __init__(self, context, database_path: str):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child, database_path), name='cpu-worker', daemon=True
+        )
+        self.process.start()
+        child.close()
+
+    def kill(self):
+        """Останавливает процесс (вместе с задачей, которую он выполняет)"""
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(1)
+        self.conn.close()
+
+    def close(self, wait: bool):
+        """Закрывает канал: свободный процесс завершается сам"""
+        self.conn.close()
+        if wait:
+            self.process.join()
+
+
+class _Pool:
+    """Процессы пула: не больше size задач одновременно, свободные процессы переиспользуются"""
+
+    def __init__(self, size: int, database_path: str):
+        self.size = size
+        self.database_path = database_path
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = []
+        self._busy = set()
+        self._slots = asyncio.Semaphore(size)
+        # Потоки, ожидающие ответа процессов (conn.recv блокирует)
+        self.waiters = ThreadPoolExecutor(max_workers=size, thread_name_prefix='cpu-wait')
+
+    def spawn(self):
+        """Запускает недостающие свободные процессы"""
+        while len(self._idle) + len(self._busy) < self.size:
+            self._idle.append(_Worker(self._context, self.database_path))
+
+    async def take(self) -> _Worker:
+        """Ждет свободное место и возвращает процесс для задачи"""
+        await self._slots.acquire()
+        worker = None
+        while self._idle and worker is None:
+            worker = self._idle.pop()
+            if not worker.process.is_alive():
+                worker.kill()
+                worker = None
+        try:
+            if worker is None:
+                worker = _Worker(self._context, self.database_path)
+        except BaseException:
+            self._slots.release()
+            raise
+        self._busy.add(worker)
+        return worker
+
+    def give_back(self, worker: _Worker):
+        """Возвращает исправный процесс в пул"""
+        self._busy.discard(worker)
+        self._idle.append(worker)
+        self._slots.release()
+
+    def discard(self, worker: _Worker):
+        """Останавливает процесс задачи (зависшей или упавшей); новый запустится при следующей задаче"""
+        self._busy.discard(worker)
+        worker.kill()
+        self._slots.release()
+
+    def close(self, wait: bool):
+        for worker in list(self._busy):
+            worker.kill()
+        self._busy.clear()
+        for worker in self._idle:
+            worker.close(wait)
+        self._idle = []
+        self.waiters.shutdown(wait=False)
+
+
+def _get_pool() -> _Pool:
+    """Возвращает пул процессов (создает при первом вызове)"""
+    global _pool
+    if _pool is None:
+        import database
+        _pool = _Pool(config.CPU_WORKERS, os.path.abspath(database.DB_NAME))
+    return _pool
+
+
+async def submit(task: Job, timeout: Optional[float] = None):
+    """
+    Выполняет задачу в процессе пула и возвращает ее результат.
+    timeout - секунды выполнения (по умолчанию config.CPU_JOB_TIMEOUT, 0 - без
+    ограничения); ожидание свободного процесса в него не входит
+    """
+    if config.CPU_WORKERS <= 0:
+        import db_async
+        return await db_async.run(execute, task)
+    if timeout is None:
+        timeout = config.CPU_JOB_TIMEOUT
+    pool = _get_pool()
+    loop = asyncio.get_running_loop()
+    for attempt in (1, 2):
+        worker = await pool.take()
+        try:
+            worker.conn.send(task)
+        except (BrokenPipeError, EOFError, OSError):
+            logger.error(f"Процесс пула недоступен для {task.func} (попытка {attempt})")
+            pool.discard(worker)
+            continue
+        except BaseException:
+            # Аргументы не передаются через pickle - процесс задачу не получил
+            pool.give_back(worker)
+            raise
+        try:
+            status, value = await asyncio.wait_for(
+                loop.run_in_executor(pool.waiters, worker.conn.recv), timeout or None
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"Задача {task.func} не выполнилась за {timeout} с, ее процесс остановлен")
+            pool.discard(worker)
+            raise CpuJobTimeout(f"Задача {task.func} не выполнилась за {timeout} с") from None
+        except (EOFError, OSError):
+            logger.error(f"Процесс пула упал при выполнении {task.func} (попытка {attempt})")
+            pool.discard(worker)
+            continue
+        except BaseException:
+            # Отмена: задача еще выполняется, процесс с ней останавливаем
+            pool.discard(worker)
+            raise
+        pool.give_back(worker)
+        if status == 'error':
+            raise value
+        return value
+    raise CpuJobError(f"Процесс пула упал при выполнении {task.func}")
+
+
+async def run(func, *args, **kwargs):
+    """Выполняет func(*args, **kwargs) в пуле процессов (см. submit)"""
+    return await submit(job(func, *args, **kwargs))
+
+
+def start():
+    """Запускает процессы пула заранее, чтобы первый отчет не ждал их запуска"""
+    if config.CPU_WORKERS <= 0:
+        return
+    _get_pool().spawn()
+
+
+def shutdown(wait: bool = True):
+    """Останавливает пул процессов (при завершении бота)"""
+    global _pool
+    if _pool is not None:
+        _pool.close(wait)
+        _pool = None
@@ -1,265 +1,263 @@
+import os
+import json
+import heapq
 import sqlite3
+import hashlib
 import logging
+import itertools
+import contextlib
 from datetime import datetime
 from typing import Optional
 
+import archive
+import cache
+import config
+import db_pool
+import migrations
+import records
+import rollups
+import settings
+import user_activity
+
 logger = logging.getLogger(__name__)
 
 DB_NAME = "bot_database.db"
 
+# Пул соединений создаётся при первом обращении к базе
+_pool = None
+_checkpointer = None
+
+# Роли и регистрация проверяются почти в каждом обработчике, поэтому держим их в памяти.
+# Списки администраторов и менеджеров маленькие - кэшируем их целиком.
+_roles_cache = cache.TTLCache('roles', config.ROLE_CACHE_TTL)
+_registration_cache = cache.TTLCache('registration', config.ROLE_CACHE_TTL)
+# Таблица settings целиком в памяти; меняется только через set_setting
+_settings = settings.SettingsStore()
+# Каталог (сессии и товары) меняется только действиями администратора. Поколение
+# _catalog_cache - номер версии каталога: функции, меняющие каталог, сбрасывают его.
+# Остатки товаров меняются при каждом заказе, поэтому хранятся отдельно и обновляются
+# "насквозь" точными значениями из БД сразу после фиксации транзакции
+_catalog_cache = cache.TTLCache('catalog', config.CATALOG_CACHE_TTL)
+_stock_cache = cache.TTLCache('stock', config.CATALOG_CACHE_TTL)
+# Активность пользователей (/start) копится в памяти и записывается пачками
+_activity = user_activity.ActivityBuffer()
+# Недавно открытые заказы (поиск по номеру и QR-коду на выдаче): заказ по order_id,
+# его товары по ('items', order_id) и номера заказов -> order_id. Функции, меняющие
+# статус или состав заказа, сбрасывают его записи (_forget_orders)
+_order_cache = cache.TTLCache('orders', config.ORDER_CACHE_TTL, max_size=config.ORDER_CACHE_SIZE)
+
+# Колонки заказа для выборок в records.Order
+_ORDER_COLUMNS = ("order_id, order_number, session_order_number, user_id, session_id, "
+                  "phone_number, full_name, total_amount, status, created_at")
+# Поля заказов из _iter_order_pages (колонки заказа и товары одной строкой)
+_ORDER_PAGE_FIELDS = tuple(_ORDER_COLUMNS.split(", ")) + ('items',)
+
+
+def get_storage_profile() -> dict:
+    """Профиль хранения SQLite из config.py (переменные окружения DB_*)"""
+    return {
+        'journal_mode': config.DB_JOURNAL_MODE,
+        'synchronous': config.DB_SYNCHRONOUS,
+        'busy_timeout': config.DB_BUSY_TIMEOUT_MS,
+        'cache_size_kb': config.DB_CACHE_SIZE_KB,
+        'mmap_size': config.DB_MMAP_SIZE,
+        'temp_store': config.DB_TEMP_STORE,
+        'wal_autocheckpoint': config.DB_WAL_AUTOCHECKPOINT,
+    }
 
-def init_database():
-    """Инициализация базы данных и создание таблиц"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            username TEXT,
-            first_name TEXT NOT NULL,
-            last_name TEXT,
-            language_code TEXT,
-            is_bot INTEGER DEFAULT 0,
-            is_premium INTEGER DEFAULT 0,
-            added_to_attachment_menu INTEGER DEFAULT 0,
-            can_join_groups INTEGER DEFAULT 1,
-            can_read_all_group_messages INTEGER DEFAULT 0,
-            supports_inline_queries INTEGER DEFAULT 0,
-            chat_id INTEGER,
-            first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            total_messages INTEGER DEFAULT 0
-        )
-    """)
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS admins (
-            user_id INTEGER PRIMARY KEY,
-            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(user_id)
-        )
-    """)
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS managers (
-            user_id INTEGER PRIMARY KEY,
-            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(user_id)
-        )
-    """)
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS sessions (
-            session_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_name TEXT NOT NULL UNIQUE,
-            is_active INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            created_by INTEGER,
-            FOREIGN KEY (created_by) REFERENCES users(user_id)
-        )
-    """)
-    
-    # Добавляем поле is_active, если таблица уже существует
-    try:
-        cursor.execute("ALTER TABLE sessions ADD COLUMN is_active INTEGER DEFAULT 0")
-    except sqlite3.OperationalError:
-        pass  # Поле уже существует
-    # Добавляем поле description для сессии (название + описание/ссылка)
-    try:
-        cursor.execute("ALTER TABLE sessions ADD COLUMN description TEXT DEFAULT ''")
-    except sqlite3.OperationalError:
-        pass  # Поле уже существует
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS products (
-            product_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id INTEGER NOT NULL,
-            product_name TEXT NOT NULL,
-            price REAL NOT NULL,
-            boxes_count INTEGER NOT NULL DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            created_by INTEGER,
-            FOREIGN KEY (session_id) REFERENCES sessions(session_id),
-            FOREIGN KEY (created_by) REFERENCES users(user_id)
-        )
-    """)
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS settings (
-            setting_key TEXT PRIMARY KEY,
-            setting_value TEXT NOT NULL,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS orders (
-            order_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            order_number TEXT NOT NULL UNIQUE,
-            session_order_number INTEGER,
-            user_id INTEGER NOT NULL,
-            session_id INTEGER NOT NULL,
-            phone_number TEXT,
-            full_name TEXT,
-            total_amount REAL NOT NULL DEFAULT 0,
-            status TEXT DEFAULT 'pending',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(user_id),
-            FOREIGN KEY (session_id) REFERENCES sessions(session_id)
-        )
-    """)
-    
-    # Добавляем поле session_order_number, если таблица уже существует
+
+def get_archive_path() -> str:
+    """Путь к файлу архива (config.ARCHIVE_DB_NAME; относительный - рядом с DB_NAME)"""
+    return os.path.join(os.path.dirname(os.path.abspath(DB_NAME)), config.ARCHIVE_DB_NAME)
+
+
+def _on_connect(conn: sqlite3.Connection):
+    db_pool.apply_storage_profile(conn, get_storage_profile())
+    archive.attach(conn, get_archive_path())
+
+
+def get_pool() -> db_pool.ConnectionPool:
+    """Возвращает пул соединений к DB_NAME (создаёт при первом вызове)"""
+    global _pool
+    if _pool is None or _pool.database != DB_NAME:
+        if _pool is not None:
+            _pool.close_all()
+        # Кэши относятся к прежнему файлу БД
+        _settings.clear()
+        cache.invalidate_all()
+        _pool = db_pool.ConnectionPool(DB_NAME, max_size=config.DB_POOL_SIZE, on_connect=_on_connect)
+    return _pool
+
+
+def get_connection() -> db_pool.PooledConnection:
+    """Выдаёт соединение из пула; close() возвращает его обратно в пул"""
+    return get_pool().acquire()
+
+
+@contextlib.contextmanager
+def unit_of_work(write: bool = True):
+    """
+    Одна транзакция и одно соединение на все вызовы функций database.py в блоке with.
+
+        with database.unit_of_work():
+            placed = place_order(...)
+            order = get_order(placed['order_id'])  # видит незафиксированный заказ
+
+    Функции, вызванные внутри, работают через точки сохранения общей
+    транзакции (db_pool.UnitConnection): их собственные commit/rollback
+    фиксируют или откатывают только их часть, а в БД все изменения
+    попадают при выходе из блока. Исключение откатывает блок целиком.
+    write=False - согласованное чтение без замка записи.
+
+    Блок держит замок записи пула, поэтому внутри не должно быть ожидания
+    сети: из обработчиков - через db_async.transaction.
+    """
     try:
-        cursor.execute("ALTER TABLE orders ADD COLUMN session_order_number INTEGER")
-    except sqlite3.OperationalError:
-        pass  # Поле уже существует
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS order_items (
-            item_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            order_id INTEGER NOT NULL,
-            product_id INTEGER NOT NULL,
-            quantity INTEGER NOT NULL,
-            price REAL NOT NULL,
-            FOREIGN KEY (order_id) REFERENCES orders(order_id),
-            FOREIGN KEY (product_id) REFERENCES products(product_id)
-        )
-    """)
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS user_session_limits (
-            user_id INTEGER NOT NULL,
-            session_id INTEGER NOT NULL,
-            boxes_purchased INTEGER DEFAULT 0,
-            PRIMARY KEY (user_id, session_id),
-            FOREIGN KEY (user_id) REFERENCES users(user_id),
-            FOREIGN KEY (session_id) REFERENCES sessions(session_id)
-        )
-    """)
-    
-    # Добавляем phone_number и full_name в users, если их ещё нет
-    for col in ('phone_number', 'full_name'):
-        try:
-            cursor.execute(f"ALTER TABLE users ADD COLUMN {col} TEXT")
-        except sqlite3.OperationalError:
-            pass
-    
-    # Инициализируем лимит на человека значением по умолчанию, если его нет
-    cursor.execute("SELECT setting_key FROM settings WHERE setting_key = 'limit_per_person'")
-    if not cursor.fetchone():
-        cursor.execute("""
-            INSERT INTO settings (setting_key, setting_value)
-            VALUES ('limit_per_person', '0')
-        """)
-    
+        with get_pool().unit_of_work(write=write) as conn:
+            yield conn
+    except BaseException:
+        # Кэши могли запомнить данные откаченной транзакции
+        cache.invalidate_all()
+        _settings.clear()
+        raise
+
+
+def _record_cursor(conn, record_cls):
+    """Курсор, который возвращает строки как записи record_cls (см. records.py)"""
+    cursor = conn.cursor()
+    cursor.row_factory = records.row_factory(record_cls)
+    return cursor
+
+
+def init_database():
+    """Инициализация базы данных: применение миграций схемы"""
+    conn = get_connection()
+    migrations.migrate(conn)
+    version = migrations.get_schema_version(conn)
     conn.commit()
+    profile = db_pool.describe_storage_profile(conn)
     conn.close()
-    logger.info("База данных инициализирована")
+    # Настройки читаются в обработчиках без обращения к БД - загружаем их сразу
+    _settings.clear()
+    _load_settings()
+    logger.info(f"База данных инициализирована (версия схемы {version})")
+    logger.info("Профиль хранения SQLite: " + ", ".join(f"{k}={v}" for k, v in profile.items()))
+
+
+def start_checkpointer() -> Optional[db_pool.Checkpointer]:
+    """Запускает фоновый checkpoint WAL с интервалом из config.DB_CHECKPOINT_INTERVAL"""
+    global _checkpointer
+    if config.DB_CHECKPOINT_INTERVAL <= 0:
+        return None
+    if _checkpointer is None or not _checkpointer.is_alive():
+        _checkpointer = db_pool.Checkpointer(get_pool(), config.DB_CHECKPOINT_INTERVAL, config.DB_CHECKPOINT_MODE)
+        _checkpointer.start()
+        logger.info(
+            f"Фоновый checkpoint WAL: каждые {config.DB_CHECKPOINT_INTERVAL} с, режим {_checkpointer.mode}"
+        )
+    return _checkpointer
 
 
 def save_or_update_user(user, chat_id: int):
-    """Сохраняет или обновляет информацию о пользователе"""
-    conn = sqlite3.connect(DB_NAME)
+    """
+    Сохраняет или обновляет информацию о пользователе.
+
+    Запись откладывается: обращение запоминается в буфере активности, а в БД
+    попадает при flush_user_activity() (по таймеру, при переполнении буфера
+    и при остановке бота).
+    """
+    pending = _activity.record(user, chat_id)
+    logger.debug(f"Активность пользователя {user.id} добавлена в буфер ({pending} в очереди)")
+    if pending >= config.USER_ACTIVITY_MAX_PENDING:
+        flush_user_activity()
+
+
+def flush_user_activity(user_id: Optional[int] = None) -> int:
+    """
+    Записывает накопленную активность пользователей в users одной транзакцией.
+
+    Если указан user_id, записывает только этого пользователя (перед изменением
+    его строки в users). Возвращает число записанных пользователей.
+    """
+    entries = _activity.drain(user_id)
+    if not entries:
+        return 0
+    columns = ('user_id',) + user_activity.PROFILE_FIELDS + ('first_seen', 'last_seen', 'total_messages')
+    updates = ", ".join(f"{field} = excluded.{field}" for field in user_activity.PROFILE_FIELDS)
+    rows = [
+        (entry['user_id'],) + tuple(entry[field] for field in user_activity.PROFILE_FIELDS)
+        + (entry['first_seen'], entry['last_seen'], entry['messages'])
+        for entry in entries
+    ]
+    pool = get_pool()
+    conn = get_connection()
     cursor = conn.cursor()
-    
-    # Проверяем, существует ли пользователь
-    cursor.execute("SELECT user_id FROM users WHERE user_id = ?", (user.id,))
-    exists = cursor.fetchone()
-    
-    if exists:
-        # Обновляем информацию
-        cursor.execute("""
-            UPDATE users SET
-                username = ?,
-                first_name = ?,
-                last_name = ?,
-                language_code = ?,
-                is_bot = ?,
-                is_premium = ?,
-                added_to_attachment_menu = ?,
-                can_join_groups = ?,
-                can_read_all_group_messages = ?,
-                supports_inline_queries = ?,
-                chat_id = ?,
-                last_seen = CURRENT_TIMESTAMP,
-                total_messages = total_messages + 1
-            WHERE user_id = ?
-        """, (
-            user.username,
-            user.first_name,
-            user.last_name,
-            user.language_code,
-            1 if user.is_bot else 0,
-            1 if getattr(user, 'is_premium', False) else 0,
-            1 if getattr(user, 'added_to_attachment_menu', False) else 0,
-            1 if getattr(user, 'can_join_groups', True) else 0,
-            1 if getattr(user, 'can_read_all_group_messages', False) else 0,
-            1 if getattr(user, 'supports_inline_queries', False) else 0,
-            chat_id,
-            user.id
-        ))
-        logger.info(f"Обновлена информация о пользователе {user.id}")
-    else:
-        # Создаем новую запись
-        cursor.execute("""
-            INSERT INTO users (
-                user_id, username, first_name, last_name, language_code,
-                is_bot, is_premium, added_to_attachment_menu,
-                can_join_groups, can_read_all_group_messages,
-                supports_inline_queries, chat_id, first_seen, last_seen, total_messages
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, 1)
-        """, (
-            user.id,
-            user.username,
-            user.first_name,
-            user.last_name,
-            user.language_code,
-            1 if user.is_bot else 0,
-            1 if getattr(user, 'is_premium', False) else 0,
-            1 if getattr(user, 'added_to_attachment_menu', False) else 0,
-            1 if getattr(user, 'can_join_groups', True) else 0,
-            1 if getattr(user, 'can_read_all_group_messages', False) else 0,
-            1 if getattr(user, 'supports_inline_queries', False) else 0,
-            chat_id
-        ))
-        logger.info(f"Сохранен новый пользователь {user.id} ({user.first_name})")
-    
-    conn.commit()
-    conn.close()
+    try:
+        with pool.write_lock:
+            cursor.executemany(f"""
+                INSERT INTO users ({", ".join(columns)})
+                VALUES ({", ".join("?" * len(columns))})
+                ON CONFLICT(user_id) DO UPDATE SET
+                    {updates},
+                    last_seen = excluded.last_seen,
+                    total_messages = total_messages + excluded.total_messages
+            """, rows)
+            conn.commit()
+        conn.close()
+        _activity.done(entries)
+        logger.debug(f"Записана активность {len(entries)} пользователей")
+        return len(entries)
+    except Exception as e:
+        logger.error(f"Ошибка при записи активности пользователей: {e}")
+        conn.rollback()
+        conn.close()
+        _activity.restore(entries)
+        return 0
 
 
-def get_user_info(user_id: int) -> Optional[dict]:
+def get_user_activity_stats() -> dict:
+    """Статистика буфера активности пользователей"""
+    return _activity.stats()
+
+
+def get_user_info(user_id: int) -> Optional[records.User]:
     """Получает информацию о пользователе из базы данных"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    conn = get_connection()
+    cursor = _record_cursor(conn, records.User)
     
     cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
     row = cursor.fetchone()
     conn.close()
     
+    # Активность, еще не записанная в БД, накладывается поверх строки из users
+    pending = _activity.pending(user_id)
+    if pending:
+        result = {field: None for field in ('phone_number', 'full_name')}
+        if row:
+            result.update(row.to_dict())
+            result['total_messages'] = (result.get('total_messages') or 0) + pending['messages']
+        else:
+            result.update(first_seen=pending['first_seen'], total_messages=pending['messages'])
+        result.update({field: pending[field] for field in user_activity.PROFILE_FIELDS})
+        result.update(user_id=user_id, last_seen=pending['last_seen'])
+        return records.User.from_dict(result)
+    
     if row:
-        columns = [
-            'user_id', 'username', 'first_name', 'last_name', 'language_code',
-            'is_bot', 'is_premium', 'added_to_attachment_menu',
-            'can_join_groups', 'can_read_all_group_messages',
-            'supports_inline_queries', 'chat_id', 'first_seen', 'last_seen', 'total_messages',
-            'phone_number', 'full_name'
-        ]
-        # Учитываем случай, когда в БД ещё нет колонок phone_number, full_name
-        result = dict(zip(columns[:len(row)], row))
-        if 'phone_number' not in result:
-            result['phone_number'] = None
-        if 'full_name' not in result:
-            result['full_name'] = None
-        return result
+        return _with_profile_columns(row)
     return None
 
 
+def _with_profile_columns(user: records.User) -> records.User:
+    # Учитываем случай, когда в БД ещё нет колонок phone_number, full_name
+    missing = {field: None for field in ('phone_number', 'full_name') if field not in user}
+    return user.copy(**missing) if missing else user
+
+
 def update_user_profile(user_id: int, phone_number: Optional[str] = None, full_name: Optional[str] = None) -> bool:
     """Обновляет телефон и/или ФИО пользователя в профиле"""
-    conn = sqlite3.connect(DB_NAME)
+    # Строка пользователя может быть еще только в буфере активности
+    flush_user_activity(user_id)
+    conn = get_connection()
     cursor = conn.cursor()
     try:
         if phone_number is not None and full_name is not None:
@@ -282,6 +280,7 @@ def update_user_profile(user_id: int, phone_number: Optional[str] = None, full_n
             return False
         conn.commit()
         conn.close()
+        _registration_cache.invalidate(user_id)
         return True
     except Exception:
         conn.close()
@@ -290,39 +289,56 @@ def update_user_profile(user_id: int, phone_number: Optional[str] = None, full_n
 
 def is_registered(user_id: int) -> bool:
     """Проверяет, зарегистрирован ли пользователь (указан ли телефон)"""
-    info = get_user_info(user_id)
-    return bool(info and info.get('phone_number'))
+    registered = _registration_cache.lookup(user_id)
+    if registered is not cache.MISSING:
+        return registered
+    generation = _registration_cache.generation
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT phone_number FROM users WHERE user_id = ?", (user_id,))
+    row = cursor.fetchone()
+    conn.close()
+    registered = bool(row and row[0])
+    _registration_cache.set(user_id, registered, generation)
+    return registered
+
+
+def _get_role_ids(table: str) -> frozenset:
+    """ID всех пользователей с ролью (таблица admins или managers), из кэша"""
+    ids = _roles_cache.lookup(table)
+    if ids is not cache.MISSING:
+        return ids
+    generation = _roles_cache.generation
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT user_id FROM {table}")
+    ids = frozenset(row[0] for row in cursor.fetchall())
+    conn.close()
+    _roles_cache.set(table, ids, generation)
+    return ids
 
 
 def is_admin(user_id: int) -> bool:
     """Проверяет, является ли пользователь администратором"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id FROM admins WHERE user_id = ?", (user_id,))
-    result = cursor.fetchone() is not None
-    conn.close()
-    return result
+    return user_id in _get_role_ids('admins')
 
 
 def is_manager(user_id: int) -> bool:
     """Проверяет, является ли пользователь менеджером"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id FROM managers WHERE user_id = ?", (user_id,))
-    result = cursor.fetchone() is not None
-    conn.close()
-    return result
+    return user_id in _get_role_ids('managers')
 
 
 def add_admin(user_id: int) -> bool:
     """Добавляет администратора"""
-    conn = sqlite3.connect(DB_NAME)
+    flush_user_activity(user_id)
+    conn = get_connection()
     cursor = conn.cursor()
     try:
         cursor.execute("INSERT OR IGNORE INTO admins (user_id) VALUES (?)", (user_id,))
         conn.commit()
         success = cursor.rowcount > 0
         conn.close()
+        _roles_cache.invalidate('admins')
         return success
     except:
         conn.close()
@@ -331,24 +347,27 @@ def add_admin(user_id: int) -> bool:
 
 def remove_admin(user_id: int) -> bool:
     """Удаляет администратора"""
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("DELETE FROM admins WHERE user_id = ?", (user_id,))
     conn.commit()
     success = cursor.rowcount > 0
     conn.close()
+    _roles_cache.invalidate('admins')
     return success
 
 
 def add_manager(user_id: int) -> bool:
     """Добавляет менеджера"""
-    conn = sqlite3.connect(DB_NAME)
+    flush_user_activity(user_id)
+    conn = get_connection()
     cursor = conn.cursor()
     try:
         cursor.execute("INSERT OR IGNORE INTO managers (user_id) VALUES (?)", (user_id,))
         conn.commit()
         success = cursor.rowcount > 0
         conn.close()
+        _roles_cache.invalidate('managers')
         return success
     except:
         conn.close()
@@ -357,18 +376,38 @@ def add_manager(user_id: int) -> bool:
 
 def remove_manager(user_id: int) -> bool:
     """Удаляет менеджера"""
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("DELETE FROM managers WHERE user_id = ?", (user_id,))
     conn.commit()
     success = cursor.rowcount > 0
     conn.close()
+    _roles_cache.invalidate('managers')
     return success
 
 
+def get_cache_stats() -> list:
+    """Статистика кэшей в памяти (попадания, промахи, размер)"""
+    return cache.all_stats()
+
+
+def get_managers() -> list:
+    """Получает список менеджеров с именем и username"""
+    conn = get_connection()
+    cursor = _record_cursor(conn, records.User)
+    cursor.execute("""
+        SELECT m.user_id, u.first_name, u.username
+        FROM managers m
+        JOIN users u ON m.user_id = u.user_id
+    """)
+    managers = cursor.fetchall()
+    conn.close()
+    return managers
+
+
 def add_session(session_name: str, created_by: int, description: str = "") -> Optional[int]:
     """Добавляет новую сессию (имя и описание; описание может быть ссылкой)."""
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     try:
         cursor.execute("""
@@ -378,6 +417,7 @@ def add_session(session_name: str, created_by: int, description: str = "") -> Op
         conn.commit()
         session_id = cursor.lastrowid
         conn.close()
+        _bump_catalog_version()
         logger.info(f"Создана сессия '{session_name}' пользователем {created_by}")
         return session_id
     except sqlite3.IntegrityError:
@@ -389,29 +429,68 @@ def add_session(session_name: str, created_by: int, description: str = "") -> Op
         return None
 
 
-def get_all_sessions() -> list:
-    """Получает список всех сессий (с полем description)."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT session_id, session_name, COALESCE(description, '') FROM sessions ORDER BY created_at DESC")
+def get_catalog_version() -> int:
+    """Номер версии каталога (увеличивается при каждом изменении сессий и товаров)"""
+    return _catalog_cache.generation
+
+
+def _bump_catalog_version():
+    """Сбрасывает кэш каталога после изменения сессий или товаров"""
+    _catalog_cache.invalidate()
+
+
+def _cached_catalog(key, load):
+    """Значение из кэша каталога; при промахе вызывает load() и запоминает результат"""
+    value = _catalog_cache.lookup(key)
+    if value is cache.MISSING:
+        generation = _catalog_cache.generation
+        value = load()
+        _catalog_cache.set(key, value, generation)
+    return value
+
+
+def _set_stock(stock: dict):
+    """Запоминает остатки товаров {product_id: boxes_count}, только что записанные в БД"""
+    for product_id, boxes_count in stock.items():
+        _stock_cache.update(product_id, boxes_count)
+
+
+def _with_stock(products: list) -> Optional[list]:
+    """Копии товаров с текущими остатками; None, если остаток какого-то товара не в кэше"""
+    result = []
+    for product in products:
+        boxes_count = _stock_cache.lookup(product['product_id'])
+        if boxes_count is cache.MISSING:
+            return None
+        result.append(product.copy(boxes_count=boxes_count))
+    return result
+
+
+def _load_sessions(active_only: bool) -> list:
+    conn = get_connection()
+    cursor = _record_cursor(conn, records.Session)
+    where = "WHERE is_active = 1 " if active_only else ""
+    cursor.execute(f"SELECT session_id, session_name, COALESCE(description, '') AS description FROM sessions {where}ORDER BY created_at DESC")
     sessions = cursor.fetchall()
     conn.close()
-    return [{"session_id": s[0], "session_name": s[1], "description": s[2] or ""} for s in sessions]
+    return sessions
+
+
+def get_all_sessions() -> list:
+    """Получает список всех сессий (с полем description)."""
+    sessions = _cached_catalog('sessions', lambda: _load_sessions(False))
+    return [s.copy() for s in sessions]
 
 
 def get_active_sessions() -> list:
     """Получает список активных сессий (с полем description)."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT session_id, session_name, COALESCE(description, '') FROM sessions WHERE is_active = 1 ORDER BY created_at DESC")
-    sessions = cursor.fetchall()
-    conn.close()
-    return [{"session_id": s[0], "session_name": s[1], "description": s[2] or ""} for s in sessions]
+    sessions = _cached_catalog('active_sessions', lambda: _load_sessions(True))
+    return [s.copy() for s in sessions]
 
 
 def delete_session(session_id: int) -> bool:
     """Удаляет сессию и связанные данные"""
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     try:
         # Проверяем, существует ли сессия
@@ -423,8 +502,9 @@ def delete_session(session_id: int) -> bool:
         # Отключаем проверку foreign key для этой операции
         cursor.execute("PRAGMA foreign_keys = OFF")
         
-        # Удаляем связанные записи из user_session_limits
-        cursor.execute("DELETE FROM user_session_limits WHERE session_id = ?", (session_id,))
+        # Заказы сессии остаются в истории покупателей, поэтому счетчики по ним
+        # (user_session_limits, session_stats и т.д., см. rollups.py) не удаляем
+        cursor.execute("DELETE FROM session_order_counters WHERE session_id = ?", (session_id,))
         
         # Удаляем товары сессии
         cursor.execute("DELETE FROM products WHERE session_id = ?", (session_id,))
@@ -437,6 +517,9 @@ def delete_session(session_id: int) -> bool:
         
         conn.commit()
         conn.close()
+        _bump_catalog_version()
+        # Товары заказов читаются вместе с названиями удаленных товаров
+        _order_cache.invalidate()
         logger.info(f"Сессия {session_id} и связанные данные удалены")
         return True
     except Exception as e:
@@ -446,27 +529,26 @@ def delete_session(session_id: int) -> bool:
         return False
 
 
-def get_session(session_id: int) -> Optional[dict]:
-    """Получает информацию о сессии (включая description)."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT session_id, session_name, is_active, created_at, COALESCE(description, '') FROM sessions WHERE session_id = ?", (session_id,))
-    row = cursor.fetchone()
+def _load_session(session_id: int) -> Optional[records.Session]:
+    conn = get_connection()
+    cursor = _record_cursor(conn, records.Session)
+    cursor.execute("SELECT session_id, session_name, is_active, created_at, COALESCE(description, '') AS description, archived_at FROM sessions WHERE session_id = ?", (session_id,))
+    session = cursor.fetchone()
     conn.close()
-    if row:
-        return {
-            "session_id": row[0],
-            "session_name": row[1],
-            "is_active": bool(row[2]),
-            "created_at": row[3],
-            "description": row[4] or ""
-        }
-    return None
+    if session:
+        session.is_active = bool(session.is_active)
+    return session
+
+
+def get_session(session_id: int) -> Optional[records.Session]:
+    """Получает информацию о сессии (включая description)."""
+    session = _cached_catalog(('session', session_id), lambda: _load_session(session_id))
+    return session.copy() if session else None
 
 
 def add_product(session_id: int, product_name: str, price: float, boxes_count: int, created_by: int) -> Optional[int]:
     """Добавляет новый товар"""
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     try:
         cursor.execute("""
@@ -476,6 +558,7 @@ def add_product(session_id: int, product_name: str, price: float, boxes_count: i
         conn.commit()
         product_id = cursor.lastrowid
         conn.close()
+        _bump_catalog_version()
         logger.info(f"Создан товар '{product_name}' для сессии {session_id} пользователем {created_by}")
         return product_id
     except Exception as e:
@@ -484,10 +567,12 @@ def add_product(session_id: int, product_name: str, price: float, boxes_count: i
         return None
 
 
-def get_products_by_session(session_id: int) -> list:
-    """Получает список товаров для сессии"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+def _load_products_by_session(session_id: int) -> list:
+    # Поколение остатков запоминаем до запроса: если заказ изменит остаток во время
+    # загрузки, прочитанное значение в кэш не попадет
+    stock_generation = _stock_cache.generation
+    conn = get_connection()
+    cursor = _record_cursor(conn, records.Product)
     cursor.execute("""
         SELECT product_id, product_name, price, boxes_count 
         FROM products 
@@ -496,106 +581,249 @@ def get_products_by_session(session_id: int) -> list:
     """, (session_id,))
     products = cursor.fetchall()
     conn.close()
-    return [{"product_id": p[0], "product_name": p[1], "price": p[2], "boxes_count": p[3]} for p in products]
+    for p in products:
+        _stock_cache.set(p.product_id, p.boxes_count, stock_generation)
+    return products
 
 
-def get_product(product_id: int) -> Optional[dict]:
-    """Получает информацию о товаре"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+def get_products_by_session(session_id: int) -> list:
+    """Получает список товаров для сессии (каталог из кэша, остатки актуальные)"""
+    products = _cached_catalog(('products', session_id), lambda: _load_products_by_session(session_id))
+    result = _with_stock(products)
+    if result is None:
+        # Остаток изменился во время загрузки - берем список прямо из БД
+        result = _load_products_by_session(session_id)
+    return result
+
+
+def _load_product(product_id: int) -> Optional[records.Product]:
+    stock_generation = _stock_cache.generation
+    conn = get_connection()
+    cursor = _record_cursor(conn, records.Product)
     cursor.execute("""
         SELECT product_id, session_id, product_name, price, boxes_count 
         FROM products 
         WHERE product_id = ?
     """, (product_id,))
-    row = cursor.fetchone()
+    product = cursor.fetchone()
     conn.close()
-    if row:
-        return {
-            "product_id": row[0],
-            "session_id": row[1],
-            "product_name": row[2],
-            "price": row[3],
-            "boxes_count": row[4]
-        }
-    return None
+    if product:
+        _stock_cache.set(product.product_id, product.boxes_count, stock_generation)
+    return product
+
+
+def get_product(product_id: int) -> Optional[records.Product]:
+    """Получает информацию о товаре (каталог из кэша, остаток актуальный)"""
+    product = _cached_catalog(('product', product_id), lambda: _load_product(product_id))
+    if product is None:
+        return None
+    result = _with_stock([product])
+    return result[0] if result else _load_product(product_id)
 
 
 def delete_product(product_id: int) -> bool:
     """Удаляет товар"""
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("DELETE FROM products WHERE product_id = ?", (product_id,))
     conn.commit()
     success = cursor.rowcount > 0
     conn.close()
     if success:
+        _bump_catalog_version()
+        _order_cache.invalidate()
         logger.info(f"Товар {product_id} удален")
     return success
 
 
 def update_product_boxes_count(product_id: int, boxes_count: int) -> bool:
     """Обновляет количество ящиков товара"""
-    conn = sqlite3.connect(DB_NAME)
+    pool = get_pool()
+    conn = get_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("UPDATE products SET boxes_count = ? WHERE product_id = ?", (boxes_count, product_id))
-        conn.commit()
+        with pool.write_lock:
+            cursor.execute("UPDATE products SET boxes_count = ? WHERE product_id = ?", (boxes_count, product_id))
+            conn.commit()
+            _set_stock({product_id: boxes_count})
+            conn.close()
+            logger.info(f"Количество ящиков товара {product_id} обновлено на {boxes_count}")
+            return True
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении количества ящиков: {e}")
         conn.close()
-        logger.info(f"Количество ящиков товара {product_id} обновлено на {boxes_count}")
+        return False
+
+
+def _load_settings():
+    """Загружает все строки settings в память (один раз на процесс и файл БД)"""
+    pool = get_pool()
+    conn = get_connection()
+    try:
+        # Под замком записи: set_setting не запишет значение между чтением и загрузкой
+        with pool.write_lock:
+            if _settings.loaded:
+                return
+            cursor = conn.cursor()
+            cursor.execute("SELECT setting_key, setting_value FROM settings")
+            _settings.load(cursor.fetchall())
+    finally:
+        conn.close()
+
+
+def get_setting(key: str):
+    """Значение настройки из памяти (тип и значение по умолчанию - в settings.SETTINGS)"""
+    if not _settings.loaded:
+        _load_settings()
+    return _settings.get(key)
+
+
+def get_all_settings() -> dict:
+    """Все настройки из памяти"""
+    if not _settings.loaded:
+        _load_settings()
+    return _settings.as_dict()
+
+
+def set_setting(key: str, value) -> bool:
+    """Записывает настройку в БД и в память"""
+    try:
+        raw = settings.format_value(key, value)
+    except ValueError as e:
+        logger.error(f"Ошибка при установке настройки: {e}")
+        return False
+    pool = get_pool()
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        with pool.write_lock:
+            cursor.execute("""
+                INSERT INTO settings (setting_key, setting_value, updated_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(setting_key) DO UPDATE SET
+                    setting_value = excluded.setting_value,
+                    updated_at = excluded.updated_at
+            """, (key, raw))
+            conn.commit()
+            _settings.put(key, raw)
+        conn.close()
+        logger.info(f"Настройка {key} = {raw}")
         return True
     except Exception as e:
-        logger.error(f"Ошибка при обновлении количества ящиков: {e}")
+        logger.error(f"Ошибка при установке настройки {key}: {e}")
         conn.close()
         return False
 
 
 def set_limit_per_person(limit: int) -> bool:
     """Устанавливает лимит ящиков на одного человека"""
-    conn = sqlite3.connect(DB_NAME)
+    return set_setting('limit_per_person', limit)
+
+
+def get_limit_per_person() -> int:
+    """Получает лимит ящиков на одного человека (из памяти, без запроса к БД)"""
+    return get_setting('limit_per_person')
+
+
+def get_conversation_state(user_id: int) -> Optional[dict]:
+    """
+    Текущее состояние диалога пользователя (handlers/conversation.py):
+    {'state': имя, 'data': словарь данных} или None, если его нет или оно истекло
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT state, data FROM conversation_state
+            WHERE user_id = ? AND expires_at > CURRENT_TIMESTAMP
+        """, (user_id,))
+        row = cursor.fetchone()
+        conn.close()
+        if row is None:
+            return None
+        return {'state': row[0], 'data': json.loads(row[1])}
+    except Exception as e:
+        logger.error(f"Ошибка при чтении состояния диалога пользователя {user_id}: {e}")
+        conn.close()
+        return None
+
+
+def set_conversation_state(user_id: int, state: str, data: Optional[dict] = None,
+                           ttl: Optional[int] = None) -> bool:
+    """
+    Записывает состояние диалога пользователя (заменяет прежнее).
+    Состояние истекает через ttl секунд (по умолчанию config.CONVERSATION_STATE_TTL);
+    каждая запись продлевает срок.
+    """
+    if ttl is None:
+        ttl = config.CONVERSATION_STATE_TTL
+    conn = get_connection()
     cursor = conn.cursor()
     try:
         cursor.execute("""
-            INSERT OR REPLACE INTO settings (setting_key, setting_value, updated_at)
-            VALUES ('limit_per_person', ?, CURRENT_TIMESTAMP)
-        """, (str(limit),))
+            INSERT INTO conversation_state (user_id, state, data, updated_at, expires_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP, datetime('now', ?))
+            ON CONFLICT(user_id) DO UPDATE SET
+                state = excluded.state,
+                data = excluded.data,
+                updated_at = excluded.updated_at,
+                expires_at = excluded.expires_at
+        """, (user_id, state, json.dumps(data or {}, ensure_ascii=False), f"{int(ttl):+d} seconds"))
         conn.commit()
         conn.close()
-        logger.info(f"Установлен лимит на человека: {limit} ящиков")
         return True
     except Exception as e:
-        logger.error(f"Ошибка при установке лимита: {e}")
+        logger.error(f"Ошибка при записи состояния диалога пользователя {user_id}: {e}")
         conn.close()
         return False
 
 
-def get_limit_per_person() -> int:
-    """Получает лимит ящиков на одного человека"""
-    conn = sqlite3.connect(DB_NAME)
+def clear_conversation_state(user_id: int) -> bool:
+    """Завершает диалог пользователя (удаляет его состояние)"""
+    conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT setting_value FROM settings WHERE setting_key = 'limit_per_person'")
-    row = cursor.fetchone()
-    conn.close()
-    if row:
-        try:
-            return int(row[0])
-        except (ValueError, TypeError):
-            return 0
-    return 0
+    try:
+        cursor.execute("DELETE FROM conversation_state WHERE user_id = ?", (user_id,))
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при удалении состояния диалога пользователя {user_id}: {e}")
+        conn.close()
+        return False
+
+
+def purge_expired_conversation_states() -> int:
+    """Удаляет истекшие состояния диалогов; возвращает число удаленных"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM conversation_state WHERE expires_at <= CURRENT_TIMESTAMP")
+        purged = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return purged
+    except Exception as e:
+        logger.error(f"Ошибка при очистке состояний диалогов: {e}")
+        conn.close()
+        return 0
 
 
 def set_session_trading_status(session_id: int, is_active: bool) -> bool:
     """Устанавливает статус торговли для конкретной сессии"""
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     try:
+        # Сессию в архиве открыть нельзя: ее товары и заказы в archive.db
         cursor.execute("""
-            UPDATE sessions SET is_active = ? WHERE session_id = ?
-        """, (1 if is_active else 0, session_id))
+            UPDATE sessions SET is_active = ?
+            WHERE session_id = ? AND (? = 0 OR archived_at IS NULL)
+        """, (1 if is_active else 0, session_id, 1 if is_active else 0))
         conn.commit()
         success = cursor.rowcount > 0
         conn.close()
         if success:
+            _bump_catalog_version()
             status_text = "открыта" if is_active else "закрыта"
             logger.info(f"Торговля для сессии {session_id} {status_text}")
         return success
@@ -607,27 +835,19 @@ def set_session_trading_status(session_id: int, is_active: bool) -> bool:
 
 def is_session_trading_active(session_id: int) -> bool:
     """Проверяет, активна ли торговля для конкретной сессии"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT is_active FROM sessions WHERE session_id = ?", (session_id,))
-    row = cursor.fetchone()
-    conn.close()
-    if row:
-        return bool(row[0])
-    return False
+    session = get_session(session_id)
+    return bool(session and session['is_active'])
 
 
 def get_user_session_boxes_purchased(user_id: int, session_id: int) -> int:
     """Получает количество купленных ящиков пользователем в сессии (только выданные заказы)"""
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
-    # Считаем только заказы со статусом 'completed'
-    cursor.execute("""
-        SELECT COALESCE(SUM(oi.quantity), 0)
-        FROM orders o
-        JOIN order_items oi ON o.order_id = oi.order_id
-        WHERE o.user_id = ? AND o.session_id = ? AND o.status = 'completed'
-    """, (user_id, session_id))
+    # Счетчик ведется в rollups.apply_change при каждом изменении заказа
+    cursor.execute(
+        "SELECT boxes_purchased FROM user_session_limits WHERE user_id = ? AND session_id = ?",
+        (user_id, session_id)
+    )
     row = cursor.fetchone()
     conn.close()
     return row[0] if row else 0
@@ -658,111 +878,260 @@ def get_user_available_boxes(user_id: int, session_id: int, product_id: int = No
     return max(0, available_by_limit)
 
 
-def generate_order_number() -> str:
-    """Генерирует уникальный номер заказа"""
-    import random
-    import string
-    while True:
-        # Генерируем 6-значный номер заказа
-        order_num = ''.join(random.choices(string.digits, k=6))
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("SELECT order_id FROM orders WHERE order_number = ?", (order_num,))
-        if not cursor.fetchone():
-            conn.close()
-            return order_num
-        conn.close()
+# Коды заказов - 6-значные числа. Пул из 1 000 000 кодов "перемешан" без хранения:
+# индекс из счетчика order_code_pool переводится в код сетью Фейстеля с секретом
+# из той же таблицы, поэтому коды не повторяются и не идут подряд.
+ORDER_CODE_DIGITS = 6
+_ORDER_CODE_HALF = 10 ** (ORDER_CODE_DIGITS // 2)
+_ORDER_CODE_SPACE = _ORDER_CODE_HALF * _ORDER_CODE_HALF
+_ORDER_CODE_ROUNDS = 4
 
 
-def generate_session_order_number(session_id: int) -> int:
-    """Генерирует номер заказа по сессии (следующий по порядку)"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    # Находим максимальный номер заказа в этой сессии
+def order_code_from_index(index: int, secret: str) -> str:
+    """Переводит порядковый индекс пула в код заказа (взаимно однозначно)"""
+    left, right = divmod(index % _ORDER_CODE_SPACE, _ORDER_CODE_HALF)
+    for round_no in range(_ORDER_CODE_ROUNDS):
+        digest = hashlib.blake2b(f"{secret}:{round_no}:{right}".encode(), digest_size=8).digest()
+        left, right = right, (left + int.from_bytes(digest, 'big')) % _ORDER_CODE_HALF
+    return str(left * _ORDER_CODE_HALF + right).zfill(ORDER_CODE_DIGITS)
+
+
+def allocate_order_numbers(cursor, session_id: int) -> tuple:
+    """
+    Выдает код заказа и порядковый номер в сессии.
+
+    Вызывается внутри транзакции создания заказа: оба счетчика увеличиваются
+    одним UPDATE ... RETURNING каждый, поэтому одновременные покупатели не
+    получают одинаковые номера, а время выдачи не зависит от числа заказов.
+    Возвращает (order_number, session_order_number).
+    """
     cursor.execute("""
-        SELECT MAX(session_order_number) 
-        FROM orders 
-        WHERE session_id = ? AND session_order_number IS NOT NULL
+        INSERT INTO session_order_counters (session_id, last_number)
+        VALUES (?, 1)
+        ON CONFLICT(session_id) DO UPDATE SET last_number = last_number + 1
+        RETURNING last_number
     """, (session_id,))
-    result = cursor.fetchone()
-    max_number = result[0] if result[0] else 0
-    conn.close()
-    return max_number + 1
-
+    session_order_number = cursor.fetchone()[0]
 
-def create_order(user_id: int, session_id: int, phone_number: str, full_name: str, items: list) -> Optional[int]:
-    """Создает заказ"""
-    conn = sqlite3.connect(DB_NAME)
+    while True:
+        cursor.execute("""
+            UPDATE order_code_pool SET next_index = next_index + 1
+            WHERE pool_id = 1
+            RETURNING next_index - 1, secret
+        """)
+        index, secret = cursor.fetchone()
+        if index >= _ORDER_CODE_SPACE:
+            raise RuntimeError("Пул кодов заказов исчерпан")
+        order_number = order_code_from_index(index, secret)
+        # Код мог быть выдан раньше случайным генератором - берем следующий
+        cursor.execute("SELECT 1 FROM all_orders WHERE order_number = ?", (order_number,))
+        if not cursor.fetchone():
+            return order_number, session_order_number
+
+
+def place_order(user_id: int, session_id: int, phone_number: str, full_name: str, items: list) -> dict:
+    """
+    Создает заказ с резервированием остатков в одной короткой транзакции записи.
+
+    В транзакции BEGIN IMMEDIATE проверяются открытая торговля и лимит на человека,
+    остаток каждого товара уменьшается условным UPDATE (только если ящиков хватает),
+    выдаются номера заказа и вставляются заказ и его позиции. При любом отказе
+    транзакция откатывается целиком.
+
+    items - [{'product_id', 'quantity'}]. Цена позиции - цена товара в той же
+    транзакции (поле 'price' в items не используется), поэтому цена, показанная
+    покупателю раньше, не попадает в заказ, если товар успели переоценить.
+
+    Возвращает словарь:
+        success - создан ли заказ
+        order_id - ID заказа (или None)
+        error - None или причина отказа: 'invalid_quantity', 'trading_closed',
+                'limit_exceeded', 'product_not_found', 'out_of_stock', 'error'
+        product_id - товар, на котором произошел отказ (для остатков)
+        available - сколько ящиков доступно (для остатков и лимита)
+    """
+    result = {'success': False, 'order_id': None, 'error': None, 'product_id': None, 'available': None}
+    for item in items:
+        if int(item['quantity']) <= 0:
+            result.update(error='invalid_quantity', product_id=item['product_id'])
+            return result
+    requested = sum(int(item['quantity']) for item in items)
+
+    pool = get_pool()
+    conn = get_connection()
     cursor = conn.cursor()
     try:
-        order_number = generate_order_number()
-        session_order_number = generate_session_order_number(session_id)
-        total_amount = sum(item['quantity'] * item['price'] for item in items)
-        
-        cursor.execute("""
-            INSERT INTO orders (order_number, session_order_number, user_id, session_id, phone_number, full_name, total_amount)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (order_number, session_order_number, user_id, session_id, phone_number, full_name, total_amount))
-        
-        order_id = cursor.lastrowid
-        
-        # Добавляем товары в заказ и уменьшаем количество доступных ящиков
-        for item in items:
+        with pool.write_lock:
+            cursor.execute("BEGIN IMMEDIATE")
+
+            cursor.execute("SELECT is_active FROM sessions WHERE session_id = ?", (session_id,))
+            row = cursor.fetchone()
+            if not row or not row[0]:
+                conn.rollback()
+                result['error'] = 'trading_closed'
+                return result
+
+            # Настройки меняются под тем же замком записи, значение в памяти актуально
+            limit = get_limit_per_person()
+            if limit > 0:
+                # Лимит считается по выданным заказам - так же, как get_user_available_boxes
+                cursor.execute(
+                    "SELECT boxes_purchased FROM user_session_limits WHERE user_id = ? AND session_id = ?",
+                    (user_id, session_id)
+                )
+                row = cursor.fetchone()
+                purchased = row[0] if row else 0
+                if purchased + requested > limit:
+                    conn.rollback()
+                    result.update(error='limit_exceeded', available=max(0, limit - purchased))
+                    return result
+
+            stock = {}
+            prices = {}
+            for item in items:
+                cursor.execute("""
+                    UPDATE products
+                    SET boxes_count = boxes_count - ?
+                    WHERE product_id = ? AND session_id = ? AND boxes_count >= ?
+                    RETURNING boxes_count, price
+                """, (item['quantity'], item['product_id'], session_id, item['quantity']))
+                row = cursor.fetchone()
+                if row is None:
+                    cursor.execute(
+                        "SELECT boxes_count FROM products WHERE product_id = ? AND session_id = ?",
+                        (item['product_id'], session_id)
+                    )
+                    row = cursor.fetchone()
+                    conn.rollback()
+                    if row is None:
+                        result.update(error='product_not_found', product_id=item['product_id'])
+                    else:
+                        result.update(error='out_of_stock', product_id=item['product_id'], available=max(0, row[0]))
+                    return result
+                stock[item['product_id']] = row[0]
+                prices[item['product_id']] = row[1]
+
+            order_number, session_order_number = allocate_order_numbers(cursor, session_id)
+            total_amount = sum(item['quantity'] * prices[item['product_id']] for item in items)
             cursor.execute("""
+                INSERT INTO orders (order_number, session_order_number, user_id, session_id, phone_number, full_name, total_amount)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (order_number, session_order_number, user_id, session_id, phone_number, full_name, total_amount))
+            order_id = cursor.lastrowid
+            cursor.executemany("""
                 INSERT INTO order_items (order_id, product_id, quantity, price)
                 VALUES (?, ?, ?, ?)
-            """, (order_id, item['product_id'], item['quantity'], item['price']))
-            
-            # Уменьшаем количество доступных ящиков товара
-            cursor.execute("""
-                UPDATE products 
-                SET boxes_count = boxes_count - ? 
-                WHERE product_id = ?
-            """, (item['quantity'], item['product_id']))
-        
-        # НЕ обновляем лимит при создании заказа - лимит будет обновлен только при выдаче заказа (статус completed)
-        
-        conn.commit()
-        conn.close()
+            """, [(order_id, item['product_id'], item['quantity'], prices[item['product_id']]) for item in items])
+            rollups.apply_change(cursor, None, rollups.order_snapshot(cursor, order_id))
+
+            # НЕ обновляем лимит при создании заказа - лимит будет обновлен только при выдаче заказа (статус completed)
+            conn.commit()
+            _set_stock(stock)
+
         logger.info(f"Создан заказ {order_number} (№{session_order_number} по сессии) пользователем {user_id}")
-        return order_id
+        result.update(success=True, order_id=order_id)
+        return result
     except Exception as e:
         logger.error(f"Ошибка при создании заказа: {e}")
+        if conn.in_transaction:
+            conn.rollback()
+        result['error'] = 'error'
+        return result
+    finally:
         conn.close()
-        return None
 
 
-def get_order(order_id: int) -> Optional[dict]:
-    """Получает информацию о заказе"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT order_id, order_number, session_order_number, user_id, session_id, phone_number, full_name, 
-               total_amount, status, created_at
-        FROM orders WHERE order_id = ?
-    """, (order_id,))
-    row = cursor.fetchone()
+def create_order(user_id: int, session_id: int, phone_number: str, full_name: str, items: list) -> Optional[int]:
+    """Создает заказ (см. place_order); возвращает ID заказа или None при отказе"""
+    return place_order(user_id, session_id, phone_number, full_name, items)['order_id']
+
+
+def place_order_with_receipt(user_id: int, session_id: int, phone_number: str, full_name: str,
+                             items: list) -> dict:
+    """
+    Создает заказ (place_order) и в той же транзакции читает данные для
+    сообщения о нем: заказ, товары, сессию и купленное по лимиту.
+
+    Возвращает {'placed': результат place_order}, при успехе еще order,
+    items, session, limit (лимит на человека) и purchased (куплено ящиков в сессии).
+    """
+    with unit_of_work():
+        placed = place_order(user_id, session_id, phone_number, full_name, items)
+        receipt = {'placed': placed}
+        if placed['order_id']:
+            receipt.update(
+                order=get_order(placed['order_id']),
+                items=get_order_items(placed['order_id']),
+                session=get_session(session_id),
+                limit=get_limit_per_person(),
+                purchased=get_user_session_boxes_purchased(user_id, session_id),
+            )
+        return receipt
+
+
+def get_order_error_ru(result: dict) -> str:
+    """Текст причины отказа в создании заказа (результат place_order)"""
+    error = result.get('error')
+    available = result.get('available')
+    if error == 'out_of_stock':
+        product = get_product(result['product_id'])
+        name = product['product_name'] if product else "товара"
+        if available:
+            return f"❌ Недостаточно ящиков «{name}»: осталось {available}."
+        return f"❌ Товар «{name}» закончился."
+    if error == 'limit_exceeded':
+        return f"❌ Превышен лимит на человека. Доступно для покупки: {available} ящиков."
+    if error == 'trading_closed':
+        return "❌ Торговля для этой сессии остановлена."
+    if error == 'product_not_found':
+        return "❌ Товар не найден!"
+    if error == 'invalid_quantity':
+        return "❌ Неверное количество ящиков."
+    return "❌ Ошибка при создании заказа."
+
+
+def _cached_order(key, load):
+    """Значение из кэша заказов; при промахе вызывает load() и запоминает результат (кроме None)"""
+    value = _order_cache.lookup(key)
+    if value is cache.MISSING:
+        generation = _order_cache.generation
+        value = load()
+        if value is not None:
+            _order_cache.set(key, value, generation)
+    return value
+
+
+def _forget_orders(order_ids):
+    """Сбрасывает кэш заказов после изменения их статуса или состава"""
+    for order_id in order_ids:
+        _order_cache.invalidate(order_id)
+        _order_cache.invalidate(('items', order_id))
+
+
+def _load_order(order_id: int) -> Optional[records.Order]:
+    conn = get_connection()
+    cursor = _record_cursor(conn, records.Order)
+    cursor.execute(f"SELECT {_ORDER_COLUMNS} FROM orders WHERE order_id = ?", (order_id,))
+    order = cursor.fetchone()
     conn.close()
-    if row:
-        return {
-            "order_id": row[0],
-            "order_number": row[1],
-            "session_order_number": row[2],
-            "user_id": row[3],
-            "session_id": row[4],
-            "phone_number": row[5],
-            "full_name": row[6],
-            "total_amount": row[7],
-            "status": row[8],
-            "created_at": row[9]
-        }
-    return None
+    return order
+
+
+def get_order(order_id: int) -> Optional[records.Order]:
+    """Получает информацию о заказе (недавно открытые заказы - из кэша)"""
+    order = _cached_order(order_id, lambda: _load_order(order_id))
+    return order.copy() if order else None
 
 
 def get_order_items(order_id: int) -> list:
-    """Получает товары заказа"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    """Получает товары заказа (недавно открытые заказы - из кэша)"""
+    items = _cached_order(('items', order_id), lambda: _load_order_items(order_id))
+    return [item.copy() for item in items]
+
+
+def _load_order_items(order_id: int) -> list:
+    conn = get_connection()
+    cursor = _record_cursor(conn, records.OrderItem)
     cursor.execute("""
         SELECT oi.item_id, oi.product_id, oi.quantity, oi.price, p.product_name
         FROM order_items oi
@@ -771,96 +1140,129 @@ def get_order_items(order_id: int) -> list:
     """, (order_id,))
     items = cursor.fetchall()
     conn.close()
-    return [
-        {
-            "item_id": item[0],
-            "product_id": item[1],
-            "quantity": item[2],
-            "price": item[3],
-            "product_name": item[4]
-        }
-        for item in items
-    ]
+    return items
+
+
+def _group_items(items: list) -> dict:
+    grouped = {}
+    for item in items:
+        grouped.setdefault(item.order_id, []).append(item)
+    return grouped
+
+
+def get_order_items_bulk(order_ids: list) -> dict:
+    """
+    Товары нескольких заказов одним запросом: {order_id: [позиции]}.
+
+    Позиции - те же записи, что у get_order_items (плюс order_id). Заказов
+    без товаров в словаре нет. Отчеты вызывают функцию на каждую пачку
+    заказов вместо запроса на каждый заказ. Товары заказов из архива
+    (archive.py) тоже находятся.
+    """
+    if not order_ids:
+        return {}
+    conn = get_connection()
+    cursor = _record_cursor(conn, records.OrderItem)
+    placeholders = ','.join(['?'] * len(order_ids))
+    # Заказы из отчетов за период могут быть и в архиве (archive.py)
+    cursor.execute(f"""
+        SELECT oi.item_id, oi.order_id, oi.product_id, oi.quantity, oi.price, p.product_name
+        FROM main.order_items oi
+        JOIN main.products p ON oi.product_id = p.product_id
+        WHERE oi.order_id IN ({placeholders})
+        UNION ALL
+        SELECT oi.item_id, oi.order_id, oi.product_id, oi.quantity, oi.price, p.product_name
+        FROM archive.order_items oi
+        JOIN archive.products p ON oi.product_id = p.product_id
+        WHERE oi.order_id IN ({placeholders}) AND {archive.visible('oi')}
+        ORDER BY 2, 3
+    """, (*order_ids, *order_ids))
+    items = cursor.fetchall()
+    conn.close()
+    return _group_items(items)
+
 
+def get_session_order_items(session_id: int) -> dict:
+    """Товары всех заказов сессии одним запросом: {order_id: [позиции]}, как у get_order_items_bulk"""
+    conn = get_connection()
+    cursor = _record_cursor(conn, records.OrderItem)
+    cursor.execute("""
+        SELECT oi.item_id, oi.order_id, oi.product_id, oi.quantity, oi.price, p.product_name
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.order_id
+        JOIN products p ON oi.product_id = p.product_id
+        WHERE o.session_id = ?
+        ORDER BY oi.order_id, oi.product_id
+    """, (session_id,))
+    items = cursor.fetchall()
+    conn.close()
+    return _group_items(items)
 
-def get_order_item(item_id: int) -> Optional[dict]:
+
+def get_order_item(item_id: int) -> Optional[records.OrderItem]:
     """Получает информацию о товаре в заказе"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    conn = get_connection()
+    cursor = _record_cursor(conn, records.OrderItem)
     cursor.execute("""
         SELECT oi.item_id, oi.order_id, oi.product_id, oi.quantity, oi.price, p.product_name
         FROM order_items oi
         JOIN products p ON oi.product_id = p.product_id
         WHERE oi.item_id = ?
     """, (item_id,))
-    row = cursor.fetchone()
+    item = cursor.fetchone()
     conn.close()
-    if row:
-        return {
-            "item_id": row[0],
-            "order_id": row[1],
-            "product_id": row[2],
-            "quantity": row[3],
-            "price": row[4],
-            "product_name": row[5]
-        }
-    return None
+    return item
 
 
 def delete_order_item(item_id: int, order_id: int) -> bool:
     """Удаляет товар из заказа"""
-    conn = sqlite3.connect(DB_NAME)
+    pool = get_pool()
+    conn = get_connection()
     cursor = conn.cursor()
     try:
-        # Получаем информацию о товаре перед удалением
-        cursor.execute("SELECT product_id, quantity FROM order_items WHERE item_id = ?", (item_id,))
-        item_data = cursor.fetchone()
-        
-        if not item_data:
-            conn.close()
-            return False
+        with pool.write_lock:
+            cursor.execute("BEGIN IMMEDIATE")
+            before = rollups.order_snapshot(cursor, order_id)
+            # Получаем информацию о товаре перед удалением
+            cursor.execute("SELECT product_id, quantity FROM order_items WHERE item_id = ?", (item_id,))
+            item_data = cursor.fetchone()
         
-        product_id, quantity = item_data
+            if not item_data:
+                conn.close()
+                return False
         
-        # Получаем статус заказа
-        cursor.execute("SELECT status FROM orders WHERE order_id = ?", (order_id,))
-        order_status = cursor.fetchone()
+            product_id, quantity = item_data
         
-        if order_status and order_status[0] == 'completed':
-            # Если заказ выдан, возвращаем лимит
-            cursor.execute("SELECT user_id, session_id FROM orders WHERE order_id = ?", (order_id,))
-            order_info = cursor.fetchone()
-            if order_info:
-                user_id, session_id = order_info
-                cursor.execute("""
-                    UPDATE user_session_limits 
-                    SET boxes_purchased = boxes_purchased - ?
-                    WHERE user_id = ? AND session_id = ?
-                """, (quantity, user_id, session_id))
+            # Лимит покупателя (user_session_limits) пересчитывается в rollups.apply_change
         
-        # Возвращаем количество ящиков товара
-        cursor.execute("""
-            UPDATE products 
-            SET boxes_count = boxes_count + ? 
-            WHERE product_id = ?
-        """, (quantity, product_id))
+            # Возвращаем количество ящиков товара
+            cursor.execute("""
+                UPDATE products 
+                SET boxes_count = boxes_count + ? 
+                WHERE product_id = ?
+                RETURNING product_id, boxes_count
+            """, (quantity, product_id))
+            stock = dict(cursor.fetchall())
         
-        # Удаляем товар из заказа
-        cursor.execute("DELETE FROM order_items WHERE item_id = ?", (item_id,))
+            # Удаляем товар из заказа
+            cursor.execute("DELETE FROM order_items WHERE item_id = ?", (item_id,))
         
-        # Пересчитываем общую сумму заказа
-        cursor.execute("""
-            SELECT SUM(oi.quantity * oi.price)
-            FROM order_items oi
-            WHERE oi.order_id = ?
-        """, (order_id,))
-        new_total = cursor.fetchone()[0] or 0
-        cursor.execute("UPDATE orders SET total_amount = ? WHERE order_id = ?", (new_total, order_id))
+            # Пересчитываем общую сумму заказа
+            cursor.execute("""
+                SELECT SUM(oi.quantity * oi.price)
+                FROM order_items oi
+                WHERE oi.order_id = ?
+            """, (order_id,))
+            new_total = cursor.fetchone()[0] or 0
+            cursor.execute("UPDATE orders SET total_amount = ? WHERE order_id = ?", (new_total, order_id))
         
-        conn.commit()
-        conn.close()
-        logger.info(f"Товар {item_id} удален из заказа {order_id}")
-        return True
+            rollups.apply_change(cursor, before, rollups.order_snapshot(cursor, order_id))
+            conn.commit()
+            _set_stock(stock)
+            _forget_orders([order_id])
+            conn.close()
+            logger.info(f"Товар {item_id} удален из заказа {order_id}")
+            return True
     except Exception as e:
         logger.error(f"Ошибка при удалении товара из заказа: {e}")
         conn.rollback()
@@ -870,56 +1272,57 @@ def delete_order_item(item_id: int, order_id: int) -> bool:
 
 def update_order_item_quantity(item_id: int, new_quantity: int) -> bool:
     """Обновляет количество товара в заказе"""
-    conn = sqlite3.connect(DB_NAME)
+    pool = get_pool()
+    conn = get_connection()
     cursor = conn.cursor()
     try:
-        # Получаем текущее количество и информацию о заказе
-        cursor.execute("""
-            SELECT oi.quantity, oi.product_id, o.order_id, o.status, o.user_id, o.session_id
-            FROM order_items oi
-            JOIN orders o ON oi.order_id = o.order_id
-            WHERE oi.item_id = ?
-        """, (item_id,))
-        item_data = cursor.fetchone()
-        
-        if not item_data:
-            conn.close()
-            return False
+        with pool.write_lock:
+            cursor.execute("BEGIN IMMEDIATE")
+            # Получаем текущее количество и информацию о заказе
+            cursor.execute("""
+                SELECT oi.quantity, oi.product_id, o.order_id, o.status, o.user_id, o.session_id
+                FROM order_items oi
+                JOIN orders o ON oi.order_id = o.order_id
+                WHERE oi.item_id = ?
+            """, (item_id,))
+            item_data = cursor.fetchone()
         
-        old_quantity, product_id, order_id, order_status, user_id, session_id = item_data
-        quantity_diff = new_quantity - old_quantity
+            if not item_data:
+                conn.close()
+                return False
         
-        # Обновляем количество
-        cursor.execute("UPDATE order_items SET quantity = ? WHERE item_id = ?", (new_quantity, item_id))
+            old_quantity, product_id, order_id, order_status, user_id, session_id = item_data
+            before = rollups.order_snapshot(cursor, order_id)
+            quantity_diff = new_quantity - old_quantity
         
-        # Обновляем количество ящиков товара
-        cursor.execute("""
-            UPDATE products 
-            SET boxes_count = boxes_count - ? 
-            WHERE product_id = ?
-        """, (quantity_diff, product_id))
+            # Обновляем количество
+            cursor.execute("UPDATE order_items SET quantity = ? WHERE item_id = ?", (new_quantity, item_id))
         
-        # Если заказ выдан, обновляем лимит
-        if order_status == 'completed' and quantity_diff != 0:
+            # Обновляем количество ящиков товара
             cursor.execute("""
-                UPDATE user_session_limits 
-                SET boxes_purchased = boxes_purchased + ?
-                WHERE user_id = ? AND session_id = ?
-            """, (quantity_diff, user_id, session_id))
+                UPDATE products 
+                SET boxes_count = boxes_count - ? 
+                WHERE product_id = ?
+                RETURNING product_id, boxes_count
+            """, (quantity_diff, product_id))
+            stock = dict(cursor.fetchall())
         
-        # Пересчитываем общую сумму заказа
-        cursor.execute("""
-            SELECT SUM(oi.quantity * oi.price)
-            FROM order_items oi
-            WHERE oi.order_id = ?
-        """, (order_id,))
-        new_total = cursor.fetchone()[0] or 0
-        cursor.execute("UPDATE orders SET total_amount = ? WHERE order_id = ?", (new_total, order_id))
+            # Пересчитываем общую сумму заказа
+            cursor.execute("""
+                SELECT SUM(oi.quantity * oi.price)
+                FROM order_items oi
+                WHERE oi.order_id = ?
+            """, (order_id,))
+            new_total = cursor.fetchone()[0] or 0
+            cursor.execute("UPDATE orders SET total_amount = ? WHERE order_id = ?", (new_total, order_id))
         
-        conn.commit()
-        conn.close()
-        logger.info(f"Количество товара {item_id} обновлено на {new_quantity}")
-        return True
+            rollups.apply_change(cursor, before, rollups.order_snapshot(cursor, order_id))
+            conn.commit()
+            _set_stock(stock)
+            _forget_orders([order_id])
+            conn.close()
+            logger.info(f"Количество товара {item_id} обновлено на {new_quantity}")
+            return True
     except Exception as e:
         logger.error(f"Ошибка при обновлении количества товара: {e}")
         conn.rollback()
@@ -929,64 +1332,58 @@ def update_order_item_quantity(item_id: int, new_quantity: int) -> bool:
 
 def add_item_to_order(order_id: int, product_id: int, quantity: int) -> bool:
     """Добавляет товар в заказ"""
-    conn = sqlite3.connect(DB_NAME)
+    pool = get_pool()
+    conn = get_connection()
     cursor = conn.cursor()
     try:
-        # Получаем цену товара
-        cursor.execute("SELECT price FROM products WHERE product_id = ?", (product_id,))
-        product_data = cursor.fetchone()
+        with pool.write_lock:
+            cursor.execute("BEGIN IMMEDIATE")
+            before = rollups.order_snapshot(cursor, order_id)
+            # Получаем цену товара
+            cursor.execute("SELECT price FROM products WHERE product_id = ?", (product_id,))
+            product_data = cursor.fetchone()
         
-        if not product_data:
-            conn.close()
-            return False
+            if not product_data:
+                conn.close()
+                return False
         
-        price = product_data[0]
+            price = product_data[0]
         
-        # Получаем информацию о заказе
-        cursor.execute("SELECT status, user_id, session_id FROM orders WHERE order_id = ?", (order_id,))
-        order_data = cursor.fetchone()
+            if before is None:
+                conn.close()
+                return False
         
-        if not order_data:
-            conn.close()
-            return False
-        
-        order_status, user_id, session_id = order_data
-        
-        # Добавляем товар в заказ
-        cursor.execute("""
-            INSERT INTO order_items (order_id, product_id, quantity, price)
-            VALUES (?, ?, ?, ?)
-        """, (order_id, product_id, quantity, price))
-        
-        # Уменьшаем количество ящиков товара
-        cursor.execute("""
-            UPDATE products 
-            SET boxes_count = boxes_count - ? 
-            WHERE product_id = ?
-        """, (quantity, product_id))
+            # Добавляем товар в заказ
+            cursor.execute("""
+                INSERT INTO order_items (order_id, product_id, quantity, price)
+                VALUES (?, ?, ?, ?)
+            """, (order_id, product_id, quantity, price))
         
-        # Если заказ выдан, обновляем лимит
-        if order_status == 'completed':
+            # Уменьшаем количество ящиков товара
             cursor.execute("""
-                INSERT INTO user_session_limits (user_id, session_id, boxes_purchased)
-                VALUES (?, ?, ?)
-                ON CONFLICT(user_id, session_id) 
-                DO UPDATE SET boxes_purchased = boxes_purchased + ?
-            """, (user_id, session_id, quantity, quantity))
+                UPDATE products 
+                SET boxes_count = boxes_count - ? 
+                WHERE product_id = ?
+                RETURNING product_id, boxes_count
+            """, (quantity, product_id))
+            stock = dict(cursor.fetchall())
         
-        # Пересчитываем общую сумму заказа
-        cursor.execute("""
-            SELECT SUM(oi.quantity * oi.price)
-            FROM order_items oi
-            WHERE oi.order_id = ?
-        """, (order_id,))
-        new_total = cursor.fetchone()[0] or 0
-        cursor.execute("UPDATE orders SET total_amount = ? WHERE order_id = ?", (new_total, order_id))
+            # Пересчитываем общую сумму заказа
+            cursor.execute("""
+                SELECT SUM(oi.quantity * oi.price)
+                FROM order_items oi
+                WHERE oi.order_id = ?
+            """, (order_id,))
+            new_total = cursor.fetchone()[0] or 0
+            cursor.execute("UPDATE orders SET total_amount = ? WHERE order_id = ?", (new_total, order_id))
         
-        conn.commit()
-        conn.close()
-        logger.info(f"Товар {product_id} добавлен в заказ {order_id}")
-        return True
+            rollups.apply_change(cursor, before, rollups.order_snapshot(cursor, order_id))
+            conn.commit()
+            _set_stock(stock)
+            _forget_orders([order_id])
+            conn.close()
+            logger.info(f"Товар {product_id} добавлен в заказ {order_id}")
+            return True
     except Exception as e:
         logger.error(f"Ошибка при добавлении товара в заказ: {e}")
         conn.rollback()
@@ -1005,43 +1402,59 @@ def get_order_status_ru(status: str) -> str:
     return status_map.get(status, status)
 
 
-def find_order_by_number(order_number: str) -> Optional[dict]:
-    """Находит заказ по номеру (общему или по сессии)"""
-    conn = sqlite3.connect(DB_NAME)
+def _find_order_id(order_number: str, session_id: Optional[int]) -> Optional[int]:
+    conn = get_connection()
     cursor = conn.cursor()
-    
-    # Пытаемся найти по общему номеру
-    cursor.execute("""
-        SELECT order_id, order_number, session_order_number, user_id, session_id, phone_number, full_name, 
-               total_amount, status, created_at
-        FROM orders WHERE order_number = ?
-    """, (order_number,))
-    row = cursor.fetchone()
-    
-    # Если не найдено и номер - число, ищем по номеру сессии
-    if not row and order_number.isdigit():
-        cursor.execute("""
-            SELECT order_id, order_number, session_order_number, user_id, session_id, phone_number, full_name, 
-                   total_amount, status, created_at
-            FROM orders WHERE session_order_number = ?
-        """, (int(order_number),))
+    row = None
+    if session_id is None:
+        cursor.execute("SELECT order_id FROM orders WHERE order_number = ?", (order_number,))
         row = cursor.fetchone()
-    
+    else:
+        if order_number.isdigit():
+            cursor.execute(
+                "SELECT order_id FROM orders WHERE session_id = ? AND session_order_number = ?",
+                (session_id, int(order_number))
+            )
+            row = cursor.fetchone()
+        if not row:
+            cursor.execute(
+                "SELECT order_id FROM orders WHERE order_number = ? AND session_id = ?",
+                (order_number, session_id)
+            )
+            row = cursor.fetchone()
     conn.close()
-    if row:
-        return {
-            "order_id": row[0],
-            "order_number": row[1],
-            "session_order_number": row[2],
-            "user_id": row[3],
-            "session_id": row[4],
-            "phone_number": row[5],
-            "full_name": row[6],
-            "total_amount": row[7],
-            "status": row[8],
-            "created_at": row[9]
-        }
-    return None
+    return row[0] if row else None
+
+
+def _find_order_id_by_session_number(session_order_number: int) -> Optional[int]:
+    # Номера в сессии у разных сессий повторяются: без сессии номер
+    # принимается, только если он есть ровно у одного заказа
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT order_id FROM orders WHERE session_order_number = ? LIMIT 2", (session_order_number,)
+    )
+    rows = cursor.fetchall()
+    conn.close()
+    return rows[0][0] if len(rows) == 1 else None
+
+
+def find_order_by_number(order_number: str, session_id: Optional[int] = None) -> Optional[records.Order]:
+    """
+    Находит заказ по номеру: общему (6 цифр, QR-код) или номеру в сессии.
+
+    С session_id ищет только в этой сессии: сначала по номеру в сессии, затем
+    по общему номеру. Без session_id - по общему номеру, а номер в сессии
+    подходит, только если он не повторяется в других сессиях.
+
+    Номера найденных заказов и сами заказы запоминаются в кэше недавно
+    открытых заказов: повторный скан того же QR-кода не обращается к БД.
+    """
+    order_id = _cached_order(('number', order_number, session_id),
+                             lambda: _find_order_id(order_number, session_id))
+    if order_id is None and session_id is None and order_number.isdigit():
+        order_id = _find_order_id_by_session_number(int(order_number))
+    return get_order(order_id) if order_id is not None else None
 
 
 def find_orders_by_session_numbers(session_id: int, session_order_numbers: list) -> list:
@@ -1049,150 +1462,144 @@ def find_orders_by_session_numbers(session_id: int, session_order_numbers: list)
     if not session_order_numbers:
         return []
     
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    conn = get_connection()
+    cursor = _record_cursor(conn, records.Order)
     placeholders = ','.join(['?'] * len(session_order_numbers))
     cursor.execute(f"""
-        SELECT order_id, order_number, session_order_number, user_id, session_id, phone_number, full_name, 
-               total_amount, status, created_at
+        SELECT {_ORDER_COLUMNS}
         FROM orders 
         WHERE session_id = ? AND session_order_number IN ({placeholders})
     """, (session_id, *session_order_numbers))
     
-    rows = cursor.fetchall()
+    orders = cursor.fetchall()
     conn.close()
+    return orders
+
+
+def bulk_update_order_status(order_ids: list, status: str, from_statuses: Optional[tuple] = None) -> Optional[dict]:
+    """
+    Массово меняет статус заказов несколькими запросами на всю пачку.
+
+    Параметры:
+        order_ids - ID заказов (повторы игнорируются)
+        status - новый статус (один из rollups.STATUS_COLUMNS)
+        from_statuses - если указан, меняются только заказы в этих статусах
+
+    Возвращает словарь:
+        outcomes - {order_id: 'updated' | 'unchanged' | 'rejected' | 'not_found'}
+            unchanged - заказ уже в статусе status, rejected - не подходит под from_statuses
+        updated - данные измененных заказов для уведомлений: order_id, order_number,
+            session_order_number, user_id, session_id, previous_status
+    None - при ошибке (ни один заказ не изменен).
+    """
+    if status not in rollups.STATUS_COLUMNS:
+        logger.error(f"Неизвестный статус заказа: {status}")
+        return None
+    order_ids = list(dict.fromkeys(order_ids))
+    result = {'outcomes': {}, 'updated': []}
+    if not order_ids:
+        return result
     
-    return [
-        {
-            "order_id": row[0],
-            "order_number": row[1],
-            "session_order_number": row[2],
-            "user_id": row[3],
-            "session_id": row[4],
-            "phone_number": row[5],
-            "full_name": row[6],
-            "total_amount": row[7],
-            "status": row[8],
-            "created_at": row[9]
-        }
-        for row in rows
-    ]
-
-
-def bulk_complete_orders(order_ids: list) -> dict:
-    """Массово выдает заказы (меняет статус на completed)"""
-    conn = sqlite3.connect(DB_NAME)
+    pool = get_pool()
+    conn = get_connection()
     cursor = conn.cursor()
-    
-    result = {
-        'success': [],
-        'failed': [],
-        'already_completed': []
-    }
-    
     try:
-        for order_id in order_ids:
-            # Получаем текущий статус и информацию о заказе
-            cursor.execute("SELECT status, user_id, session_id FROM orders WHERE order_id = ?", (order_id,))
-            order_data = cursor.fetchone()
-            
-            if not order_data:
-                result['failed'].append(order_id)
-                continue
-            
-            old_status, user_id, session_id = order_data
-            
-            if old_status == 'completed':
-                result['already_completed'].append(order_id)
-                continue
-            
-            # Обновляем статус
-            cursor.execute("UPDATE orders SET status = ? WHERE order_id = ?", ('completed', order_id))
-            
-            # Если статус меняется на 'completed', обновляем лимит пользователя
-            if old_status != 'completed':
-                # Получаем количество ящиков в заказе
-                cursor.execute("""
-                    SELECT SUM(quantity) FROM order_items WHERE order_id = ?
-                """, (order_id,))
-                total_boxes = cursor.fetchone()[0] or 0
-                
-                if total_boxes > 0:
-                    # Увеличиваем количество купленных ящиков
-                    cursor.execute("""
-                        INSERT INTO user_session_limits (user_id, session_id, boxes_purchased)
-                        VALUES (?, ?, ?)
-                        ON CONFLICT(user_id, session_id) 
-                        DO UPDATE SET boxes_purchased = boxes_purchased + ?
-                    """, (user_id, session_id, total_boxes, total_boxes))
-            
-            result['success'].append(order_id)
+        with pool.write_lock:
+            cursor.execute("BEGIN IMMEDIATE")
+            before = rollups.order_snapshots(cursor, order_ids)
         
-        conn.commit()
+            to_update = []
+            for order_id in order_ids:
+                snapshot = before.get(order_id)
+                if snapshot is None:
+                    result['outcomes'][order_id] = 'not_found'
+                elif snapshot['status'] == status:
+                    result['outcomes'][order_id] = 'unchanged'
+                elif from_statuses is not None and snapshot['status'] not in from_statuses:
+                    result['outcomes'][order_id] = 'rejected'
+                else:
+                    result['outcomes'][order_id] = 'updated'
+                    to_update.append(order_id)
+        
+            if to_update:
+                placeholders = ','.join(['?'] * len(to_update))
+                cursor.execute(f"""
+                    UPDATE orders SET status = ?
+                    WHERE order_id IN ({placeholders})
+                    RETURNING order_id, order_number, session_order_number, user_id, session_id
+                """, (status, *to_update))
+                result['updated'] = [
+                    {
+                        "order_id": row[0],
+                        "order_number": row[1],
+                        "session_order_number": row[2],
+                        "user_id": row[3],
+                        "session_id": row[4],
+                        "previous_status": before[row[0]]['status']
+                    }
+                    for row in cursor.fetchall()
+                ]
+                # Позиции заказов не меняются - состояние "после" отличается только статусом.
+                # Счетчики (в том числе лимит пользователя) обновляются одной суммарной разницей
+                rollups.apply_deltas(cursor, rollups.collect_deltas(
+                    (before[order_id], dict(before[order_id], status=status)) for order_id in to_update
+                ))
+        
+            conn.commit()
         conn.close()
+        _forget_orders(to_update)
+        logger.info(f"Статус {status}: изменено {len(to_update)} из {len(order_ids)} заказов")
         return result
     except Exception as e:
-        logger.error(f"Ошибка при массовой выдаче заказов: {e}")
+        logger.error(f"Ошибка при массовой смене статуса заказов: {e}")
         conn.rollback()
         conn.close()
-        return result
+        return None
+
+
+def bulk_complete_orders(order_ids: list) -> dict:
+    """
+    Массово выдает заказы (меняет статус на completed).
+
+    Возвращает списки ID success, failed и already_completed, а также
+    updated - данные выданных заказов для уведомлений (см. bulk_update_order_status).
+    """
+    result = bulk_update_order_status(order_ids, 'completed')
+    if result is None:
+        return {'success': [], 'failed': list(order_ids), 'already_completed': [], 'updated': []}
+    
+    outcomes = result['outcomes']
+    return {
+        'success': [order_id for order_id, outcome in outcomes.items() if outcome == 'updated'],
+        'failed': [order_id for order_id, outcome in outcomes.items() if outcome == 'not_found'],
+        'already_completed': [order_id for order_id, outcome in outcomes.items() if outcome == 'unchanged'],
+        'updated': result['updated']
+    }
 
 
 def update_order_status(order_id: int, status: str) -> bool:
     """Обновляет статус заказа и обновляет лимит пользователя при выдаче заказа"""
-    conn = sqlite3.connect(DB_NAME)
+    pool = get_pool()
+    conn = get_connection()
     cursor = conn.cursor()
     try:
-        # Получаем текущий статус заказа
-        cursor.execute("SELECT status, user_id, session_id FROM orders WHERE order_id = ?", (order_id,))
-        order_data = cursor.fetchone()
-        
-        if not order_data:
-            conn.close()
-            return False
+        with pool.write_lock:
+            cursor.execute("BEGIN IMMEDIATE")
+            # Получаем текущее состояние заказа
+            before = rollups.order_snapshot(cursor, order_id)
         
-        old_status = order_data[0]
-        user_id = order_data[1]
-        session_id = order_data[2]
+            if before is None:
+                conn.close()
+                return False
         
-        # Обновляем статус заказа
-        cursor.execute("UPDATE orders SET status = ? WHERE order_id = ?", (status, order_id))
+            # Обновляем статус заказа. Лимит пользователя (user_session_limits) при выдаче
+            # и отмене выдачи пересчитывается в rollups.apply_change
+            cursor.execute("UPDATE orders SET status = ? WHERE order_id = ?", (status, order_id))
         
-        # Если статус меняется на 'completed', уменьшаем лимит пользователя
-        if status == 'completed' and old_status != 'completed':
-            # Получаем количество ящиков в заказе
-            cursor.execute("""
-                SELECT SUM(quantity) FROM order_items WHERE order_id = ?
-            """, (order_id,))
-            total_boxes = cursor.fetchone()[0] or 0
-            
-            if total_boxes > 0:
-                # Увеличиваем количество купленных ящиков
-                cursor.execute("""
-                    INSERT INTO user_session_limits (user_id, session_id, boxes_purchased)
-                    VALUES (?, ?, ?)
-                    ON CONFLICT(user_id, session_id) 
-                    DO UPDATE SET boxes_purchased = boxes_purchased + ?
-                """, (user_id, session_id, total_boxes, total_boxes))
-        
-        # Если статус меняется с 'completed' на другой, возвращаем лимит обратно
-        elif old_status == 'completed' and status != 'completed':
-            # Получаем количество ящиков в заказе
-            cursor.execute("""
-                SELECT SUM(quantity) FROM order_items WHERE order_id = ?
-            """, (order_id,))
-            total_boxes = cursor.fetchone()[0] or 0
-            
-            if total_boxes > 0:
-                # Уменьшаем количество купленных ящиков
-                cursor.execute("""
-                    UPDATE user_session_limits 
-                    SET boxes_purchased = boxes_purchased - ?
-                    WHERE user_id = ? AND session_id = ?
-                """, (total_boxes, user_id, session_id))
-        
-        conn.commit()
+            rollups.apply_change(cursor, before, rollups.order_snapshot(cursor, order_id))
+            conn.commit()
         conn.close()
+        _forget_orders([order_id])
         return True
     except Exception as e:
         logger.error(f"Ошибка при обновлении статуса заказа: {e}")
@@ -1203,58 +1610,51 @@ def update_order_status(order_id: int, status: str) -> bool:
 
 def delete_order(order_id: int) -> bool:
     """Удаляет заказ и все связанные данные"""
-    conn = sqlite3.connect(DB_NAME)
+    pool = get_pool()
+    conn = get_connection()
     cursor = conn.cursor()
     try:
-        # Получаем информацию о заказе перед удалением
-        cursor.execute("SELECT status, user_id, session_id FROM orders WHERE order_id = ?", (order_id,))
-        order_data = cursor.fetchone()
+        with pool.write_lock:
+            cursor.execute("BEGIN IMMEDIATE")
+            # Получаем информацию о заказе перед удалением
+            before = rollups.order_snapshot(cursor, order_id)
         
-        if not order_data:
-            conn.close()
-            return False
+            if before is None:
+                conn.close()
+                return False
         
-        old_status = order_data[0]
-        user_id = order_data[1]
-        session_id = order_data[2]
+            # Лимит пользователя возвращается в rollups.apply_change
         
-        # Если заказ был выдан, возвращаем лимит
-        if old_status == 'completed':
+            # Возвращаем количество ящиков товара
             cursor.execute("""
-                SELECT SUM(quantity) FROM order_items WHERE order_id = ?
+                SELECT product_id, quantity FROM order_items WHERE order_id = ?
             """, (order_id,))
-            total_boxes = cursor.fetchone()[0] or 0
-            
-            if total_boxes > 0:
-                cursor.execute("""
-                    UPDATE user_session_limits 
-                    SET boxes_purchased = boxes_purchased - ?
-                    WHERE user_id = ? AND session_id = ?
-                """, (total_boxes, user_id, session_id))
+            items = cursor.fetchall()
         
-        # Возвращаем количество ящиков товара
-        cursor.execute("""
-            SELECT product_id, quantity FROM order_items WHERE order_id = ?
-        """, (order_id,))
-        items = cursor.fetchall()
-        
-        for product_id, quantity in items:
-            cursor.execute("""
-                UPDATE products 
-                SET boxes_count = boxes_count + ? 
-                WHERE product_id = ?
-            """, (quantity, product_id))
+            stock = {}
+            for product_id, quantity in items:
+                cursor.execute("""
+                    UPDATE products 
+                    SET boxes_count = boxes_count + ? 
+                    WHERE product_id = ?
+                    RETURNING product_id, boxes_count
+                """, (quantity, product_id))
+                stock.update(cursor.fetchall())
         
-        # Удаляем товары заказа
-        cursor.execute("DELETE FROM order_items WHERE order_id = ?", (order_id,))
+            # Удаляем товары заказа
+            cursor.execute("DELETE FROM order_items WHERE order_id = ?", (order_id,))
         
-        # Удаляем сам заказ
-        cursor.execute("DELETE FROM orders WHERE order_id = ?", (order_id,))
+            # Удаляем сам заказ
+            cursor.execute("DELETE FROM orders WHERE order_id = ?", (order_id,))
+            rollups.apply_change(cursor, before, None)
         
-        conn.commit()
-        conn.close()
-        logger.info(f"Заказ {order_id} удален")
-        return True
+            conn.commit()
+            _set_stock(stock)
+            # Номер удаленного заказа может быть выдан снова - сбрасываем и номера
+            _order_cache.invalidate()
+            conn.close()
+            logger.info(f"Заказ {order_id} удален")
+            return True
     except Exception as e:
         logger.error(f"Ошибка при удалении заказа: {e}")
         conn.rollback()
@@ -1262,107 +1662,209 @@ def delete_order(order_id: int) -> bool:
         return False
 
 
-def get_session_orders(session_id: int) -> list:
-    """Получает все заказы для сессии"""
-    conn = sqlite3.connect(DB_NAME)
+class _Descending:
+    """Значение ключа сортировки по убыванию (для слияния страниц heapq.merge)"""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def _key_directions(keys: tuple, descending) -> tuple:
+    """Направление каждого ключа: descending - одно для всех (bool) или по ключам (кортеж)"""
+    if isinstance(descending, bool):
+        return (descending,) * len(keys)
+    if len(descending) != len(keys):
+        raise ValueError("Направлений сортировки должно быть столько же, сколько ключей")
+    return tuple(descending)
+
+
+def _keyset_after(keys: tuple, directions: tuple, after: tuple) -> tuple:
+    """Условие "строка после ключа after" в порядке keys/directions и его параметры"""
+    if len(set(directions)) == 1:
+        placeholders = ', '.join('?' * len(keys))
+        return f"AND ({', '.join(keys)}) {'<' if directions[0] else '>'} ({placeholders})", tuple(after)
+    # Разные направления: (k0 после a0) или (k0 = a0 и k1 после a1) и т.д.;
+    # граница по первому ключу отдельно - по ней выбирается индекс
+    bound = f"{keys[0]} {'<=' if directions[0] else '>='} ?"
+    params = [after[0]]
+    branches = []
+    for i, (key, desc) in enumerate(zip(keys, directions)):
+        equal = [f"{keys[j]} = ?" for j in range(i)]
+        branches.append("(" + " AND ".join(equal + [f"{key} {'<' if desc else '>'} ?"]) + ")")
+        params.extend(after[:i])
+        params.append(after[i])
+    return f"AND {bound} AND ({' OR '.join(branches)})", tuple(params)
+
+
+def _iter_order_rows(tier: str, where: str, params: tuple, keys: tuple, directions: tuple,
+                     batch_size: int):
+    """
+    Постраничное чтение заказов одного хранилища (keyset-пагинация).
+
+    tier - 'main' (основная БД) или 'archive' (archive.py). Выдает списки
+    строк: поля _ORDER_PAGE_FIELDS, за ними значения ключей сортировки.
+    """
+    order_by = ", ".join(f"_k{i} {'DESC' if desc else 'ASC'}" for i, desc in enumerate(directions))
+    key_columns = ", ".join(f"{key} AS _k{i}" for i, key in enumerate(keys))
+    key_names = ", ".join(f"_k{i}" for i in range(len(keys)))
+    after = None
+    while True:
+        if after is None:
+            keyset, keyset_params = "", ()
+        else:
+            keyset, keyset_params = _keyset_after(keys, directions, after)
+        conn = get_connection()
+        cursor = conn.cursor()
+        if tier == 'archive':
+            # Товары одной строкой посчитаны при переносе в архив
+            cursor.execute(f"""
+                SELECT o.order_id, o.order_number, o.session_order_number, o.user_id, o.session_id,
+                       o.phone_number, o.full_name, o.total_amount, o.status, o.created_at,
+                       COALESCE(archive_unpack(o.items_summary), 'Нет товаров') AS items,
+                       {key_columns}
+                FROM archive.orders o
+                WHERE {where} {keyset} AND {archive.visible('o')}
+                ORDER BY {order_by}
+                LIMIT ?
+            """, (*params, *keyset_params, batch_size))
+        else:
+            cursor.execute(f"""
+                SELECT o.order_id, o.order_number, o.session_order_number, o.user_id, o.session_id,
+                       o.phone_number, o.full_name, o.total_amount, o.status, o.created_at,
+                       COALESCE(GROUP_CONCAT(p.product_name || ' x' || oi.quantity || ' (' || oi.price || '₽)'), 'Нет товаров') AS items,
+                       {key_names}
+                FROM (
+                    SELECT o.*, {key_columns}
+                    FROM main.orders o
+                    WHERE {where} {keyset}
+                    ORDER BY {order_by}
+                    LIMIT ?
+                ) o
+                LEFT JOIN main.order_items oi ON o.order_id = oi.order_id
+                LEFT JOIN main.products p ON oi.product_id = p.product_id
+                GROUP BY o.order_id
+                ORDER BY {order_by}
+            """, (*params, *keyset_params, batch_size))
+        rows = cursor.fetchall()
+        conn.close()
+        if not rows:
+            return
+        after = rows[-1][len(_ORDER_PAGE_FIELDS):]
+        yield rows
+        if len(rows) < batch_size:
+            return
+
+
+def _iter_order_pages(where: str, params: tuple, keys: tuple, descending=False,
+                      batch_size: Optional[int] = None, with_archive: bool = False):
+    """
+    Постраничное чтение заказов с товарами одной строкой (keyset-пагинация).
+
+    keys - выражения сортировки по orders o; последнее должно быть уникальным
+    (o.order_id). descending - направление для всех ключей (bool) или для
+    каждого (кортеж bool). Следующая страница начинается после ключа последней строки
+    предыдущей, поэтому каждая страница - короткий запрос по индексу, а не
+    OFFSET через все прочитанные строки.
+
+    Соединение берется на время одного запроса и возвращается в пул до
+    выдачи пачки: потребитель может обрабатывать ее сколько угодно долго
+    и в любом потоке.
+
+    with_archive=True - вместе с заказами из архива (archive.py): страницы
+    обоих хранилищ читаются по очереди и сливаются по ключу сортировки.
+    """
+    batch_size = batch_size or config.ORDER_BATCH_SIZE
+    directions = _key_directions(keys, descending)
+    tiers = ('main', 'archive') if with_archive else ('main',)
+    streams = [
+        itertools.chain.from_iterable(_iter_order_rows(tier, where, params, keys, directions, batch_size))
+        for tier in tiers
+    ]
+    if len(streams) == 1:
+        rows = streams[0]
+    else:
+        width = len(_ORDER_PAGE_FIELDS)
+        rows = heapq.merge(*streams, key=lambda row: tuple(
+            _Descending(value) if desc else value for value, desc in zip(row[width:], directions)
+        ))
+    batch = []
+    for row in rows:
+        # Колонки ключа (_k0, ...) в запись не попадают: zip остановится на полях заказа
+        batch.append(records.Order(_ORDER_PAGE_FIELDS, row))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_session_orders(session_id: int, batch_size: Optional[int] = None):
+    """
+    Заказы сессии пачками (списками словарей) по порядку номеров в сессии.
+
+    Память не зависит от числа заказов: в каждый момент прочитана одна пачка
+    (config.ORDER_BATCH_SIZE заказов).
+    """
+    # Выражение совпадает с индексом idx_orders_session_keyset (миграция 6)
+    yield from _iter_order_pages(
+        "o.session_id = ?", (session_id,),
+        ("COALESCE(o.session_order_number, 0)", "o.order_id"),
+        batch_size=batch_size
+    )
+
+
+def count_session_orders(session_id: int) -> int:
+    """Количество заказов сессии (по индексу, без чтения заказов)"""
+    conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("""
-        SELECT o.order_id, o.order_number, o.session_order_number, o.user_id, o.phone_number, o.full_name, 
-               o.total_amount, o.status, o.created_at,
-               GROUP_CONCAT(p.product_name || ' x' || oi.quantity || ' (' || oi.price || '₽)') as items
-        FROM orders o
-        LEFT JOIN order_items oi ON o.order_id = oi.order_id
-        LEFT JOIN products p ON oi.product_id = p.product_id
-        WHERE o.session_id = ?
-        GROUP BY o.order_id
-        ORDER BY o.session_order_number ASC, o.created_at DESC
-    """, (session_id,))
-    orders = cursor.fetchall()
+    cursor.execute("SELECT COUNT(*) FROM orders WHERE session_id = ?", (session_id,))
+    count = cursor.fetchone()[0]
     conn.close()
-    return [
-        {
-            "order_id": order[0],
-            "order_number": order[1],
-            "session_order_number": order[2],
-            "user_id": order[3],
-            "phone_number": order[4],
-            "full_name": order[5],
-            "total_amount": order[6],
-            "status": order[7],
-            "created_at": order[8],
-            "items": order[9] or "Нет товаров"
-        }
-        for order in orders
-    ]
+    return count
+
+
+def get_session_orders(session_id: int) -> list:
+    """Получает все заказы для сессии (списком; для больших сессий - iter_session_orders)"""
+    return [order for batch in iter_session_orders(session_id) for order in batch]
 
 
 def get_session_sales_stats(session_id: int) -> dict:
-    """Получает статистику продаж по сессии"""
-    conn = sqlite3.connect(DB_NAME)
+    """
+    Получает статистику продаж по сессии.
+
+    Итоги читаются одной строкой из session_stats, проданное по товарам - из
+    product_sales. Обе таблицы обновляются в транзакциях, меняющих заказы (rollups.py).
+    """
+    conn = get_connection()
     cursor = conn.cursor()
     
-    # Общее количество заказов
-    cursor.execute("SELECT COUNT(*) FROM orders WHERE session_id = ?", (session_id,))
-    total_orders = cursor.fetchone()[0] or 0
-    
-    # Заказы по статусам
     cursor.execute("""
-        SELECT status, COUNT(*) 
-        FROM orders 
+        SELECT total_orders, completed_orders, processing_orders, pending_orders, cancelled_orders,
+               total_revenue, boxes_sold, unique_customers
+        FROM session_stats
         WHERE session_id = ?
-        GROUP BY status
     """, (session_id,))
-    status_counts = {row[0]: row[1] for row in cursor.fetchall()}
+    row = cursor.fetchone() or (0, 0, 0, 0, 0, 0, 0, 0)
     
-    completed_orders = status_counts.get('completed', 0)
-    processing_orders = status_counts.get('processing', 0)
-    pending_orders = status_counts.get('pending', 0)
-    cancelled_orders = status_counts.get('cancelled', 0)
-    
-    # Общая выручка (только выданные заказы)
-    cursor.execute("""
-        SELECT COALESCE(SUM(total_amount), 0)
-        FROM orders
-        WHERE session_id = ? AND status = 'completed'
-    """, (session_id,))
-    total_revenue = cursor.fetchone()[0] or 0
-    
-    # Всего продано ящиков (только выданные заказы)
-    cursor.execute("""
-        SELECT COALESCE(SUM(oi.quantity), 0)
-        FROM orders o
-        JOIN order_items oi ON o.order_id = oi.order_id
-        WHERE o.session_id = ? AND o.status = 'completed'
-    """, (session_id,))
-    total_boxes_sold = cursor.fetchone()[0] or 0
-    
-    # Уникальных клиентов
-    cursor.execute("""
-        SELECT COUNT(DISTINCT user_id)
-        FROM orders
-        WHERE session_id = ?
-    """, (session_id,))
-    unique_customers = cursor.fetchone()[0] or 0
-    
-    # Получаем информацию о товарах сессии с проданными количествами
+    # Товары сессии с проданными количествами
     cursor.execute("""
-        SELECT 
-            p.product_id,
-            p.product_name,
-            p.price,
-            p.boxes_count,
-            COALESCE(SUM(CASE WHEN o.status = 'completed' THEN oi.quantity ELSE 0 END), 0) as sold_boxes
+        SELECT p.product_id, p.product_name, p.price, p.boxes_count, COALESCE(ps.sold_boxes, 0)
         FROM products p
-        LEFT JOIN order_items oi ON p.product_id = oi.product_id
-        LEFT JOIN orders o ON oi.order_id = o.order_id AND o.session_id = ?
+        LEFT JOIN product_sales ps ON ps.session_id = p.session_id AND ps.product_id = p.product_id
         WHERE p.session_id = ?
-        GROUP BY p.product_id, p.product_name, p.price, p.boxes_count
         ORDER BY p.created_at DESC
-    """, (session_id, session_id))
+    """, (session_id,))
     
     products_info = []
-    for row in cursor.fetchall():
-        product_id, product_name, price, boxes_count, sold_boxes = row
+    for product_id, product_name, price, boxes_count, sold_boxes in cursor.fetchall():
         products_info.append({
             'product_id': product_id,
             'product_name': product_name,
@@ -1375,86 +1877,259 @@ def get_session_sales_stats(session_id: int) -> dict:
     conn.close()
     
     return {
-        'total_orders': total_orders,
-        'completed_orders': completed_orders,
-        'processing_orders': processing_orders,
-        'pending_orders': pending_orders,
-        'cancelled_orders': cancelled_orders,
-        'total_revenue': total_revenue,
-        'total_boxes_sold': total_boxes_sold,
-        'unique_customers': unique_customers,
+        'total_orders': row[0],
+        'completed_orders': row[1],
+        'processing_orders': row[2],
+        'pending_orders': row[3],
+        'cancelled_orders': row[4],
+        # Сумма копится сложением, округляем накопленную погрешность
+        'total_revenue': round(row[5], 2),
+        'total_boxes_sold': row[6],
+        'unique_customers': row[7],
         'products': products_info
     }
 
 
-def get_orders_by_period(period: str) -> list:
-    """Получает все заказы за указанный период"""
-    from datetime import datetime, timedelta
-    
-    conn = sqlite3.connect(DB_NAME)
+def rebuild_session_stats(session_id: Optional[int] = None) -> bool:
+    """
+    Пересчитывает счетчики с нуля по заказам.
+
+    Без session_id - все счетчики (по сессиям и по пользователям), с session_id -
+    только счетчики этой сессии.
+    """
+    pool = get_pool()
+    conn = get_connection()
     cursor = conn.cursor()
+    try:
+        with pool.write_lock:
+            cursor.execute("BEGIN IMMEDIATE")
+            rollups.rebuild(cursor, session_id)
+            conn.commit()
+        conn.close()
+        target = f"сессии {session_id}" if session_id is not None else "всех сессий и пользователей"
+        logger.info(f"Счетчики {target} пересчитаны")
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при пересчете счетчиков: {e}")
+        conn.rollback()
+        conn.close()
+        return False
+
+
+def check_rollups() -> Optional[dict]:
+    """
+    Сверяет счетчики (rollups.py) с таблицами заказов.
+
+    Возвращает {таблица: {'mismatched': n, 'sample': [ключи]}} для таблиц
+    с расхождениями (пустой словарь - все сходится) или None при ошибке.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        # Одна транзакция чтения - сверка видит согласованный снимок БД
+        cursor.execute("BEGIN")
+        problems = rollups.check(cursor)
+        conn.rollback()
+        conn.close()
+        for table, info in problems.items():
+            logger.warning(f"Счетчики {table} расходятся с заказами: {info['mismatched']} строк, например {info['sample']}")
+        return problems
+    except Exception as e:
+        logger.error(f"Ошибка при сверке счетчиков: {e}")
+        conn.rollback()
+        conn.close()
+        return None
+
+
+def _period_start(period: str) -> Optional[str]:
+    """Начало периода week/month/year в формате created_at (None - за все время)"""
+    from datetime import timedelta
     
-    now = datetime.now()
-    
-    if period == "week":
-        start_date = (now - timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S')
-    elif period == "month":
-        start_date = (now - timedelta(days=30)).strftime('%Y-%m-%d %H:%M:%S')
-    elif period == "year":
-        start_date = (now - timedelta(days=365)).strftime('%Y-%m-%d %H:%M:%S')
-    else:  # all_time
-        start_date = None
-    
+    days = {"week": 7, "month": 30, "year": 365}.get(period)
+    if days is None:  # all_time
+        return None
+    return (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def iter_orders_by_period(period: str, by_session: bool = False, batch_size: Optional[int] = None):
+    """
+    Заказы за период пачками (списками словарей), от новых к старым; заказы
+    с одинаковым created_at - по возрастанию order_id (в порядке оформления).
+
+    by_session=True - заказы сгруппированы по сессиям (от новых сессий к старым),
+    внутри сессии - в том же порядке. Заказы сессий, перенесенных в архив
+    (archive.py), тоже входят.
+    """
+    start_date = _period_start(period)
     if start_date:
-        cursor.execute("""
-            SELECT o.order_id, o.order_number, o.user_id, o.session_id, o.phone_number, o.full_name, 
-                   o.total_amount, o.status, o.created_at,
-                   GROUP_CONCAT(p.product_name || ' x' || oi.quantity || ' (' || oi.price || '₽)') as items
-            FROM orders o
-            LEFT JOIN order_items oi ON o.order_id = oi.order_id
-            LEFT JOIN products p ON oi.product_id = p.product_id
-            WHERE o.created_at >= ?
-            GROUP BY o.order_id
-            ORDER BY o.created_at DESC
-        """, (start_date,))
+        where, params = "o.created_at >= ?", (start_date,)
     else:
-        cursor.execute("""
-            SELECT o.order_id, o.order_number, o.user_id, o.session_id, o.phone_number, o.full_name, 
-                   o.total_amount, o.status, o.created_at,
-                   GROUP_CONCAT(p.product_name || ' x' || oi.quantity || ' (' || oi.price || '₽)') as items
-            FROM orders o
-            LEFT JOIN order_items oi ON o.order_id = oi.order_id
-            LEFT JOIN products p ON oi.product_id = p.product_id
-            GROUP BY o.order_id
-            ORDER BY o.created_at DESC
-        """)
-    
-    orders = cursor.fetchall()
+        where, params = "1 = 1", ()
+    # Индексы idx_orders_created_at и idx_orders_session_created (миграция 9)
+    if by_session:
+        keys = ("o.session_id", "o.created_at", "o.order_id")
+        descending = (True, True, False)
+    else:
+        keys = ("o.created_at", "o.order_id")
+        descending = (True, False)
+    yield from _iter_order_pages(where, params, keys, descending=descending, batch_size=batch_size,
+                                 with_archive=True)
+
+
+def get_orders_by_period(period: str) -> list:
+    """Получает все заказы за указанный период (списком; для отчетов - iter_orders_by_period)"""
+    return [order for batch in iter_orders_by_period(period) for order in batch]
+
+
+def archive_session(session_id: int) -> dict:
+    """
+    Переносит заказы, позиции и товары закрытой сессии в архив (archive.py).
+
+    Сессия должна быть закрыта для торговли и не иметь незавершенных заказов.
+    Сначала строки копируются в archive.db, затем одной транзакцией основной
+    БД удаляются из нее, а сессия отмечается archived_at. Если между шагами
+    заказы сессии изменились, копирование повторяется. Повторный вызов
+    доводит до конца прерванный перенос.
+
+    Возвращает {'success': True, 'orders': число заказов} или
+    {'success': False, 'error': 'not_found' | 'trading_active' | 'open_orders' | 'failed'}.
+    """
+    pool = get_pool()
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        with pool.write_lock:
+            cursor.execute("SELECT is_active FROM sessions WHERE session_id = ?", (session_id,))
+            row = cursor.fetchone()
+            if row is None:
+                conn.close()
+                return {'success': False, 'error': 'not_found'}
+            if row[0]:
+                conn.close()
+                return {'success': False, 'error': 'trading_active'}
+            cursor.execute("""
+                SELECT COUNT(*) FROM orders
+                WHERE session_id = ? AND status NOT IN ('completed', 'cancelled')
+            """, (session_id,))
+            open_orders = cursor.fetchone()[0]
+            if open_orders:
+                conn.close()
+                return {'success': False, 'error': 'open_orders', 'open_orders': open_orders}
+            
+            for attempt in range(3):
+                cursor.execute("BEGIN IMMEDIATE")
+                orders = archive.copy_to_archive(cursor, session_id)
+                conn.commit()
+                
+                cursor.execute("BEGIN IMMEDIATE")
+                if archive.changed_since_copy(cursor, session_id):
+                    conn.rollback()
+                    continue
+                archive.delete_live(cursor, session_id)
+                cursor.execute(
+                    "UPDATE sessions SET archived_at = CURRENT_TIMESTAMP WHERE session_id = ?", (session_id,)
+                )
+                conn.commit()
+                break
+            else:
+                conn.close()
+                logger.error(f"Сессия {session_id} не перенесена в архив: заказы менялись во время переноса")
+                return {'success': False, 'error': 'failed'}
+        conn.close()
+        _bump_catalog_version()
+        _order_cache.invalidate()
+        logger.info(f"Сессия {session_id} перенесена в архив: заказов {orders}")
+        return {'success': True, 'orders': orders}
+    except Exception as e:
+        logger.error(f"Ошибка при переносе сессии {session_id} в архив: {e}")
+        conn.rollback()
+        conn.close()
+        return {'success': False, 'error': 'failed'}
+
+
+def restore_session(session_id: int) -> dict:
+    """
+    Возвращает сессию из архива в основную БД (обратное к archive_session).
+
+    Торговля после восстановления остается закрытой. Возвращает
+    {'success': True, 'orders': число заказов} или
+    {'success': False, 'error': 'not_found' | 'failed'}.
+    """
+    pool = get_pool()
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        with pool.write_lock:
+            cursor.execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,))
+            if cursor.fetchone() is None:
+                conn.close()
+                return {'success': False, 'error': 'not_found'}
+            # Строки в основной БД сразу скрывают свои копии в архиве (archive.visible),
+            # поэтому архив очищается отдельной транзакцией
+            cursor.execute("BEGIN IMMEDIATE")
+            orders = archive.copy_to_live(cursor, session_id)
+            cursor.execute("UPDATE sessions SET archived_at = NULL WHERE session_id = ?", (session_id,))
+            conn.commit()
+            
+            cursor.execute("BEGIN IMMEDIATE")
+            archive.delete_archived(cursor, session_id)
+            conn.commit()
+        conn.close()
+        _bump_catalog_version()
+        _order_cache.invalidate()
+        logger.info(f"Сессия {session_id} восстановлена из архива: заказов {orders}")
+        return {'success': True, 'orders': orders}
+    except Exception as e:
+        logger.error(f"Ошибка при восстановлении сессии {session_id} из архива: {e}")
+        conn.rollback()
+        conn.close()
+        return {'success': False, 'error': 'failed'}
+
+
+def get_archive_stats() -> dict:
+    """Размер основной БД и архива: заказов в каждом хранилище, сессий в архиве, размеры файлов"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM main.orders")
+    live_orders = cursor.fetchone()[0]
+    cursor.execute(f"SELECT COUNT(*) FROM archive.orders o WHERE {archive.visible('o')}")
+    archived_orders = cursor.fetchone()[0]
+    cursor.execute("SELECT session_id FROM sessions WHERE archived_at IS NOT NULL ORDER BY session_id")
+    archived_sessions = [row[0] for row in cursor.fetchall()]
     conn.close()
-    return [
-        {
-            "order_id": order[0],
-            "order_number": order[1],
-            "user_id": order[2],
-            "session_id": order[3],
-            "phone_number": order[4],
-            "full_name": order[5],
-            "total_amount": order[6],
-            "status": order[7],
-            "created_at": order[8],
-            "items": order[9] or "Нет товаров"
-        }
-        for order in orders
-    ]
+    archive_path = get_archive_path()
+    return {
+        'live_orders': live_orders,
+        'archived_orders': archived_orders,
+        'archived_sessions': archived_sessions,
+        'database_size': os.path.getsize(DB_NAME) if os.path.exists(DB_NAME) else 0,
+        'archive_size': os.path.getsize(archive_path) if os.path.exists(archive_path) else 0,
+    }
+
+
+def compact_database() -> bool:
+    """Сжимает файл основной БД (VACUUM) - освобождает место после переноса сессий в архив"""
+    pool = get_pool()
+    conn = get_connection()
+    try:
+        with pool.write_lock:
+            conn.execute("VACUUM main")
+        conn.close()
+        logger.info("Основная БД сжата (VACUUM)")
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при сжатии БД: {e}")
+        conn.close()
+        return False
 
 
 def get_user_cart(user_id: int, session_id: int) -> list:
     """Получает корзину пользователя для сессии"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    conn = get_connection()
+    cursor = _record_cursor(conn, records.Order)
     cursor.execute("""
         SELECT o.order_id, o.order_number, o.total_amount, o.status, o.created_at,
-               GROUP_CONCAT(p.product_name || ' x' || oi.quantity) as items
+               GROUP_CONCAT(p.product_name || ' x' || oi.quantity) AS items
         FROM orders o
         JOIN order_items oi ON o.order_id = oi.order_id
         JOIN products p ON oi.product_id = p.product_id
@@ -1464,61 +2139,47 @@ def get_user_cart(user_id: int, session_id: int) -> list:
     """, (user_id, session_id))
     orders = cursor.fetchall()
     conn.close()
-    return [
-        {
-            "order_id": order[0],
-            "order_number": order[1],
-            "total_amount": order[2],
-            "status": get_order_status_ru(order[3]),
-            "created_at": order[4],
-            "items": order[5]
-        }
-        for order in orders
-    ]
+    for order in orders:
+        order.status = get_order_status_ru(order.status)
+    return orders
 
 
 def get_user_all_orders(user_id: int) -> list:
-    """Получает все заказы пользователя по всем сессиям"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
+    """Получает все заказы пользователя по всем сессиям (включая сессии в архиве, см. archive.py)"""
+    conn = get_connection()
+    cursor = _record_cursor(conn, records.Order)
+    cursor.execute(f"""
         SELECT o.order_id, o.order_number, o.session_order_number, o.session_id, o.total_amount, o.status, o.created_at,
-               s.session_name,
-               GROUP_CONCAT(p.product_name || ' x' || oi.quantity || ' (' || oi.price || '₽)') as items
-        FROM orders o
+               COALESCE(s.session_name, 'Неизвестная сессия') AS session_name,
+               COALESCE(GROUP_CONCAT(p.product_name || ' x' || oi.quantity || ' (' || oi.price || '₽)'), 'Нет товаров') AS items
+        FROM main.orders o
         LEFT JOIN sessions s ON o.session_id = s.session_id
-        LEFT JOIN order_items oi ON o.order_id = oi.order_id
-        LEFT JOIN products p ON oi.product_id = p.product_id
+        LEFT JOIN main.order_items oi ON o.order_id = oi.order_id
+        LEFT JOIN main.products p ON oi.product_id = p.product_id
         WHERE o.user_id = ?
         GROUP BY o.order_id
-        ORDER BY o.created_at DESC
-    """, (user_id,))
+        UNION ALL
+        SELECT o.order_id, o.order_number, o.session_order_number, o.session_id, o.total_amount, o.status, o.created_at,
+               COALESCE(s.session_name, 'Неизвестная сессия') AS session_name,
+               COALESCE(archive_unpack(o.items_summary), 'Нет товаров') AS items
+        FROM archive.orders o
+        LEFT JOIN sessions s ON o.session_id = s.session_id
+        WHERE o.user_id = ? AND {archive.visible('o')}
+        ORDER BY 7 DESC
+    """, (user_id, user_id))
     orders = cursor.fetchall()
     conn.close()
-    return [
-        {
-            "order_id": order[0],
-            "order_number": order[1],
-            "session_order_number": order[2],
-            "session_id": order[3],
-            "total_amount": order[4],
-            "status": order[5],
-            "created_at": order[6],
-            "session_name": order[7] or "Неизвестная сессия",
-            "items": order[8] or "Нет товаров"
-        }
-        for order in orders
-    ]
+    return orders
 
 
 def get_user_pending_orders(user_id: int) -> list:
     """Получает все незавершенные заказы пользователя по всем сессиям"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    conn = get_connection()
+    cursor = _record_cursor(conn, records.Order)
     cursor.execute("""
         SELECT o.order_id, o.order_number, o.session_order_number, o.session_id, o.total_amount, o.status, o.created_at,
-               s.session_name,
-               GROUP_CONCAT(p.product_name || ' x' || oi.quantity || ' (' || oi.price || '₽)') as items
+               COALESCE(s.session_name, 'Неизвестная сессия') AS session_name,
+               COALESCE(GROUP_CONCAT(p.product_name || ' x' || oi.quantity || ' (' || oi.price || '₽)'), 'Нет товаров') AS items
         FROM orders o
         LEFT JOIN sessions s ON o.session_id = s.session_id
         LEFT JOIN order_items oi ON o.order_id = oi.order_id
@@ -1529,73 +2190,32 @@ def get_user_pending_orders(user_id: int) -> list:
     """, (user_id,))
     orders = cursor.fetchall()
     conn.close()
-    return [
-        {
-            "order_id": order[0],
-            "order_number": order[1],
-            "session_order_number": order[2],
-            "session_id": order[3],
-            "total_amount": order[4],
-            "status": order[5],
-            "created_at": order[6],
-            "session_name": order[7] or "Неизвестная сессия",
-            "items": order[8] or "Нет товаров"
-        }
-        for order in orders
-    ]
+    return orders
 
 
 def get_user_statistics(user_id: int) -> dict:
-    """Получает статистику пользователя"""
-    conn = sqlite3.connect(DB_NAME)
+    """Получает статистику пользователя (из счетчиков user_stats, см. rollups.py)"""
+    conn = get_connection()
     cursor = conn.cursor()
-    
-    # Общее количество купленных ящиков (только выданные заказы)
     cursor.execute("""
-        SELECT COALESCE(SUM(oi.quantity), 0)
-        FROM orders o
-        JOIN order_items oi ON o.order_id = oi.order_id
-        WHERE o.user_id = ? AND o.status = 'completed'
+        SELECT total_boxes, total_amount, completed_orders, open_orders
+        FROM user_stats
+        WHERE user_id = ?
     """, (user_id,))
-    total_boxes = cursor.fetchone()[0] or 0
-    
-    # Общая сумма выданных заказов
-    cursor.execute("""
-        SELECT COALESCE(SUM(total_amount), 0)
-        FROM orders
-        WHERE user_id = ? AND status = 'completed'
-    """, (user_id,))
-    total_amount = cursor.fetchone()[0] or 0
-    
-    # Количество выданных заказов
-    cursor.execute("""
-        SELECT COUNT(*)
-        FROM orders
-        WHERE user_id = ? AND status = 'completed'
-    """, (user_id,))
-    completed_orders = cursor.fetchone()[0] or 0
-    
-    # Количество незавершенных заказов
-    cursor.execute("""
-        SELECT COUNT(*)
-        FROM orders
-        WHERE user_id = ? AND status != 'completed' AND status != 'cancelled'
-    """, (user_id,))
-    pending_orders = cursor.fetchone()[0] or 0
-    
+    row = cursor.fetchone() or (0, 0, 0, 0)
     conn.close()
     
     return {
-        "total_boxes": total_boxes,
-        "total_amount": total_amount,
-        "completed_orders": completed_orders,
-        "pending_orders": pending_orders
+        "total_boxes": row[0],
+        "total_amount": round(row[1], 2),
+        "completed_orders": row[2],
+        "pending_orders": row[3]
     }
 
 
 def get_users_with_pending_orders_by_session(session_id: int) -> list:
     """Получает список уникальных пользователей с не выданными заказами в сессии"""
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("""
         SELECT DISTINCT o.user_id
@@ -1611,7 +2231,7 @@ def get_users_with_pending_orders_by_session(session_id: int) -> list:
 
 def get_users_with_active_orders_by_session(session_id: int) -> list:
     """Получает список уникальных пользователей с активными заказами (pending или processing) в сессии"""
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("""
         SELECT DISTINCT o.user_id
@@ -0,0 +1,129 @@
+"""
+Асинхронный доступ к database.py для обработчиков telegram.
+
+Синхронные функции database.py выполняются в ограниченном пуле потоков,
+а обработчик получает awaitable, поэтому долгий запрос (отчет, статистика
+сессии) не останавливает цикл событий и других пользователей:
+
+    order = await db_async.get_order(order_id)
+    keyboard = await db_async.run(get_sessions_keyboard_for_admin, "report")
+
+Функции-генераторы database.py (iter_session_orders и т.п.) становятся
+асинхронными генераторами: каждая следующая пачка читается в пуле потоков.
+
+    async for batch in db_async.iter_session_orders(session_id):
+        ...
+
+Несколько вызовов в одной транзакции (database.unit_of_work) - через
+transaction: функция выполняется целиком в одном потоке пула.
+
+    result = await db_async.transaction(build_receipt, order_id)
+
+Размер пула потоков совпадает с размером пула соединений (config.DB_POOL_SIZE),
+чтобы потоки не простаивали в ожидании соединения.
+"""
+import asyncio
+import functools
+import inspect
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import database
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+# Соединение из пула принадлежит потоку, который его взял, поэтому
+# выдавать его в обработчик через пул потоков нельзя
+_NOT_ASYNC = ('get_connection', 'get_pool', 'unit_of_work')
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Возвращает пул потоков для запросов к БД (создает при первом вызове)"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=max(1, config.DB_POOL_SIZE),
+            thread_name_prefix='db'
+        )
+    return _executor
+
+
+async def run(func, *args, **kwargs):
+    """Выполняет синхронную функцию в пуле потоков БД и возвращает ее результат"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
+def _run_in_unit(func, write: bool, args, kwargs):
+    with database.unit_of_work(write=write):
+        return func(*args, **kwargs)
+
+
+async def transaction(func, *args, **kwargs):
+    """
+    Выполняет синхронную функцию в пуле потоков БД внутри database.unit_of_work:
+    все вызовы функций database.py из нее - одна транзакция записи
+    """
+    return await run(_run_in_unit, func, True, args, kwargs)
+
+
+async def read_transaction(func, *args, **kwargs):
+    """Как transaction, но только чтение: согласованный снимок БД без замка записи"""
+    return await run(_run_in_unit, func, False, args, kwargs)
+
+
+def shutdown(wait: bool = True):
+    """Останавливает пул потоков (при завершении бота)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
+
+
+def _make_async(name: str, func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run(func, *args, **kwargs)
+    wrapper.__name__ = name
+    return wrapper
+
+
+# Признак конца генератора для next() в пуле потоков
+_DONE = object()
+
+
+def _make_async_iter(name: str, func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        iterator = func(*args, **kwargs)
+        try:
+            while True:
+                # next() с default не выбрасывает StopIteration в пул потоков
+                batch = await run(next, iterator, _DONE)
+                if batch is _DONE:
+                    return
+                yield batch
+        finally:
+            iterator.close()
+    wrapper.__name__ = name
+    return wrapper
+
+
+def __getattr__(name: str):
+    """
+    db_async.<функция> - асинхронная версия database.<функция>.
+
+    Обертка создается при первом обращении и запоминается в модуле.
+    """
+    func = getattr(database, name, None)
+    if name.startswith('_') or name in _NOT_ASYNC or not callable(func):
+        raise AttributeError(f"module 'db_async' has no attribute '{name}'")
+    if inspect.isgeneratorfunction(func):
+        wrapper = _make_async_iter(name, func)
+    else:
+        wrapper = _make_async(name, func)
+    globals()[name] = wrapper
+    return wrapper
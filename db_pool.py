@@ -0,0 +1,436 @@
+"""
+Пул соединений SQLite для всего процесса.
+
+Соединения создаются один раз и переиспользуются между вызовами функций
+database.py, вместе с кэшем подготовленных выражений sqlite3. Количество
+одновременно выданных соединений ограничено, каждое соединение в один
+момент времени принадлежит только одному потоку. Повторный запрос
+соединения из того же потока (функция database.py вызывает другую функцию,
+пока держит соединение) получает то же соединение, а не второе место в пуле.
+
+Единица работы (ConnectionPool.unit_of_work) держит одну транзакцию на
+все запросы потока: соединения, выданные внутри нее, работают через
+SAVEPOINT (UnitConnection), поэтому функции database.py со своими
+BEGIN/commit/rollback становятся частями общей транзакции.
+"""
+import os
+import sqlite3
+import logging
+import itertools
+import threading
+import contextlib
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Размер пула по умолчанию (максимум одновременно выданных соединений)
+DEFAULT_POOL_SIZE = 8
+# Сколько секунд ждать свободное соединение, прежде чем вернуть ошибку
+DEFAULT_ACQUIRE_TIMEOUT = 30.0
+# Размер кэша подготовленных выражений на одно соединение
+DEFAULT_CACHED_STATEMENTS = 256
+
+
+# Допустимые значения текстовых PRAGMA (значения подставляются в SQL, поэтому
+# принимаем только известные)
+_JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+_SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+_TEMP_STORE_MODES = ('DEFAULT', 'FILE', 'MEMORY')
+_CHECKPOINT_MODES = ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE')
+
+
+class PoolTimeoutError(sqlite3.OperationalError):
+    """Не удалось получить соединение из пула за отведённое время"""
+
+
+def apply_storage_profile(conn: sqlite3.Connection, profile: dict):
+    """
+    Применяет профиль хранения (PRAGMA) к соединению.
+
+    Ключи profile: journal_mode, synchronous, busy_timeout (мс),
+    cache_size_kb, mmap_size (байт), temp_store, wal_autocheckpoint (страниц).
+    Отсутствующие ключи не трогаются, недопустимые значения пропускаются с ошибкой в логе.
+    """
+    choices = (
+        ('journal_mode', _JOURNAL_MODES),
+        ('synchronous', _SYNCHRONOUS_MODES),
+        ('temp_store', _TEMP_STORE_MODES),
+    )
+    for key, allowed in choices:
+        value = profile.get(key)
+        if value is None:
+            continue
+        value = str(value).upper()
+        if value not in allowed:
+            logger.error(f"Недопустимое значение PRAGMA {key}={value}, пропускаем")
+            continue
+        conn.execute(f"PRAGMA {key} = {value}")
+    if profile.get('busy_timeout') is not None:
+        conn.execute(f"PRAGMA busy_timeout = {int(profile['busy_timeout'])}")
+    if profile.get('cache_size_kb') is not None:
+        # Отрицательное значение cache_size задает размер в килобайтах, а не в страницах
+        conn.execute(f"PRAGMA cache_size = {-abs(int(profile['cache_size_kb']))}")
+    if profile.get('mmap_size') is not None:
+        conn.execute(f"PRAGMA mmap_size = {int(profile['mmap_size'])}")
+    if profile.get('wal_autocheckpoint') is not None:
+        conn.execute(f"PRAGMA wal_autocheckpoint = {int(profile['wal_autocheckpoint'])}")
+
+
+def describe_storage_profile(conn: sqlite3.Connection) -> dict:
+    """Читает действующие значения PRAGMA соединения"""
+    synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+    temp_store = conn.execute("PRAGMA temp_store").fetchone()[0]
+    cache_size = conn.execute("PRAGMA cache_size").fetchone()[0]
+    mmap_row = conn.execute("PRAGMA mmap_size").fetchone()
+    return {
+        'journal_mode': conn.execute("PRAGMA journal_mode").fetchone()[0].upper(),
+        'synchronous': _SYNCHRONOUS_MODES[synchronous] if 0 <= synchronous < 4 else synchronous,
+        'busy_timeout': conn.execute("PRAGMA busy_timeout").fetchone()[0],
+        'cache_size': f"{-cache_size} KB" if cache_size < 0 else f"{cache_size} pages",
+        'mmap_size': mmap_row[0] if mmap_row else 0,
+        'temp_store': _TEMP_STORE_MODES[temp_store] if 0 <= temp_store < 3 else temp_store,
+        'wal_autocheckpoint': conn.execute("PRAGMA wal_autocheckpoint").fetchone()[0],
+    }
+
+
+class PooledConnection:
+    """
+    Обёртка над sqlite3.Connection, выданная из пула.
+
+    Ведёт себя как обычное соединение (cursor, execute, commit, rollback),
+    но close() не закрывает соединение, а откатывает незавершённую
+    транзакцию и возвращает соединение в пул. Вложенная выдача (nested=True)
+    при close() соединение не возвращает - это делает внешняя.
+    """
+
+    __slots__ = ('_pool', '_conn', '_nested')
+
+    def __init__(self, pool: 'ConnectionPool', conn: sqlite3.Connection, nested: bool = False):
+        self._pool = pool
+        self._conn = conn
+        self._nested = nested
+
+    @property
+    def raw(self) -> sqlite3.Connection:
+        """Исходное соединение sqlite3"""
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("Соединение уже возвращено в пул")
+        return self._conn
+
+    @property
+    def closed(self) -> bool:
+        return self._conn is None
+
+    def cursor(self, *args, **kwargs):
+        return self.raw.cursor(*args, **kwargs)
+
+    def execute(self, *args, **kwargs):
+        return self.raw.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        return self.raw.executemany(*args, **kwargs)
+
+    def executescript(self, *args, **kwargs):
+        return self.raw.executescript(*args, **kwargs)
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    @property
+    def in_transaction(self) -> bool:
+        return self.raw.in_transaction
+
+    @property
+    def total_changes(self) -> int:
+        return self.raw.total_changes
+
+    @property
+    def row_factory(self):
+        return self.raw.row_factory
+
+    @row_factory.setter
+    def row_factory(self, value):
+        self.raw.row_factory = value
+
+    def close(self):
+        """Возвращает соединение в пул (повторный вызов ничего не делает)"""
+        conn, self._conn = self._conn, None
+        if conn is not None and not self._nested:
+            self._pool._release(conn)
+
+    def __del__(self):
+        # Страховка для путей, где функция не вызвала close() (например, исключение)
+        if getattr(self, '_conn', None) is not None:
+            logger.warning("Соединение из пула не было закрыто явно, возвращаем его в пул")
+            self.close()
+
+
+class UnitCursor(sqlite3.Cursor):
+    """Курсор соединения внутри единицы работы: BEGIN не выполняется (транзакция уже открыта)"""
+
+    def execute(self, sql, parameters=()):
+        if sql.lstrip()[:5].upper() == 'BEGIN':
+            return self
+        return super().execute(sql, parameters)
+
+
+class UnitConnection(PooledConnection):
+    """
+    Соединение, выданное внутри единицы работы (ConnectionPool.unit_of_work).
+
+    Каждая выдача - отдельная точка сохранения (SAVEPOINT) в общей
+    транзакции: commit() фиксирует сделанное в пределах единицы работы
+    (RELEASE и новая точка), rollback() откатывает к последнему commit(),
+    close() откатывает незафиксированное. Транзакцию базы данных
+    фиксирует только сама единица работы.
+    """
+
+    __slots__ = ('_savepoint',)
+
+    def __init__(self, pool: 'ConnectionPool', conn: sqlite3.Connection):
+        super().__init__(pool, conn, nested=True)
+        self._savepoint = f"unit_{next(pool._savepoints)}"
+        conn.execute(f"SAVEPOINT {self._savepoint}")
+
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault('factory', UnitCursor)
+        return self.raw.cursor(*args, **kwargs)
+
+    def execute(self, *args, **kwargs):
+        return self.cursor().execute(*args, **kwargs)
+
+    def commit(self):
+        self.raw.execute(f"RELEASE {self._savepoint}")
+        self.raw.execute(f"SAVEPOINT {self._savepoint}")
+
+    def rollback(self):
+        # ROLLBACK TO оставляет точку сохранения открытой
+        self.raw.execute(f"ROLLBACK TO {self._savepoint}")
+
+    def close(self):
+        conn = self._conn
+        if conn is not None:
+            try:
+                conn.execute(f"ROLLBACK TO {self._savepoint}")
+                conn.execute(f"RELEASE {self._savepoint}")
+            except sqlite3.Error as e:
+                # Точку уже сняла внешняя выдача (commit/rollback ее транзакции)
+                logger.debug(f"Точка сохранения {self._savepoint} уже снята: {e}")
+        super().close()
+
+
+class ConnectionPool:
+    """Пул соединений к одному файлу базы данных"""
+
+    def __init__(
+        self,
+        database: str,
+        max_size: int = DEFAULT_POOL_SIZE,
+        timeout: float = DEFAULT_ACQUIRE_TIMEOUT,
+        cached_statements: int = DEFAULT_CACHED_STATEMENTS,
+        on_connect=None,
+    ):
+        """
+        Параметры:
+            database - путь к файлу базы данных
+            max_size - максимум одновременно выданных соединений
+            timeout - ожидание свободного соединения, секунд
+            cached_statements - размер кэша подготовленных выражений
+            on_connect - функция (conn), вызывается для каждого нового соединения
+        """
+        self.database = database
+        self.max_size = max(1, int(max_size))
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self.on_connect = on_connect
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._pid = os.getpid()
+        self._owners = {}
+        # Потоки, выполняющие единицу работы (unit_of_work)
+        self._units = set()
+        self._savepoints = itertools.count(1)
+        # Замок записи процесса: короткие транзакции BEGIN IMMEDIATE из разных потоков
+        # встают в очередь здесь, а не ждут друг друга в busy_timeout SQLite.
+        # Замок повторно входимый: функция под замком может вызвать другую такую же.
+        # Замок берется только после соединения из пула (acquire, get_connection):
+        # поток, ждущий соединение, не держит замок, иначе взаимная блокировка
+        self.write_lock = threading.RLock()
+        self._created = 0
+        self._acquired = 0
+        self._reused = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.database,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        if self.on_connect is not None:
+            self.on_connect(conn)
+        self._created += 1
+        return conn
+
+    def _check_fork(self):
+        # Соединения, унаследованные дочерним процессом, использовать нельзя
+        if os.getpid() != self._pid:
+            self._idle = []
+            self._lock = threading.Lock()
+            self._slots = threading.BoundedSemaphore(self.max_size)
+            self._owners = {}
+            self._units = set()
+            self.write_lock = threading.RLock()
+            self._pid = os.getpid()
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledConnection:
+        """Выдаёт соединение из пула, при необходимости создаёт новое"""
+        self._check_fork()
+        ident = threading.get_ident()
+        owned = self._owners.get(ident)
+        if owned is not None:
+            if ident in self._units:
+                return UnitConnection(self, owned)
+            return PooledConnection(self, owned, nested=True)
+        wait = self.timeout if timeout is None else timeout
+        if not self._slots.acquire(timeout=wait):
+            raise PoolTimeoutError(f"Нет свободных соединений с БД за {wait} с")
+        try:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+                self._acquired += 1
+                if conn is not None:
+                    self._reused += 1
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._owners[threading.get_ident()] = conn
+        return PooledConnection(self, conn)
+
+    def _release(self, conn: sqlite3.Connection):
+        if os.getpid() != self._pid:
+            return
+        with self._lock:
+            # Освобождение может прийти и из другого потока (сборщик мусора)
+            for ident, owned in list(self._owners.items()):
+                if owned is conn:
+                    del self._owners[ident]
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = None
+        except sqlite3.Error as e:
+            # Сломанное соединение в пул не возвращаем
+            logger.error(f"Соединение с БД отброшено при возврате в пул: {e}")
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            conn = None
+        if conn is not None:
+            with self._lock:
+                self._idle.append(conn)
+        self._slots.release()
+
+    @contextlib.contextmanager
+    def unit_of_work(self, write: bool = True):
+        """
+        Одна транзакция на все запросы потока внутри блока with.
+
+        Соединения, которые поток берет внутри блока (acquire), - точки
+        сохранения этой транзакции (UnitConnection). При выходе из блока
+        транзакция фиксируется, при исключении - откатывается целиком.
+
+        write=True - транзакция BEGIN IMMEDIATE под замком записи на все
+        время блока (в блоке нельзя ждать сеть или пользователя);
+        write=False - только чтение: снимок БД на момент первого запроса.
+        Вложенная единица работы - точка сохранения внешней.
+        """
+        ident = threading.get_ident()
+        if ident in self._units:
+            conn = self.acquire()
+            try:
+                yield conn
+                conn.commit()
+            finally:
+                conn.close()
+            return
+        # Порядок как у всех писателей database.py: сначала соединение, затем замок записи
+        conn = self.acquire()
+        try:
+            with self.write_lock if write else contextlib.nullcontext():
+                conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+                self._units.add(ident)
+                try:
+                    yield conn
+                finally:
+                    self._units.discard(ident)
+                conn.commit()
+        finally:
+            # Незафиксированная транзакция откатывается при возврате в пул
+            conn.close()
+
+    def close_all(self):
+        """Закрывает все свободные соединения пула"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def stats(self) -> dict:
+        """Статистика пула: создано, выдано, переиспользовано, свободно"""
+        with self._lock:
+            return {
+                'database': self.database,
+                'max_size': self.max_size,
+                'created': self._created,
+                'acquired': self._acquired,
+                'reused': self._reused,
+                'idle': len(self._idle),
+            }
+
+
+class Checkpointer(threading.Thread):
+    """Фоновый поток, периодически выполняющий checkpoint журнала WAL"""
+
+    def __init__(self, pool: ConnectionPool, interval: float, mode: str = 'PASSIVE'):
+        super().__init__(name='sqlite-checkpointer', daemon=True)
+        mode = str(mode).upper()
+        if mode not in _CHECKPOINT_MODES:
+            logger.error(f"Недопустимый режим checkpoint {mode}, используем PASSIVE")
+            mode = 'PASSIVE'
+        self.pool = pool
+        self.interval = interval
+        self.mode = mode
+        self._stop_event = threading.Event()
+
+    def checkpoint(self) -> Optional[tuple]:
+        """Выполняет один checkpoint, возвращает (busy, log_frames, checkpointed_frames)"""
+        conn = self.pool.acquire()
+        try:
+            row = conn.execute(f"PRAGMA wal_checkpoint({self.mode})").fetchone()
+            if row and row[0]:
+                logger.warning(f"Checkpoint WAL не завершен (БД занята): {row}")
+            return tuple(row) if row else None
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка checkpoint WAL: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.checkpoint()
+
+    def stop(self):
+        self._stop_event.set()
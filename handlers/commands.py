@@ -1,6 +1,8 @@
 from telegram import Update
 from telegram.ext import ContextTypes
 import database
+import db_async
+from handlers.conversation import conversation
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -9,10 +11,10 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
     
     # Сохраняем всю информацию о пользователе в базу данных
-    database.save_or_update_user(user, chat_id)
+    await db_async.save_or_update_user(user, chat_id)
     
     # Админы и менеджеры не проходят регистрацию
-    if database.is_admin(user.id) or database.is_manager(user.id):
+    if await db_async.is_admin(user.id) or await db_async.is_manager(user.id):
         from keyboards.main import get_main_keyboard
         await update.message.reply_text(
             "Привет, я бот-фермер, готов помочь тебе!",
@@ -21,8 +23,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return
     
     # Проверяем, зарегистрирован ли пользователь (есть ли телефон)
-    if not database.is_registered(user.id):
-        context.user_data['registering'] = {'step': 'phone'}
+    if not await db_async.is_registered(user.id):
+        await conversation.begin(user.id, 'registering', step='phone')
         await update.message.reply_text(
             "👋 Добро пожаловать!\n\n"
             "Для использования бота нужно пройти регистрацию.\n\n"
@@ -52,7 +54,20 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
 async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /status"""
-    await update.message.reply_text("✅ Бот работает нормально!")
+    text = "✅ Бот работает нормально!"
+    if await db_async.is_admin(update.effective_user.id):
+        # Администраторам показываем работу кэшей в памяти
+        lines = [
+            f"• {s['name']}: попаданий {s['hits']}, промахов {s['misses']}, записей {s['size']}"
+            for s in database.get_cache_stats()
+        ]
+        text += "\n\n🧠 Кэши:\n" + "\n".join(lines)
+        activity = database.get_user_activity_stats()
+        text += (
+            f"\n\n👥 Буфер активности: ждут записи {activity['pending']}, "
+            f"обращений {activity['recorded']}, записано {activity['flushed']}"
+        )
+    await update.message.reply_text(text)
 
 
 async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -60,7 +75,7 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     user_id = update.effective_user.id
     
     # Проверяем права администратора
-    if not database.is_admin(user_id):
+    if not await db_async.is_admin(user_id):
         await update.message.reply_text("❌ У вас нет прав доступа к админ-панели!")
         return
     
@@ -79,7 +94,7 @@ async def manager_panel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     user_id = update.effective_user.id
     
     # Проверяем права менеджера
-    if not database.is_manager(user_id):
+    if not await db_async.is_manager(user_id):
         await update.message.reply_text("❌ У вас нет прав доступа к панели менеджера!")
         return
     
@@ -0,0 +1,123 @@
+"""
+Состояние диалога пользователя.
+
+Когда бот ждет от пользователя текст (телефон и ФИО при покупке, имя
+сессии, номер заказа...), у пользователя одно текущее состояние: имя и
+данные шага. Обработчик текста для состояния регистрируется рядом со своим
+кодом (handlers/messages.py):
+
+    @conversation.state("purchase")
+    async def handle_purchase(update, context, state):
+        state.data['phone_number'] = text
+        await state.save()              # или await state.end()
+
+Диалог начинается в обработчике кнопки или команды:
+
+    await conversation.begin(user_id, "purchase", step="phone", product_id=...)
+
+handle_message читает состояние одним запросом по user_id и вызывает
+обработчик из словаря. Новое состояние заменяет прежнее.
+
+Состояние хранится в БД (таблица conversation_state), поэтому начатая
+покупка переживает перезапуск бота. Без действий пользователя состояние
+истекает через config.CONVERSATION_STATE_TTL секунд; истекшие строки
+удаляет фоновая задача (database.purge_expired_conversation_states).
+Данные состояния хранятся в JSON: только числа, строки, списки и словари.
+Состояние живет до суток, поэтому в нем хранятся ID и ввод пользователя, а
+не данные БД, которые могут измениться (цены, остатки), - их перечитывают.
+"""
+import logging
+from typing import Optional
+
+import db_async
+
+logger = logging.getLogger(__name__)
+
+
+class State:
+    """Текущее состояние диалога пользователя: имя и данные шага"""
+
+    __slots__ = ('user_id', 'name', 'data')
+
+    def __init__(self, user_id: int, name: str, data: Optional[dict] = None):
+        self.user_id = user_id
+        self.name = name
+        self.data = data if data is not None else {}
+
+    @property
+    def step(self):
+        """Шаг диалога (data['step']) или None"""
+        return self.data.get('step')
+
+    async def save(self) -> bool:
+        """Записывает измененные данные состояния (и продлевает срок жизни)"""
+        return await db_async.set_conversation_state(self.user_id, self.name, self.data)
+
+    async def end(self) -> bool:
+        """Завершает диалог"""
+        return await db_async.clear_conversation_state(self.user_id)
+
+    def __repr__(self) -> str:
+        return f"State({self.user_id}, {self.name!r}, {self.data!r})"
+
+
+class Conversation:
+    """Таблица обработчиков текста по состояниям диалога"""
+
+    def __init__(self):
+        self._handlers = {}
+        self.unknown = 0
+
+    def state(self, name: str):
+        """Декоратор: регистрирует обработчик текста для состояния name"""
+        def decorator(handler):
+            if name in self._handlers:
+                raise ValueError(f"Состояние {name} зарегистрировано дважды")
+            self._handlers[name] = handler
+            return handler
+        return decorator
+
+    @property
+    def states(self) -> tuple:
+        """Имена зарегистрированных состояний"""
+        return tuple(self._handlers)
+
+    async def begin(self, user_id: int, name: str, **data) -> State:
+        """Начинает диалог: записывает состояние name с данными data (заменяет прежнее)"""
+        state = State(user_id, name, data)
+        await state.save()
+        return state
+
+    async def get(self, user_id: int) -> Optional[State]:
+        """Текущее состояние пользователя или None"""
+        stored = await db_async.get_conversation_state(user_id)
+        if stored is None:
+            return None
+        return State(user_id, stored['state'], stored['data'])
+
+    async def end(self, user_id: int) -> bool:
+        """Завершает диалог пользователя"""
+        return await db_async.clear_conversation_state(user_id)
+
+    async def dispatch(self, update, context) -> bool:
+        """
+        Передает сообщение обработчику текущего состояния пользователя;
+        False, если диалога нет
+        """
+        user_id = update.effective_user.id
+        state = await self.get(user_id)
+        if state is None:
+            return False
+        handler = self._handlers.get(state.name)
+        if handler is None:
+            # Состояние из БД, для которого в этой версии бота нет обработчика
+            self.unknown += 1
+            logger.warning(f"Нет обработчика для состояния диалога {state.name!r}, диалог завершен")
+            await state.end()
+            return False
+        await handler(update, context, state)
+        return True
+
+
+# Обработчики всех состояний диалогов (регистрируются в handlers/messages.py)
+conversation = Conversation()
@@ -0,0 +1,278 @@
+"""
+Очередь формирования отчетов.
+
+Кнопка отчета не формирует его сама, а ставит задачу в очередь и сразу
+завершается:
+
+    async def build(progress):
+        excel_file = await cpu_pool.run(reports.generate_channel_report_excel, session_id)
+        await progress("⏳ Формирование скриншота...")
+        ...
+        return ReportResult([ReportFile('document', excel_file, caption, filename)], "✅ Готово!")
+
+    await report_jobs.queue.submit(query, f"channel_report_{session_id}", build, "⏳ Формирование отчета...")
+
+- Одинаковые запросы (тот же ключ), пока отчет ждет или формируется, не
+  формируют его заново: нажавший добавляется к получателям задачи.
+- Одновременно формируется не больше config.REPORT_CONCURRENCY отчетов,
+  ждут - не больше config.REPORT_QUEUE_SIZE разных отчетов; при заполненной
+  очереди нажатие отклоняется.
+- Сообщение с кнопкой показывает ход задачи: место в очереди (обновляется,
+  когда очередь сдвигается), этапы формирования (progress), итог.
+- Готовые файлы отправляются всем получателям: первому - загрузкой, остальным
+  - по file_id уже загруженного файла.
+
+Ошибку build получатели видят как "❌ Ошибка при формировании отчета";
+ожидаемые сбои (например, не установлен Playwright) build обрабатывает сам
+и возвращает итоговый текст.
+
+Действие после отправки отчета (закрытие сессии удаляет ее только после
+того, как отчет по ней отправлен) - ReportResult.finish: async функция,
+которая возвращает итоговый текст.
+"""
+import asyncio
+import io
+import logging
+from collections import deque
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+from telegram.error import BadRequest
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class ReportFile(NamedTuple):
+    """Файл отчета: kind - 'document' или 'photo'"""
+    kind: str
+    content: io.BytesIO
+    caption: str
+    filename: Optional[str] = None
+
+
+class ReportResult(NamedTuple):
+    """
+    Результат задачи: файлы для отправки и итоговый текст сообщения с кнопкой.
+    finish - async функция () -> str, выполняется после того, как файлы
+    отправлены хотя бы одному получателю; ее результат - итоговый текст
+    """
+    files: list
+    text: str
+    finish: Optional[Callable[[], Awaitable[str]]] = None
+
+
+class _Job:
+    """Задача очереди: один отчет и все, кто его ждет"""
+
+    __slots__ = ('key', 'build', 'started_text', 'requesters', 'text')
+
+    def __init__(self, key: str, build, started_text: str):
+        self.key = key
+        self.build = build
+        self.started_text = started_text
+        self.requesters = []
+        # Текст, который сейчас показан получателям
+        self.text = None
+
+    def add(self, query) -> bool:
+        """Добавляет получателя; False, если это повторное нажатие той же кнопки"""
+        message = query.message
+        for other in self.requesters:
+            if other.message.chat_id == message.chat_id and other.message.message_id == message.message_id:
+                return False
+        self.requesters.append(query)
+        return True
+
+
+class ReportJobQueue:
+    """Очередь отчетов с объединением одинаковых запросов"""
+
+    _SEND_FAILED_TEXT = "❌ Ошибка при отправке отчета. Попробуйте еще раз."
+
+    def __init__(self, workers: int, max_queued: int):
+        """
+        Параметры:
+            workers - сколько отчетов формируется одновременно
+            max_queued - сколько разных отчетов может ждать в очереди
+        """
+        if workers < 1:
+            raise ValueError("workers должно быть положительным")
+        self._workers = workers
+        self._max_queued = max_queued
+        self._jobs = {}
+        self._queued = deque()
+        self._running = set()
+        self.submitted = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+
+    async def submit(self, query, key: str, build, started_text: str) -> bool:
+        """
+        Ставит отчет key в очередь (или добавляет получателя к такому же отчету).
+        build - async функция (progress) -> ReportResult; started_text - текст
+        сообщения, когда формирование начинается. False - очередь заполнена
+        """
+        job = self._jobs.get(key)
+        if job is not None:
+            if job.add(query):
+                self.coalesced += 1
+            await self._edit(query, job.text or started_text)
+            return True
+        if len(self._queued) >= self._max_queued:
+            self.rejected += 1
+            logger.warning(f"Очередь отчетов заполнена, отчет {key} отклонен")
+            await self._edit(query, "⚠️ Сейчас формируется слишком много отчетов. Попробуйте через минуту.")
+            return False
+        job = self._jobs[key] = _Job(key, build, started_text)
+        job.add(query)
+        self._queued.append(job)
+        self.submitted += 1
+        self._pump()
+        if job in self._queued:
+            job.text = self._position_text(len(self._queued))
+            await self._edit(query, job.text)
+        return True
+
+    @staticmethod
+    def _position_text(position: int) -> str:
+        return (f"🕐 Отчет в очереди, место: {position}.\n"
+                f"Сообщение обновится, когда начнется формирование.")
+
+    def _pump(self):
+        """Запускает ждущие задачи, пока есть свободные места"""
+        while self._queued and len(self._running) < self._workers:
+            job = self._queued.popleft()
+            task = asyncio.create_task(self._run(job))
+            self._running.add(task)
+            task.add_done_callback(self._finished)
+
+    def _finished(self, task):
+        self._running.discard(task)
+        self._pump()
+
+    async def _run(self, job: _Job):
+        await self._show(job, job.started_text)
+        # Очередь сдвинулась - ждущие видят новое место
+        for position, waiting in enumerate(list(self._queued), 1):
+            text = self._position_text(position)
+            if waiting.text != text:
+                await self._show(waiting, text)
+        try:
+            result = await job.build(lambda text: self._show(job, text))
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Ошибка при формировании отчета {job.key}: {e}")
+            self._jobs.pop(job.key, None)
+            await self._show(job, f"❌ Ошибка при формировании отчета: {str(e)}")
+            return
+        # Новые нажатия после этого момента формируют отчет заново (данные могли измениться);
+        # с действием после отправки они присоединяются к задаче, пока оно не выполнено
+        if result.finish is None:
+            self._jobs.pop(job.key, None)
+        try:
+            await self._deliver(job, result)
+        finally:
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+        self.completed += 1
+
+    async def _deliver(self, job: _Job, result: ReportResult):
+        """Отправляет файлы отчета всем получателям (после первой загрузки - по file_id)"""
+        file_ids = [None] * len(result.files)
+        delivered, failed = [], []
+        for query in job.requesters:
+            try:
+                for index, item in enumerate(result.files):
+                    if index:
+                        await asyncio.sleep(0.5)
+                    file_ids[index] = await self._send(query, item, file_ids[index])
+                delivered.append(query)
+            except Exception as e:
+                failed.append(query)
+                logger.error(f"Ошибка при отправке отчета {job.key}: {e}")
+        for query in failed:
+            await self._edit(query, self._SEND_FAILED_TEXT)
+        text = result.text
+        if result.finish is not None:
+            if not delivered:
+                # Отчет никто не получил - действие после отправки не выполняется
+                for query in job.requesters:
+                    if query not in failed:
+                        await self._edit(query, self._SEND_FAILED_TEXT)
+                return
+            try:
+                text = await result.finish()
+            except Exception as e:
+                logger.error(f"Ошибка после отправки отчета {job.key}: {e}")
+                text = f"❌ Отчет отправлен, но произошла ошибка: {str(e)}"
+        for query in job.requesters:
+            # Присоединившиеся во время finish отчет уже не получат, но видят итог
+            if query not in failed:
+                await self._edit(query, text)
+
+    @staticmethod
+    async def _send(query, item: ReportFile, file_id: Optional[str]) -> Optional[str]:
+        """Отправляет файл (загрузкой или по file_id); возвращает file_id для следующих получателей"""
+        if file_id is None:
+            item.content.seek(0)
+        if item.kind == 'photo':
+            message = await query.message.reply_photo(photo=file_id or item.content, caption=item.caption)
+            sent = message.photo[-1].file_id if message.photo else None
+        else:
+            message = await query.message.reply_document(
+                document=file_id or item.content,
+                filename=item.filename,
+                caption=item.caption
+            )
+            sent = message.document.file_id if message.document else None
+        return sent if isinstance(sent, str) else file_id
+
+    async def _show(self, job: _Job, text: str):
+        """Показывает текст хода задачи всем получателям"""
+        job.text = text
+        for query in list(job.requesters):
+            await self._edit(query, text)
+
+    @staticmethod
+    async def _edit(query, text: str):
+        try:
+            await query.edit_message_text(text)
+        except BadRequest as e:
+            if "Message is not modified" not in str(e):
+                logger.warning(f"Не удалось обновить сообщение отчета: {e}")
+        except Exception as e:
+            logger.warning(f"Не удалось обновить сообщение отчета: {e}")
+
+    def stats(self) -> dict:
+        """
+        Снимок очереди: running, queued - формируется и ждет сейчас; submitted -
+        поставлено отчетов, coalesced - нажатий, присоединенных к уже
+        поставленному отчету, rejected - отклонено при заполненной очереди
+        """
+        return {
+            'running': len(self._running),
+            'queued': len(self._queued),
+            'submitted': self.submitted,
+            'coalesced': self.coalesced,
+            'rejected': self.rejected,
+            'completed': self.completed,
+            'failed': self.failed,
+        }
+
+    async def shutdown(self, timeout: float = 5.0):
+        """Прерывает формирование отчетов (при остановке бота); ждет их завершения не дольше timeout секунд"""
+        self._queued.clear()
+        tasks = list(self._running)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            # Запуск браузера для скриншота может не прерываться сразу - остановку бота он не задерживает
+            await asyncio.wait(tasks, timeout=timeout)
+        self._jobs.clear()
+
+
+# Очередь отчетов бота (кнопки отчетов в handlers/routes)
+queue = ReportJobQueue(config.REPORT_CONCURRENCY, config.REPORT_QUEUE_SIZE)
@@ -0,0 +1,201 @@
+"""
+Маршрутизация callback-кнопок.
+
+Обработчик каждой кнопки регистрируется шаблоном callback_data рядом со
+своим кодом (модули handlers/routes):
+
+    @router.route("qty_{product_id:int}_{quantity:int}")
+    async def choose_quantity(update, context, product_id: int, quantity: int):
+        ...
+
+Шаблон без аргументов - точное совпадение (словарь). Шаблон с аргументами
+- префикс до первого аргумента (префиксное дерево): выбирается самый
+длинный подходящий префикс, поэтому "admin_confirm_delete_order_5" не
+попадает в обработчик "admin_confirm_delete_{product_id:int}". Поиск -
+один проход по строке callback_data, без перебора маршрутов.
+
+Аргументы - остаток после префикса, разделенный "_" (последний аргумент
+забирает остаток целиком). Типы: int и str (по умолчанию).
+
+router.admin(...) - маршрут только для администраторов. Для каждого
+маршрута считаются вызовы, ошибки и время выполнения (stats()).
+
+Долгие обработчики (отчеты) не выполняют работу сами, а ставят ее в
+очередь handlers/report_jobs.py.
+"""
+import re
+import time
+import logging
+from typing import Optional
+
+import db_async
+
+logger = logging.getLogger(__name__)
+
+_CONVERTERS = {'int': int, 'str': str}
+_ARGUMENT = re.compile(r"\{(\w+)(?::(\w+))?\}")
+
+
+class Route:
+    """Маршрут: шаблон callback_data, обработчик и его статистика"""
+
+    __slots__ = ('pattern', 'prefix', 'args', 'handler', 'admin_only',
+                 'calls', 'errors', 'total_time', 'max_time')
+
+    def __init__(self, pattern: str, handler, admin_only: bool = False):
+        self.pattern = pattern
+        self.handler = handler
+        self.admin_only = admin_only
+        arguments = list(_ARGUMENT.finditer(pattern))
+        self.prefix = pattern[:arguments[0].start()] if arguments else pattern
+        self.args = []
+        rest = self.prefix
+        for i, match in enumerate(arguments):
+            name, kind = match.group(1), match.group(2) or 'str'
+            if kind not in _CONVERTERS:
+                raise ValueError(f"Неизвестный тип аргумента {kind} в шаблоне {pattern}")
+            self.args.append((name, _CONVERTERS[kind]))
+            rest += match.group(0)
+            end = arguments[i + 1].start() if i + 1 < len(arguments) else len(pattern)
+            separator = pattern[match.end():end]
+            if i + 1 < len(arguments) and separator != '_' or i + 1 == len(arguments) and separator:
+                raise ValueError(f"Аргументы шаблона {pattern} должны разделяться '_' и стоять в конце")
+            rest += separator
+        self.args = tuple(self.args)
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def parse(self, data: str) -> Optional[dict]:
+        """Аргументы из callback_data (начинается с prefix) или None, если они не разбираются"""
+        rest = data[len(self.prefix):]
+        parts = rest.split('_', len(self.args) - 1)
+        if len(parts) != len(self.args):
+            return None
+        try:
+            return {name: convert(part) for (name, convert), part in zip(self.args, parts)}
+        except ValueError:
+            return None
+
+    def stats(self) -> dict:
+        return {
+            'pattern': self.pattern,
+            'calls': self.calls,
+            'errors': self.errors,
+            'total_time': round(self.total_time, 4),
+            'avg_time': round(self.total_time / self.calls, 4) if self.calls else 0.0,
+            'max_time': round(self.max_time, 4),
+        }
+
+
+class CallbackRouter:
+    """Таблица маршрутов callback-кнопок"""
+
+    def __init__(self):
+        self.routes = []
+        self._exact = {}
+        # Префиксное дерево: символ -> узел; в узле под ключом None - маршрут
+        self._trie = {}
+        self.unmatched = 0
+
+    def add(self, pattern: str, handler, admin_only: bool = False) -> Route:
+        """Регистрирует обработчик; повтор шаблона или префикса - ValueError (маршрут был бы недостижим)"""
+        route = Route(pattern, handler, admin_only)
+        if route.args:
+            node = self._trie
+            for char in route.prefix:
+                node = node.setdefault(char, {})
+            if None in node:
+                raise ValueError(f"Маршрут {pattern} недостижим: префикс уже занят {node[None].pattern}")
+            node[None] = route
+        else:
+            if pattern in self._exact:
+                raise ValueError(f"Маршрут {pattern} зарегистрирован дважды")
+            self._exact[pattern] = route
+        self.routes.append(route)
+        return route
+
+    def route(self, pattern: str, admin_only: bool = False):
+        """Декоратор: регистрирует обработчик кнопки по шаблону callback_data"""
+        def decorator(handler):
+            self.add(pattern, handler, admin_only)
+            return handler
+        return decorator
+
+    def admin(self, pattern: str):
+        """Декоратор маршрута только для администраторов"""
+        return self.route(pattern, admin_only=True)
+
+    def resolve(self, data: str):
+        """(маршрут, аргументы) для callback_data или (None, None)"""
+        route = self._exact.get(data)
+        if route is not None:
+            return route, {}
+        best = None
+        node = self._trie
+        for char in data:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                best = node[None]
+        if best is None:
+            return None, None
+        args = best.parse(data)
+        if args is None:
+            return None, None
+        return best, args
+
+    async def dispatch(self, update, context) -> bool:
+        """Выполняет обработчик кнопки; False, если для callback_data нет маршрута"""
+        query = update.callback_query
+        await query.answer()
+        route, args = self.resolve(query.data or '')
+        if route is None:
+            self.unmatched += 1
+            logger.warning(f"Нет обработчика для кнопки {query.data!r}")
+            return False
+        if route.admin_only and not await db_async.is_admin(update.effective_user.id):
+            await query.answer("❌ У вас нет прав доступа!", show_alert=True)
+            return True
+        await self._run(route, update, context, args)
+        return True
+
+    @staticmethod
+    async def _run(route: Route, update, context, args: dict):
+        started = time.perf_counter()
+        try:
+            await route.handler(update, context, **args)
+        except Exception:
+            route.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            route.calls += 1
+            route.total_time += elapsed
+            route.max_time = max(route.max_time, elapsed)
+
+    def check(self) -> list:
+        """
+        Проверка таблицы маршрутов при запуске: список пересечений, где
+        один префикс продолжает другой (выбирается более длинный)
+        """
+        problems = []
+        prefixes = sorted((route for route in self.routes if route.args), key=lambda r: r.prefix)
+        for route in prefixes:
+            for other in self.routes:
+                if other is route:
+                    continue
+                key = other.prefix if other.args else other.pattern
+                if key.startswith(route.prefix) and key != route.prefix:
+                    problems.append(f"{other.pattern} перекрывает {route.pattern}")
+        return problems
+
+    def stats(self) -> list:
+        """Статистика маршрутов, от самых затратных по суммарному времени"""
+        return sorted((route.stats() for route in self.routes), key=lambda s: -s['total_time'])
+
+
+# Маршруты всех кнопок бота (регистрируются модулями handlers/routes)
+router = CallbackRouter()
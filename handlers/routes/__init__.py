@@ -0,0 +1,6 @@
+"""
+Обработчики callback-кнопок, по модулю на раздел бота.
+
+Импорт пакета регистрирует все маршруты в handlers.router.router.
+"""
+from handlers.routes import main, purchase, admin, order_edit, manager, reports
@@ -0,0 +1,419 @@
+"""Кнопки админ-панели: сессии, товары, торговля, лимит, администраторы и менеджеры, закрытие сессии."""
+from telegram import Update
+from telegram.ext import ContextTypes
+import cpu_pool
+import database
+import db_async
+import logging
+from datetime import datetime
+from handlers.router import router
+from handlers.conversation import conversation
+from handlers import report_jobs
+from handlers.report_jobs import ReportFile, ReportResult
+
+logger = logging.getLogger(__name__)
+
+
+@router.admin("admin_add_session")
+async def handle_admin_add_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Запрашиваем имя сессии"""
+    query = update.callback_query
+    await conversation.begin(update.effective_user.id, 'creating_session', step='name')
+    await query.edit_message_text(
+        "➕ Добавить сессию\n\n"
+        "Введите имя новой сессии:"
+    )
+
+
+@router.admin("admin_limit_per_person")
+async def handle_admin_limit_per_person(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Запрашиваем лимит на человека"""
+    query = update.callback_query
+    await conversation.begin(update.effective_user.id, 'limit_per_person')
+    current_limit = database.get_limit_per_person()
+    limit_text = f"\nТекущий лимит: {current_limit} ящиков" if current_limit > 0 else ""
+    await query.edit_message_text(
+        f"👤 Лимит на человека{limit_text}\n\n"
+        f"Какой лимит установить на одного человека?\n"
+        f"Введите число (0 - без ограничений):"
+    )
+
+
+@router.admin("admin_add_product")
+async def handle_admin_add_product(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показываем список сессий для выбора"""
+    query = update.callback_query
+    from keyboards.sessions_admin import get_sessions_keyboard_for_admin
+    sessions_keyboard = await db_async.run(get_sessions_keyboard_for_admin, "add_product")
+    await query.edit_message_text(
+        "➕ Добавить товар\n\n"
+        "Выберите сессию для добавления товара:",
+        reply_markup=sessions_keyboard
+    )
+
+
+@router.admin("admin_select_session_add_product_{session_id:int}")
+async def handle_admin_select_session_add_product(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int) -> None:
+    """Админ выбрал сессию для добавления товара"""
+    query = update.callback_query
+    session = await db_async.get_session(session_id)
+    if session:
+        await conversation.begin(update.effective_user.id, 'adding_product', session_id=session_id, step='name')
+        await query.edit_message_text(
+            f"✅ Выбрана сессия: {session['session_name']}\n\n"
+            f"Введите название товара:"
+        )
+    else:
+        await query.answer("❌ Сессия не найдена!", show_alert=True)
+
+
+@router.admin("admin_delete_product")
+async def handle_admin_delete_product(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показываем список сессий для выбора"""
+    query = update.callback_query
+    from keyboards.sessions_admin import get_sessions_keyboard_for_admin
+    sessions_keyboard = await db_async.run(get_sessions_keyboard_for_admin, "delete_product")
+    await query.edit_message_text(
+        "➖ Удалить товар\n\n"
+        "Выберите сессию:",
+        reply_markup=sessions_keyboard
+    )
+
+
+@router.admin("admin_select_session_delete_product_{session_id:int}")
+async def handle_admin_select_session_delete_product(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int) -> None:
+    """Админ выбрал сессию для удаления товара"""
+    query = update.callback_query
+    session = await db_async.get_session(session_id)
+    if session:
+        products = await db_async.get_products_by_session(session_id)
+        if products:
+            from keyboards.products_admin import get_products_keyboard_for_admin
+            products_keyboard = await db_async.run(get_products_keyboard_for_admin, session_id, "delete")
+            await query.edit_message_text(
+                f"✅ Выбрана сессия: {session['session_name']}\n\n"
+                f"Выберите товар для удаления:",
+                reply_markup=products_keyboard
+            )
+        else:
+            await query.edit_message_text(
+                f"✅ Выбрана сессия: {session['session_name']}\n\n"
+                f"В этой сессии нет товаров для удаления."
+            )
+    else:
+        await query.answer("❌ Сессия не найдена!", show_alert=True)
+
+
+@router.admin("admin_select_product_delete_{product_id:int}")
+async def handle_admin_select_product_delete(update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int) -> None:
+    """Админ выбрал товар для удаления"""
+    query = update.callback_query
+    product = await db_async.get_product(product_id)
+    if product:
+        from keyboards.products_admin import get_confirm_delete_keyboard
+        confirm_keyboard = get_confirm_delete_keyboard(product_id)
+        await query.edit_message_text(
+            f"⚠️ Вы уверены, что хотите удалить товар?\n\n"
+            f"Товар: {product['product_name']}\n"
+            f"Цена: {product['price']}₽\n"
+            f"Ящиков: {product['boxes_count']}",
+            reply_markup=confirm_keyboard
+        )
+    else:
+        await query.answer("❌ Товар не найден!", show_alert=True)
+
+
+@router.admin("admin_confirm_delete_{product_id:int}")
+async def handle_admin_confirm_delete(update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int) -> None:
+    """Подтверждение удаления товара"""
+    query = update.callback_query
+    product = await db_async.get_product(product_id)
+    if product:
+        product_name = product['product_name']
+        if await db_async.delete_product(product_id):
+            await query.edit_message_text(
+                f"✅ Товар '{product_name}' успешно удален!"
+            )
+        else:
+            await query.edit_message_text(
+                f"❌ Ошибка при удалении товара!"
+            )
+    else:
+        await query.answer("❌ Товар не найден!", show_alert=True)
+
+
+@router.admin("admin_start_trading")
+async def handle_admin_start_trading(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показываем список сессий для запуска торговли"""
+    query = update.callback_query
+    from keyboards.sessions_admin import get_sessions_keyboard_for_admin
+    sessions_keyboard = await db_async.run(get_sessions_keyboard_for_admin, "start_trading")
+    await query.edit_message_text(
+        "▶️ Старт торги\n\n"
+        "Выберите сессию для запуска торговли:",
+        reply_markup=sessions_keyboard
+    )
+
+
+@router.admin("admin_stop_trading")
+async def handle_admin_stop_trading(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показываем список сессий для остановки торговли"""
+    query = update.callback_query
+    from keyboards.sessions_admin import get_sessions_keyboard_for_admin
+    sessions_keyboard = await db_async.run(get_sessions_keyboard_for_admin, "stop_trading")
+    await query.edit_message_text(
+        "⏹️ Стоп торги\n\n"
+        "Выберите сессию для остановки торговли:",
+        reply_markup=sessions_keyboard
+    )
+
+
+@router.admin("admin_select_session_start_trading_{session_id:int}")
+async def handle_admin_select_session_start_trading(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int) -> None:
+    """Админ выбрал сессию для запуска торговли"""
+    query = update.callback_query
+    session = await db_async.get_session(session_id)
+    if session:
+        if await db_async.set_session_trading_status(session_id, True):
+            await query.edit_message_text(
+                f"✅ Торговля для сессии '{session['session_name']}' успешно запущена!\n\n"
+                f"Теперь пользователи могут выбирать товары из этой сессии."
+            )
+        else:
+            await query.edit_message_text(
+                f"❌ Ошибка при запуске торговли для сессии '{session['session_name']}'!"
+            )
+    else:
+        await query.answer("❌ Сессия не найдена!", show_alert=True)
+
+
+@router.admin("admin_select_session_stop_trading_{session_id:int}")
+async def handle_admin_select_session_stop_trading(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int) -> None:
+    """Админ выбрал сессию для остановки торговли"""
+    query = update.callback_query
+    session = await db_async.get_session(session_id)
+    if session:
+        if await db_async.set_session_trading_status(session_id, False):
+            await query.edit_message_text(
+                f"✅ Торговля для сессии '{session['session_name']}' успешно остановлена!\n\n"
+                f"Пользователи больше не могут выбирать товары из этой сессии."
+            )
+        else:
+            await query.edit_message_text(
+                f"❌ Ошибка при остановке торговли для сессии '{session['session_name']}'!"
+            )
+    else:
+        await query.answer("❌ Сессия не найдена!", show_alert=True)
+
+
+@router.admin("admin_change_box_volume")
+async def handle_admin_change_box_volume(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показываем список сессий для выбора"""
+    query = update.callback_query
+    from keyboards.sessions_admin import get_sessions_keyboard_for_admin
+    sessions_keyboard = await db_async.run(get_sessions_keyboard_for_admin, "change_box_volume")
+    await query.edit_message_text(
+        "📦 Изменить объем ящика\n\n"
+        "Выберите сессию:",
+        reply_markup=sessions_keyboard
+    )
+
+
+@router.admin("admin_select_session_change_box_volume_{session_id:int}")
+async def handle_admin_select_session_change_box_volume(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int) -> None:
+    """Админ выбрал сессию для изменения объема ящика"""
+    query = update.callback_query
+    session = await db_async.get_session(session_id)
+    if session:
+        products = await db_async.get_products_by_session(session_id)
+        if products:
+            from keyboards.products_admin import get_products_keyboard_for_admin
+            products_keyboard = await db_async.run(get_products_keyboard_for_admin, session_id, "change_box_volume")
+            await query.edit_message_text(
+                f"✅ Выбрана сессия: {session['session_name']}\n\n"
+                f"Выберите товар для изменения количества ящиков:",
+                reply_markup=products_keyboard
+            )
+        else:
+            await query.edit_message_text(
+                f"✅ Выбрана сессия: {session['session_name']}\n\n"
+                f"В этой сессии нет товаров."
+            )
+    else:
+        await query.answer("❌ Сессия не найдена!", show_alert=True)
+
+
+@router.admin("admin_select_product_change_box_volume_{product_id:int}")
+async def handle_admin_select_product_change_box_volume(update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int) -> None:
+    """Админ выбрал товар для изменения объема ящика"""
+    query = update.callback_query
+    product = await db_async.get_product(product_id)
+    if product:
+        await conversation.begin(
+            update.effective_user.id, 'changing_box_volume',
+            product_id=product_id,
+            current_boxes=product['boxes_count']
+        )
+        await query.edit_message_text(
+            f"📦 Изменить количество ящиков\n\n"
+            f"Товар: {product['product_name']}\n"
+            f"Текущее количество ящиков: {product['boxes_count']}\n\n"
+            f"Введите новое количество ящиков:"
+        )
+    else:
+        await query.answer("❌ Товар не найден!", show_alert=True)
+
+
+@router.admin("admin_add_admin")
+async def handle_admin_add_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Запрос ID пользователя для добавления в администраторы"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    if await db_async.is_admin(user_id):
+        await conversation.begin(user_id, 'adding_admin')
+        await query.edit_message_text(
+            "👤 Назначить администратора\n\n"
+            "Введите ID пользователя для добавления в администраторы:"
+        )
+    else:
+        await query.answer("❌ У вас нет прав для назначения администраторов!", show_alert=True)
+
+
+@router.admin("admin_remove_admin")
+async def handle_admin_remove_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показываем список администраторов для удаления"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    if await db_async.is_admin(user_id):
+        from keyboards.admins_admin import get_admins_keyboard
+        admins_keyboard = await db_async.run(get_admins_keyboard, "remove")
+        await query.edit_message_text(
+            "👤 Снять администратора\n\n"
+            "Выберите администратора для снятия:",
+            reply_markup=admins_keyboard
+        )
+    else:
+        await query.answer("❌ У вас нет прав для снятия администраторов!", show_alert=True)
+
+
+@router.admin("admin_remove_admin_{admin_id:int}")
+async def handle_admin_remove_admin_selected(update: Update, context: ContextTypes.DEFAULT_TYPE, admin_id: int) -> None:
+    """Удаление администратора"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    # Нельзя удалить самого себя
+    if admin_id == user_id:
+        await query.answer("❌ Вы не можете удалить самого себя!", show_alert=True)
+        return
+    
+    if await db_async.remove_admin(admin_id):
+        await query.edit_message_text(
+            f"✅ Администратор с ID {admin_id} успешно снят!"
+        )
+    else:
+        await query.edit_message_text(
+            f"❌ Ошибка при снятии администратора. Возможно, он не является администратором."
+        )
+
+
+@router.admin("admin_add_manager")
+async def handle_admin_add_manager(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Запрашиваем ID пользователя для добавления менеджера"""
+    query = update.callback_query
+    await conversation.begin(update.effective_user.id, 'adding_manager')
+    await query.edit_message_text(
+        "👔 Добавить менеджера\n\n"
+        "Введите ID пользователя, которого хотите назначить менеджером:"
+    )
+
+
+@router.admin("admin_remove_manager")
+async def handle_admin_remove_manager(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показываем список менеджеров для удаления"""
+    query = update.callback_query
+    managers = await db_async.get_managers()
+    
+    if managers:
+        from keyboards.managers_admin import get_managers_keyboard
+        managers_keyboard = await db_async.run(get_managers_keyboard, "remove")
+        managers_text = "\n".join([
+            f"• {m['first_name']} (@{m['username'] if m['username'] else 'нет'}) - ID: {m['user_id']}"
+            for m in managers
+        ])
+        await query.edit_message_text(
+            f"🔻 Снять менеджера\n\n"
+            f"Выберите менеджера для удаления:\n\n{managers_text}",
+            reply_markup=managers_keyboard
+        )
+    else:
+        await query.edit_message_text("❌ Менеджеры не найдены!")
+
+
+@router.admin("admin_remove_manager_{manager_id:int}")
+async def handle_admin_remove_manager_selected(update: Update, context: ContextTypes.DEFAULT_TYPE, manager_id: int) -> None:
+    """Удаление менеджера"""
+    query = update.callback_query
+    if await db_async.remove_manager(manager_id):
+        await query.edit_message_text(f"✅ Менеджер с ID {manager_id} успешно удален!")
+    else:
+        await query.edit_message_text(f"❌ Ошибка при удалении менеджера!")
+
+
+@router.admin("admin_close_session")
+async def handle_admin_close_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показываем список всех сессий для закрытия"""
+    query = update.callback_query
+    from keyboards.sessions_admin import get_sessions_keyboard_for_admin
+    sessions_keyboard = await db_async.run(get_sessions_keyboard_for_admin, "close_session")
+    all_sessions = await db_async.get_all_sessions()
+    if all_sessions:
+        await query.edit_message_text(
+            "🗑️ Закрыть сессию\n\n"
+            "Выберите сессию для закрытия (будет сформирован отчет и сессия будет удалена):",
+            reply_markup=sessions_keyboard
+        )
+    else:
+        await query.edit_message_text("❌ Нет сессий для закрытия!")
+
+
+@router.admin("admin_select_session_close_session_{session_id:int}")
+async def handle_admin_select_session_close_session(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int) -> None:
+    """Закрытие сессии с генерацией отчета"""
+    query = update.callback_query
+    session = await db_async.get_session(session_id)
+    
+    if session:
+        session_name = session['session_name']
+
+        async def build(progress):
+            # Генерируем Excel отчет
+            import reports
+            excel_file = await cpu_pool.run(reports.generate_session_report_excel, session_id)
+            files = [ReportFile(
+                'document', excel_file, f"📊 Полный отчет по сессии: {session_name}",
+                f"Отчет_Сессия_{session_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+            )]
+            return ReportResult(files, "", finish=close)
+
+        async def close():
+            # Удаляем сессию, когда отчет уже отправлен
+            if await db_async.delete_session(session_id):
+                return (f"✅ Сессия '{session_name}' успешно закрыта и удалена!\n\n"
+                        f"Отчет отправлен выше.")
+            return "⚠️ Отчет сформирован, но произошла ошибка при удалении сессии."
+
+        await report_jobs.queue.submit(query, f"close_session_{session_id}", build, "⏳ Формирование отчета...")
+    else:
+        await query.answer("❌ Сессия не найдена!", show_alert=True)
+
+
+@router.admin("admin_back")
+async def handle_admin_back(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Возврат к главной админ-панели"""
+    query = update.callback_query
+    from keyboards.admin import get_admin_keyboard
+    await query.edit_message_text(
+        "🔹 Админ-панель 🔹\n\n"
+        "Выберите необходимое действие:",
+        reply_markup=get_admin_keyboard()
+    )
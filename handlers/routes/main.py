@@ -0,0 +1,331 @@
+"""Кнопки главного меню и личного кабинета (callback_data main_*, cabinet_*)."""
+from telegram import Update
+from telegram.ext import ContextTypes
+import database
+import db_async
+from handlers.router import router
+from handlers.conversation import conversation
+
+
+@router.route("main_menu")
+async def handle_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Главное меню"""
+    query = update.callback_query
+    from keyboards.main import get_main_keyboard
+    await query.edit_message_text(
+        "Привет, я бот-фермер, готов помочь тебе!",
+        reply_markup=get_main_keyboard()
+    )
+
+
+@router.route("main_buy")
+async def handle_main_buy(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Переход к покупкам — нужна регистрация (телефон в профиле)"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    if not await db_async.is_admin(user_id) and not await db_async.is_manager(user_id) and not await db_async.is_registered(user_id):
+        await query.answer("❌ Сначала пройдите регистрацию: /start", show_alert=True)
+        return
+    # Показываем список сессий
+    from keyboards.sessions import get_sessions_keyboard
+    sessions_keyboard = await db_async.run(get_sessions_keyboard)
+    sessions = await db_async.get_all_sessions()
+    
+    if sessions:
+        lines = []
+        for s in sessions:
+            name = s.get("session_name", "")
+            desc = (s.get("description") or "").strip()
+            if desc:
+                lines.append(f"• {name}\n  {desc}")
+            else:
+                lines.append(f"• {name}")
+        sessions_text = "\n\n".join(lines)
+        await query.edit_message_text(
+            f"🛒 Выберите сессию для покупки:\n\n{sessions_text}",
+            reply_markup=sessions_keyboard
+        )
+    else:
+        await query.edit_message_text(
+            "❌ В данный момент нет доступных сессий для покупки.",
+            reply_markup=sessions_keyboard
+        )
+
+
+@router.route("main_cabinet")
+async def handle_main_cabinet(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Личный кабинет — для незарегистрированных показываем предложение зарегистрироваться"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    if not await db_async.is_admin(user_id) and not await db_async.is_manager(user_id) and not await db_async.is_registered(user_id):
+        from keyboards.main import get_back_to_start_keyboard
+        await query.edit_message_text(
+            "👤 Личный кабинет\n\n"
+            "Для входа в личный кабинет нужно пройти регистрацию.\n\n"
+            "Нажмите /start и введите номер телефона и ФИО.",
+            reply_markup=get_back_to_start_keyboard()
+        )
+        return
+    from keyboards.cabinet import get_cabinet_keyboard
+    stats = await db_async.get_user_statistics(user_id)
+    info = await db_async.get_user_info(user_id)
+    phone = (info or {}).get('phone_number') or '—'
+    full_name = (info or {}).get('full_name') or '—'
+    await query.edit_message_text(
+        f"👤 Личный кабинет\n\n"
+        f"📱 Телефон: {phone}\n"
+        f"👤 ФИО: {full_name}\n\n"
+        f"📊 Статистика:\n"
+        f"• Куплено ящиков: {stats['total_boxes']}\n"
+        f"• Выдано заказов: {stats['completed_orders']}\n"
+        f"• Ожидает обработки: {stats['pending_orders']}\n"
+        f"• Общая сумма: {stats['total_amount']:.2f}₽\n\n"
+        f"Выберите действие:",
+        reply_markup=get_cabinet_keyboard()
+    )
+
+
+@router.route("main_orders")
+async def handle_main_orders(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Заказы — показываем только не выданные заказы (как корзина)"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    if not await db_async.is_admin(user_id) and not await db_async.is_manager(user_id) and not await db_async.is_registered(user_id):
+        from keyboards.main import get_back_to_start_keyboard
+        await query.edit_message_text(
+            "📋 Заказы\n\n"
+            "Для просмотра заказов нужно пройти регистрацию.\n\n"
+            "Нажмите /start и введите номер телефона и ФИО.",
+            reply_markup=get_back_to_start_keyboard()
+        )
+        return
+    
+    # Получаем только не выданные заказы пользователя
+    pending_orders = await db_async.get_user_pending_orders(user_id)
+    
+    # Фильтруем заказы, у которых сессия существует
+    valid_orders = []
+    for order in pending_orders:
+        session = await db_async.get_session(order['session_id'])
+        if session:
+            valid_orders.append(order)
+    
+    from handlers.callbacks import safe_edit_message_text
+    if valid_orders:
+        from keyboards.cabinet import get_cart_sessions_keyboard
+        # Используем ту же клавиатуру, что и для корзины, но с возвратом в главное меню
+        orders_keyboard = get_cart_sessions_keyboard(valid_orders, back_callback="main_menu")
+        
+        # Группируем по сессиям для отображения
+        sessions_dict = {}
+        for order in valid_orders:
+            session_id = order['session_id']
+            if session_id not in sessions_dict:
+                sessions_dict[session_id] = {
+                    'session_name': order['session_name'],
+                    'orders': []
+                }
+            sessions_dict[session_id]['orders'].append(order)
+        
+        orders_text = "📋 Ваши заказы\n\n"
+        orders_text += "Не выданные заказы по сессиям:\n\n"
+        
+        for session_id, session_data in sessions_dict.items():
+            orders_text += f"📦 {session_data['session_name']}:\n"
+            for order in session_data['orders']:
+                # Показываем номер заказа (из таблицы) и код заказа (основной номер)
+                table_number = order.get('session_order_number', '—')
+                order_code = order['order_number']
+                # Заменяем "Ожидает обработки" на "Активен"
+                status_display = database.get_order_status_ru(order['status'])
+                if status_display == "Ожидает обработки":
+                    status_display = "Активен"
+                orders_text += f"  • Заказ №{table_number} (код: {order_code}) - {status_display}\n"
+                orders_text += f"    Товары: {order['items']}\n"
+                orders_text += f"    Сумма: {order['total_amount']:.2f}₽\n\n"
+        
+        await safe_edit_message_text(
+            query,
+            orders_text,
+            reply_markup=orders_keyboard
+        )
+    else:
+        from keyboards.main import get_main_keyboard
+        main_keyboard = get_main_keyboard()
+        await safe_edit_message_text(
+            query,
+            "📋 Ваши заказы\n\n"
+            "У вас нет не выданных заказов.",
+            reply_markup=main_keyboard
+        )
+
+
+@router.route("cabinet_edit_profile")
+async def handle_cabinet_edit_profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Редактирование телефона и ФИО"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    await conversation.begin(user_id, 'editing_profile', step='phone')
+    await query.edit_message_text(
+        "✏️ Изменение контактов\n\n"
+        "📱 Введите новый номер телефона (например: +79991234567):"
+    )
+
+
+@router.route("cabinet_cart")
+async def handle_cabinet_cart(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Корзина со всеми незавершенными заказами"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    pending_orders = await db_async.get_user_pending_orders(user_id)
+    
+    # Фильтруем заказы, у которых сессия существует
+    valid_orders = []
+    for order in pending_orders:
+        session = await db_async.get_session(order['session_id'])
+        if session:
+            valid_orders.append(order)
+    
+    if valid_orders:
+        from keyboards.cabinet import get_cart_sessions_keyboard
+        cart_keyboard = get_cart_sessions_keyboard(valid_orders)
+        
+        # Группируем по сессиям для отображения
+        sessions_dict = {}
+        for order in valid_orders:
+            session_id = order['session_id']
+            if session_id not in sessions_dict:
+                sessions_dict[session_id] = {
+                    'session_name': order['session_name'],
+                    'orders': []
+                }
+            sessions_dict[session_id]['orders'].append(order)
+        
+        cart_text = "🛒 Ваша корзина\n\n"
+        cart_text += "Незавершенные заказы по сессиям:\n\n"
+        
+        for session_id, session_data in sessions_dict.items():
+            cart_text += f"📦 {session_data['session_name']}:\n"
+            for order in session_data['orders']:
+                # Показываем номер заказа (из таблицы) и код заказа (основной номер)
+                table_number = order.get('session_order_number', '—')
+                order_code = order['order_number']
+                # Заменяем "Ожидает обработки" на "Активен"
+                status_display = database.get_order_status_ru(order['status'])
+                if status_display == "Ожидает обработки":
+                    status_display = "Активен"
+                cart_text += f"  • Заказ №{table_number} (код: {order_code}) - {status_display}\n"
+                cart_text += f"    Товары: {order['items']}\n"
+                cart_text += f"    Сумма: {order['total_amount']:.2f}₽\n\n"
+        
+        await query.edit_message_text(
+            cart_text,
+            reply_markup=cart_keyboard
+        )
+    else:
+        from keyboards.cabinet import get_cabinet_keyboard
+        cabinet_keyboard = get_cabinet_keyboard()
+        await query.edit_message_text(
+            "🛒 Ваша корзина\n\n"
+            "У вас нет незавершенных заказов.",
+            reply_markup=cabinet_keyboard
+        )
+
+
+@router.route("cabinet_cart_session_{session_id:int}")
+async def handle_cabinet_cart_session(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int) -> None:
+    """Заказы конкретной сессии (используется и для корзины, и для заказов)"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    # Проверяем, существует ли сессия
+    session = await db_async.get_session(session_id)
+    if not session:
+        await query.answer("❌ Сессия не найдена!", show_alert=True)
+        return
+    
+    # Получаем не выданные заказы пользователя в этой сессии
+    pending_orders = await db_async.get_user_pending_orders(user_id)
+    session_orders = [o for o in pending_orders if o['session_id'] == session_id]
+    
+    if session_orders:
+        from keyboards.cabinet import get_cart_orders_keyboard
+        # Определяем callback для возврата - если есть незавершенные заказы, возвращаемся в корзину, иначе в заказы
+        has_pending_in_session = len(session_orders) > 0
+        back_callback = "cabinet_cart" if has_pending_in_session else "main_orders"
+        
+        orders_keyboard = get_cart_orders_keyboard(session_id, session_orders, back_callback)
+        
+        session_name = session['session_name']
+        orders_text = f"📦 {session_name}\n\n"
+        orders_text += "Ваши заказы:\n\n"
+        
+        for order in session_orders:
+            # Показываем номер заказа (из таблицы) и код заказа (основной номер)
+            table_number = order.get('session_order_number', '—')
+            order_code = order['order_number']
+            # Заменяем "Ожидает обработки" на "Активен"
+            status_display = database.get_order_status_ru(order['status'])
+            if status_display == "Ожидает обработки":
+                status_display = "Активен"
+            orders_text += f"Заказ №{table_number} (код: {order_code}) - {status_display}\n"
+            orders_text += f"Товары: {order['items']}\n"
+            orders_text += f"Сумма: {order['total_amount']:.2f}₽\n"
+            orders_text += f"Дата: {order['created_at']}\n\n"
+        
+        await query.edit_message_text(
+            orders_text,
+            reply_markup=orders_keyboard
+        )
+    else:
+        await query.answer("❌ Заказы не найдены!", show_alert=True)
+
+
+@router.route("cabinet_order_{order_id:int}")
+async def handle_cabinet_order(update: Update, context: ContextTypes.DEFAULT_TYPE, order_id: int) -> None:
+    """Детали конкретного заказа"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    order = await db_async.get_order(order_id)
+    
+    if order and order['user_id'] == user_id:
+        # Проверяем, существует ли сессия
+        session = await db_async.get_session(order['session_id'])
+        if not session:
+            await query.answer("❌ Сессия заказа не найдена!", show_alert=True)
+            return
+        
+        order_items = await db_async.get_order_items(order_id)
+        
+        items_text = "\n".join([
+            f"• {item['product_name']} x{item['quantity']} = {item['quantity'] * item['price']:.2f}₽"
+            for item in order_items
+        ])
+        
+        from keyboards.cabinet import get_cart_orders_keyboard
+        # Получаем не выданные заказы сессии для клавиатуры
+        pending_orders = await db_async.get_user_pending_orders(user_id)
+        session_orders = [o for o in pending_orders if o['session_id'] == order['session_id']]
+        
+        # Определяем callback для возврата - если есть незавершенные заказы, возвращаемся в корзину, иначе в заказы
+        has_pending_in_session = len(session_orders) > 0
+        back_callback = "cabinet_cart" if has_pending_in_session else "main_orders"
+        back_keyboard = get_cart_orders_keyboard(order['session_id'], session_orders, back_callback)
+        
+        # Показываем номер заказа (из таблицы) и код заказа (основной номер)
+        table_number = order.get('session_order_number', '—')
+        order_code = order['order_number']
+        order_num_display = f"№{table_number} (код: {order_code})"
+        
+        await query.edit_message_text(
+            f"📋 Заказ {order_num_display}\n\n"
+            f"📦 Сессия: {session['session_name']}\n"
+            f"👤 ФИО: {order['full_name']}\n"
+            f"📱 Телефон: {order['phone_number']}\n"
+            f"📊 Статус: {database.get_order_status_ru(order['status'])}\n"
+            f"📅 Дата: {order['created_at']}\n\n"
+            f"Товары:\n{items_text}\n\n"
+            f"💰 Общая сумма: {order['total_amount']:.2f}₽",
+            reply_markup=back_keyboard
+        )
+    else:
+        await query.answer("❌ Заказ не найден!", show_alert=True)
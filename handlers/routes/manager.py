@@ -0,0 +1,292 @@
+"""
+Кнопки панели менеджера: поиск и выдача заказов, уведомления, статусы заказов.
+
+Как и остальные кнопки панелей, доступны только администраторам (router.admin).
+"""
+from telegram import Update
+from telegram.ext import ContextTypes
+import database
+import db_async
+import logging
+from handlers.router import router
+from handlers.conversation import conversation
+from handlers import report_jobs
+from handlers.report_jobs import ReportFile, ReportResult
+
+logger = logging.getLogger(__name__)
+
+
+@router.admin("manager_find_order")
+async def handle_manager_find_order(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Сначала выбираем сессию"""
+    query = update.callback_query
+    from keyboards.sessions_admin import get_sessions_keyboard_for_admin
+    sessions_keyboard = await db_async.run(get_sessions_keyboard_for_admin, "find_order", back_callback="manager_back")
+    await query.edit_message_text(
+        "🔍 Найти заказ\n\n"
+        "Выберите сессию для поиска заказа:",
+        reply_markup=sessions_keyboard
+    )
+
+
+@router.admin("admin_select_session_find_order_{session_id:int}")
+async def handle_admin_select_session_find_order(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int) -> None:
+    """Менеджер выбрал сессию для поиска заказа"""
+    query = update.callback_query
+    session = await db_async.get_session(session_id)
+    
+    if session:
+        await conversation.begin(update.effective_user.id, 'finding_order', session_id=session_id, step='waiting_number')
+        await query.edit_message_text(
+            f"🔍 Найти заказ - {session['session_name']}\n\n"
+            f"Введите номер заказа (номер по сессии или общий номер):"
+        )
+    else:
+        await query.answer("❌ Сессия не найдена!", show_alert=True)
+
+
+@router.admin("manager_bulk_complete")
+async def handle_manager_bulk_complete(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Выбор сессии для массовой выдачи"""
+    query = update.callback_query
+    from keyboards.sessions_admin import get_sessions_keyboard_for_admin
+    sessions_keyboard = await db_async.run(get_sessions_keyboard_for_admin, "bulk_complete", back_callback="manager_back")
+    await query.edit_message_text(
+        "📦 Выдача оптом\n\n"
+        "Выберите сессию для массовой выдачи заказов:",
+        reply_markup=sessions_keyboard
+    )
+
+
+@router.admin("manager_pending_table")
+async def handle_manager_pending_table(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Выбор сессии для таблицы не выданных заказов"""
+    query = update.callback_query
+    from keyboards.sessions_admin import get_sessions_keyboard_for_admin
+    sessions_keyboard = await db_async.run(get_sessions_keyboard_for_admin, "pending_table", back_callback="manager_back")
+    await query.edit_message_text(
+        "📋 Таблица не выданных\n\n"
+        "Выберите сессию для генерации таблицы не выданных заказов:",
+        reply_markup=sessions_keyboard
+    )
+
+
+@router.admin("manager_notify_pending")
+async def handle_manager_notify_pending(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Выбор сессии для оповещения не выданных заказов"""
+    query = update.callback_query
+    from keyboards.sessions_admin import get_sessions_keyboard_for_admin
+    sessions_keyboard = await db_async.run(get_sessions_keyboard_for_admin, "notify_pending", back_callback="manager_back")
+    await query.edit_message_text(
+        "📢 Оповещение не выданных\n\n"
+        "Выберите сессию для отправки оповещения пользователям с не выданными заказами:",
+        reply_markup=sessions_keyboard
+    )
+
+
+@router.admin("manager_notify_active")
+async def handle_manager_notify_active(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Выбор сессии для оповещения активных заказов"""
+    query = update.callback_query
+    from keyboards.sessions_admin import get_sessions_keyboard_for_admin
+    sessions_keyboard = await db_async.run(get_sessions_keyboard_for_admin, "notify_active", back_callback="manager_back")
+    await query.edit_message_text(
+        "📢 Оповещение активных\n\n"
+        "Выберите сессию для отправки оповещения пользователям с активными заказами:",
+        reply_markup=sessions_keyboard
+    )
+
+
+@router.admin("admin_select_session_notify_pending_{session_id:int}")
+async def handle_admin_select_session_notify_pending(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int) -> None:
+    """Менеджер выбрал сессию для оповещения не выданных"""
+    query = update.callback_query
+    session = await db_async.get_session(session_id)
+    
+    if session:
+        await conversation.begin(update.effective_user.id, 'notify_pending', session_id=session_id, step='waiting_message')
+        await query.edit_message_text(
+            f"📢 Оповещение не выданных - {session['session_name']}\n\n"
+            f"Введите текст сообщения, которое будет отправлено всем пользователям с не выданными заказами:"
+        )
+    else:
+        await query.answer("❌ Сессия не найдена!", show_alert=True)
+
+
+@router.admin("admin_select_session_notify_active_{session_id:int}")
+async def handle_admin_select_session_notify_active(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int) -> None:
+    """Менеджер выбрал сессию для оповещения активных"""
+    query = update.callback_query
+    session = await db_async.get_session(session_id)
+    
+    if session:
+        await conversation.begin(update.effective_user.id, 'notify_active', session_id=session_id, step='waiting_message')
+        await query.edit_message_text(
+            f"📢 Оповещение активных - {session['session_name']}\n\n"
+            f"Введите текст сообщения, которое будет отправлено всем пользователям с активными заказами:"
+        )
+    else:
+        await query.answer("❌ Сессия не найдена!", show_alert=True)
+
+
+@router.admin("admin_select_session_pending_table_{session_id:int}")
+async def handle_admin_select_session_pending_table(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int) -> None:
+    """Генерация таблицы не выданных заказов"""
+    query = update.callback_query
+    session = await db_async.get_session(session_id)
+    
+    if session:
+        session_name = session['session_name']
+
+        async def build(progress):
+            import reports
+            try:
+                screenshot = await reports.generate_pending_orders_screenshot(session_id)
+            except Exception as screenshot_error:
+                logger.error(f"Ошибка при создании таблицы не выданных: {screenshot_error}")
+                return ReportResult(
+                    [],
+                    f"❌ Ошибка при создании таблицы: {str(screenshot_error)}\n"
+                    f"Установите Playwright: playwright install chromium"
+                )
+            return ReportResult(
+                [ReportFile('photo', screenshot, f"📋 Таблица не выданных заказов: {session_name}")],
+                "✅ Таблица не выданных заказов успешно сформирована!"
+            )
+
+        await report_jobs.queue.submit(query, f"pending_table_{session_id}", build,
+                                       "⏳ Генерация таблицы не выданных заказов...")
+    else:
+        await query.answer("❌ Сессия не найдена!", show_alert=True)
+
+
+@router.admin("admin_select_session_bulk_complete_{session_id:int}")
+async def handle_admin_select_session_bulk_complete(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int) -> None:
+    """Менеджер выбрал сессию для массовой выдачи"""
+    query = update.callback_query
+    session = await db_async.get_session(session_id)
+    
+    if session:
+        await conversation.begin(update.effective_user.id, 'bulk_complete', session_id=session_id, step='waiting_numbers')
+        await query.edit_message_text(
+            f"📦 Выдача оптом - {session['session_name']}\n\n"
+            f"Введите номера заказов через пробел или запятую (например: 1 11 2 3 5 или 1,2,3,4):"
+        )
+    else:
+        await query.answer("❌ Сессия не найдена!", show_alert=True)
+
+
+@router.admin("manager_back")
+async def handle_manager_back(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Возврат к панели менеджера"""
+    query = update.callback_query
+    from keyboards.manager import get_manager_keyboard
+    await query.edit_message_text(
+        "👔 Панель менеджера 👔\n\n"
+        "Выберите необходимое действие:",
+        reply_markup=get_manager_keyboard()
+    )
+
+
+@router.admin("manager_order_{order_id:int}")
+async def handle_manager_order(update: Update, context: ContextTypes.DEFAULT_TYPE, order_id: int) -> None:
+    """Показ информации о заказе"""
+    query = update.callback_query
+    order = await db_async.get_order(order_id)
+    if order:
+        order_items = await db_async.get_order_items(order_id)
+        session = await db_async.get_session(order['session_id'])
+        
+        items_text = "\n".join([
+            f"• {item['product_name']} x{item['quantity']} = {item['quantity'] * item['price']}₽"
+            for item in order_items
+        ])
+        
+        from keyboards.manager import get_order_actions_keyboard
+        keyboard = get_order_actions_keyboard(order_id)
+        
+        order_num_display = f"#{order.get('session_order_number', order['order_number'])}"
+        if order.get('session_order_number'):
+            order_num_display += f" (общий: {order['order_number']})"
+        
+        await query.edit_message_text(
+            f"📋 Заказ {order_num_display}\n\n"
+            f"📦 Сессия: {session['session_name'] if session else 'Не найдена'}\n"
+            f"👤 ФИО: {order['full_name']}\n"
+            f"📱 Телефон: {order['phone_number']}\n"
+            f"📊 Статус: {database.get_order_status_ru(order['status'])}\n"
+            f"📅 Дата: {order['created_at']}\n\n"
+            f"Товары:\n{items_text}\n\n"
+            f"💰 Общая сумма: {order['total_amount']}₽",
+            reply_markup=keyboard
+        )
+    else:
+        await query.answer("❌ Заказ не найден!", show_alert=True)
+
+
+@router.admin("manager_edit_order_{order_id:int}")
+async def handle_manager_edit_order(update: Update, context: ContextTypes.DEFAULT_TYPE, order_id: int) -> None:
+    """Показ меню изменения статуса"""
+    query = update.callback_query
+    from keyboards.manager import get_order_status_keyboard
+    keyboard = get_order_status_keyboard(order_id)
+    await query.edit_message_text(
+        "✏️ Изменить статус заказа\n\n"
+        "Выберите новый статус:",
+        reply_markup=keyboard
+    )
+
+
+@router.admin("manager_status_{status}_{order_id:int}")
+async def handle_manager_status(update: Update, context: ContextTypes.DEFAULT_TYPE, status: str, order_id: int) -> None:
+    """Изменение статуса заказа"""
+    query = update.callback_query
+    order = await db_async.get_order(order_id)
+    if order:
+        if await db_async.update_order_status(order_id, status):
+            # Отправляем уведомление пользователю
+            try:
+                status_text = database.get_order_status_ru(status)
+                
+                order_num_display = f"#{order.get('session_order_number', order['order_number'])}"
+                if status == 'completed':
+                    message_text = (
+                        f"✅ Ваш заказ {order_num_display} выдан!\n\n"
+                        f"Спасибо за покупку!"
+                    )
+                else:
+                    message_text = (
+                        f"📋 Статус вашего заказа {order_num_display} изменен:\n"
+                        f"{status_text}"
+                    )
+                
+                await context.bot.send_message(
+                    chat_id=order['user_id'],
+                    text=message_text
+                )
+            except Exception as e:
+                logger.error(f"Ошибка при отправке уведомления: {e}")
+            
+            order_num_display = f"#{order.get('session_order_number', order['order_number'])}"
+            await query.edit_message_text(
+                f"✅ Статус заказа {order_num_display} успешно изменен на: {database.get_order_status_ru(status)}"
+            )
+        else:
+            await query.edit_message_text("❌ Ошибка при изменении статуса заказа!")
+    else:
+        await query.answer("❌ Заказ не найден!", show_alert=True)
+
+
+@router.admin("manager_decline_order_{order_id:int}")
+async def handle_manager_decline_order(update: Update, context: ContextTypes.DEFAULT_TYPE, order_id: int) -> None:
+    """Отклонение заказа"""
+    query = update.callback_query
+    order = await db_async.get_order(order_id)
+    if order:
+        if await db_async.update_order_status(order_id, 'cancelled'):
+            order_num_display = f"#{order.get('session_order_number', order['order_number'])}"
+            await query.edit_message_text(f"✅ Заказ {order_num_display} отклонен!")
+        else:
+            await query.edit_message_text("❌ Ошибка при отклонении заказа!")
+    else:
+        await query.answer("❌ Заказ не найден!", show_alert=True)
@@ -0,0 +1,221 @@
+"""Кнопки изменения заказа администратором: состав заказа, позиции, удаление."""
+from telegram import Update
+from telegram.ext import ContextTypes
+import database
+import db_async
+from handlers.router import router
+from handlers.conversation import conversation
+
+
+@router.admin("admin_change_order")
+async def handle_admin_change_order(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Запрос номера заказа или QR-кода"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    if await db_async.is_admin(user_id):
+        await conversation.begin(user_id, 'order_to_edit')
+        await query.edit_message_text(
+            "📋 Изменить заказ\n\n"
+            "Введите номер заказа или отправьте фото с QR-кодом:"
+        )
+    else:
+        await query.answer("❌ У вас нет прав для изменения заказов!", show_alert=True)
+
+
+@router.admin("admin_edit_order_items_{order_id:int}")
+async def handle_admin_edit_order_items(update: Update, context: ContextTypes.DEFAULT_TYPE, order_id: int) -> None:
+    """Редактирование состава заказа"""
+    query = update.callback_query
+    order = await db_async.get_order(order_id)
+    
+    if order:
+        order_items = await db_async.get_order_items(order_id)
+        
+        # Показываем текущий состав заказа и предлагаем изменить
+        items_text = "\n".join([
+            f"• {item['product_name']} x{item['quantity']} = {item['quantity'] * item['price']}₽"
+            for item in order_items
+        ])
+        
+        from keyboards.order_edit_items import get_order_items_edit_keyboard
+        keyboard = get_order_items_edit_keyboard(order_id, order_items)
+        
+        await query.edit_message_text(
+            f"✏️ Изменить состав заказа #{order['order_number']}\n\n"
+            f"Текущий состав:\n{items_text}\n\n"
+            f"Выберите товар для изменения или удаления:",
+            reply_markup=keyboard
+        )
+    else:
+        await query.answer("❌ Заказ не найден!", show_alert=True)
+
+
+@router.admin("admin_delete_order_{order_id:int}")
+async def handle_admin_delete_order(update: Update, context: ContextTypes.DEFAULT_TYPE, order_id: int) -> None:
+    """Удаление заказа"""
+    query = update.callback_query
+    order = await db_async.get_order(order_id)
+    
+    if order:
+        from keyboards.order_edit import get_confirm_delete_order_keyboard
+        keyboard = get_confirm_delete_order_keyboard(order_id)
+        
+        await query.edit_message_text(
+            f"⚠️ Вы уверены, что хотите удалить заказ #{order['order_number']}?\n\n"
+            f"Это действие нельзя отменить!",
+            reply_markup=keyboard
+        )
+    else:
+        await query.answer("❌ Заказ не найден!", show_alert=True)
+
+
+@router.admin("admin_confirm_delete_order_{order_id:int}")
+async def handle_admin_confirm_delete_order(update: Update, context: ContextTypes.DEFAULT_TYPE, order_id: int) -> None:
+    """Подтверждение удаления заказа"""
+    query = update.callback_query
+    order = await db_async.get_order(order_id)
+    
+    if order:
+        if await db_async.delete_order(order_id):
+            await query.edit_message_text(
+                f"✅ Заказ #{order['order_number']} успешно удален!"
+            )
+        else:
+            await query.edit_message_text(
+                f"❌ Ошибка при удалении заказа!"
+            )
+    else:
+        await query.answer("❌ Заказ не найден!", show_alert=True)
+
+
+@router.admin("admin_order_{order_id:int}")
+async def handle_admin_order(update: Update, context: ContextTypes.DEFAULT_TYPE, order_id: int) -> None:
+    """Показ информации о заказе для редактирования"""
+    query = update.callback_query
+    order = await db_async.get_order(order_id)
+    
+    if order:
+        order_items = await db_async.get_order_items(order_id)
+        session = await db_async.get_session(order['session_id'])
+        
+        items_text = "\n".join([
+            f"• {item['product_name']} x{item['quantity']} = {item['quantity'] * item['price']}₽"
+            for item in order_items
+        ])
+        
+        from keyboards.order_edit import get_order_edit_keyboard
+        keyboard = get_order_edit_keyboard(order_id)
+        
+        await query.edit_message_text(
+            f"📋 Заказ #{order['order_number']}\n\n"
+            f"📦 Сессия: {session['session_name'] if session else 'Не найдена'}\n"
+            f"👤 ФИО: {order['full_name']}\n"
+            f"📱 Телефон: {order['phone_number']}\n"
+            f"📊 Статус: {database.get_order_status_ru(order['status'])}\n"
+            f"📅 Дата: {order['created_at']}\n\n"
+            f"Товары:\n{items_text}\n\n"
+            f"💰 Общая сумма: {order['total_amount']}₽",
+            reply_markup=keyboard
+        )
+    else:
+        await query.answer("❌ Заказ не найден!", show_alert=True)
+
+
+@router.admin("admin_edit_item_{order_id:int}_{item_id:int}")
+async def handle_admin_edit_item(update: Update, context: ContextTypes.DEFAULT_TYPE, order_id: int, item_id: int) -> None:
+    """Редактирование количества товара в заказе"""
+    query = update.callback_query
+    order_item = await db_async.get_order_item(item_id)
+    if order_item:
+        await conversation.begin(
+            update.effective_user.id, 'editing_order_item',
+            order_id=order_id,
+            item_id=item_id,
+            product_id=order_item['product_id'],
+            current_quantity=order_item['quantity']
+        )
+        await query.edit_message_text(
+            f"✏️ Изменить количество товара\n\n"
+            f"Товар: {order_item['product_name']}\n"
+            f"Текущее количество: {order_item['quantity']}\n\n"
+            f"Введите новое количество:"
+        )
+    else:
+        await query.answer("❌ Товар в заказе не найден!", show_alert=True)
+
+
+@router.admin("admin_delete_item_{order_id:int}_{item_id:int}")
+async def handle_admin_delete_item(update: Update, context: ContextTypes.DEFAULT_TYPE, order_id: int, item_id: int) -> None:
+    """Удаление товара из заказа"""
+    query = update.callback_query
+    if await db_async.delete_order_item(item_id, order_id):
+        await query.answer("✅ Товар удален из заказа!")
+        # Обновляем информацию о заказе
+        order = await db_async.get_order(order_id)
+        if order:
+            order_items = await db_async.get_order_items(order_id)
+            
+            items_text = "\n".join([
+                f"• {item['product_name']} x{item['quantity']} = {item['quantity'] * item['price']}₽"
+                for item in order_items
+            ]) if order_items else "Товаров нет"
+            
+            from keyboards.order_edit_items import get_order_items_edit_keyboard
+            keyboard = get_order_items_edit_keyboard(order_id, order_items)
+            
+            await query.edit_message_text(
+                f"✏️ Изменить состав заказа #{order['order_number']}\n\n"
+                f"Текущий состав:\n{items_text}\n\n"
+                f"Выберите товар для изменения или удаления:",
+                reply_markup=keyboard
+            )
+    else:
+        await query.answer("❌ Ошибка при удалении товара!", show_alert=True)
+
+
+@router.admin("admin_add_item_to_order_{order_id:int}")
+async def handle_admin_add_item_to_order(update: Update, context: ContextTypes.DEFAULT_TYPE, order_id: int) -> None:
+    """Добавление товара в заказ"""
+    query = update.callback_query
+    order = await db_async.get_order(order_id)
+    
+    if order:
+        # Показываем товары сессии для выбора
+        products = await db_async.get_products_by_session(order['session_id'])
+        if products:
+            from keyboards.products_admin import get_products_keyboard_for_admin
+            products_keyboard = await db_async.run(get_products_keyboard_for_admin, order['session_id'], f"add_to_order_{order_id}")
+            await query.edit_message_text(
+                f"➕ Добавить товар в заказ #{order['order_number']}\n\n"
+                f"Выберите товар:",
+                reply_markup=products_keyboard
+            )
+        else:
+            await query.edit_message_text("❌ В этой сессии нет товаров для добавления!")
+    else:
+        await query.answer("❌ Заказ не найден!", show_alert=True)
+
+
+@router.admin("admin_select_product_add_to_order_{product_id:int}_{order_id:int}")
+async def handle_admin_select_product_add_to_order(update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int, order_id: int) -> None:
+    """Админ выбрал товар для добавления в заказ"""
+    query = update.callback_query
+    order = await db_async.get_order(order_id)
+    product = await db_async.get_product(product_id)
+    
+    if order and product:
+        await conversation.begin(
+            update.effective_user.id, 'adding_item_to_order',
+            order_id=order_id,
+            product_id=product_id,
+            step='quantity'
+        )
+        await query.edit_message_text(
+            f"➕ Добавить товар в заказ #{order['order_number']}\n\n"
+            f"Товар: {product['product_name']}\n"
+            f"Цена: {product['price']}₽ за ящик\n"
+            f"Доступно: {product['boxes_count']} ящиков\n\n"
+            f"Введите количество ящиков:"
+        )
+    else:
+        await query.answer("❌ Заказ или товар не найден!", show_alert=True)
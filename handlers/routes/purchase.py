@@ -0,0 +1,372 @@
+"""Кнопки покупки: выбор сессии и товара, количество, оформление заказа, корзина и QR-код заказа."""
+from telegram import Update
+from telegram.ext import ContextTypes
+import cpu_pool
+import database
+import db_async
+from handlers.router import router
+from handlers.conversation import conversation
+
+
+@router.route("session_{session_id:int}")
+async def handle_session(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int) -> None:
+    """Обработка выбора сессии пользователем"""
+    query = update.callback_query
+    session = await db_async.get_session(session_id)
+    if session:
+        # Проверяем статус торговли для этой сессии
+        if not await db_async.is_session_trading_active(session_id):
+            from keyboards.main import get_back_to_start_keyboard
+            desc = (session.get("description") or "").strip()
+            msg = f"⛔ Торговля закрыта\n\nСессия: {session['session_name']}"
+            if desc:
+                msg += f"\n\n📄 {desc}"
+            msg += "\n\nТорговля для этой сессии временно приостановлена. Попробуйте позже."
+            await query.edit_message_text(msg, reply_markup=get_back_to_start_keyboard())
+            return
+        
+        # Получаем товары для этой сессии
+        from keyboards.products import get_products_keyboard
+        products_keyboard = await db_async.run(get_products_keyboard, session_id)
+        products = await db_async.get_products_by_session(session_id)
+        
+        desc = (session.get("description") or "").strip()
+        session_header = f"✅ Вы выбрали сессию: {session['session_name']}"
+        if desc:
+            session_header += f"\n\n📄 {desc}"
+        session_header += "\n\n"
+        if products:
+            products_text = "\n".join([
+                f"• {p['product_name']} - {p['price']}₽ (ящиков: {p['boxes_count']})"
+                for p in products
+            ])
+            await query.edit_message_text(
+                f"{session_header}Доступные товары:\n{products_text}",
+                reply_markup=products_keyboard
+            )
+        else:
+            await query.edit_message_text(
+                f"{session_header}Товары пока не добавлены.",
+                reply_markup=products_keyboard
+            )
+    else:
+        await query.answer("❌ Сессия не найдена!", show_alert=True)
+
+
+@router.route("product_{product_id:int}")
+async def handle_product(update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int) -> None:
+    """Обработка выбора товара пользователем"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    product = await db_async.get_product(product_id)
+    
+    if product:
+        session_id = product['session_id']
+        session = await db_async.get_session(session_id)
+        
+        # Проверяем статус торговли
+        if not await db_async.is_session_trading_active(session_id):
+            from keyboards.main import get_back_to_start_keyboard
+            await query.edit_message_text(
+                f"⛔ Торговля закрыта\n\n"
+                f"Сессия: {session['session_name'] if session else ''}\n\n"
+                f"Торговля для этой сессии временно приостановлена. Попробуйте позже.",
+                reply_markup=get_back_to_start_keyboard()
+            )
+            return
+        
+        # Получаем лимит и доступное количество
+        limit = database.get_limit_per_person()
+        purchased = await db_async.get_user_session_boxes_purchased(user_id, session_id)
+        available = await db_async.get_user_available_boxes(user_id, session_id, product_id)
+        
+        from keyboards.products import get_product_info_keyboard
+        keyboard = get_product_info_keyboard(product_id, session_id)
+        
+        limit_text = f"{limit} ящиков" if limit > 0 else "без ограничений"
+        available_text = f"{available} ящиков" if available > 0 else "0 ящиков"
+        
+        await query.edit_message_text(
+            f"📦 {product['product_name']}\n\n"
+            f"💰 Цена: {product['price']}₽ за ящик\n"
+            f"📊 Доступно ящиков: {product['boxes_count']}\n"
+            f"👤 Ваш лимит: {limit_text}\n"
+            f"✅ Куплено в этой сессии: {purchased} ящиков\n"
+            f"🛒 Доступно для покупки: {available_text}",
+            reply_markup=keyboard
+        )
+    else:
+        await query.answer("❌ Товар не найден!", show_alert=True)
+
+
+@router.route("buy_{product_id:int}")
+async def handle_buy(update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int) -> None:
+    """Начало покупки товара"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    product = await db_async.get_product(product_id)
+    
+    if product:
+        session_id = product['session_id']
+        # Торговля должна быть открыта
+        if not await db_async.is_session_trading_active(session_id):
+            from keyboards.main import get_back_to_start_keyboard
+            session = await db_async.get_session(session_id)
+            await query.edit_message_text(
+                f"⛔ Торговля закрыта\n\n"
+                f"Сессия: {session['session_name'] if session else ''}\n\n"
+                f"Торговля для этой сессии временно приостановлена.",
+                reply_markup=get_back_to_start_keyboard()
+            )
+            return
+        available = await db_async.get_user_available_boxes(user_id, session_id, product_id)
+        max_boxes = available
+        
+        if max_boxes <= 0:
+            from keyboards.products import get_product_info_keyboard
+            await query.edit_message_text(
+                "❌ Нет доступных ящиков для покупки по этому товару.",
+                reply_markup=get_product_info_keyboard(product_id, session_id)
+            )
+            return
+        
+        from keyboards.products import get_quantity_keyboard
+        keyboard = get_quantity_keyboard(product_id, max_boxes)
+        
+        await query.edit_message_text(
+            f"🛒 Покупка: {product['product_name']}\n\n"
+            f"💰 Цена за ящик: {product['price']}₽\n"
+            f"📊 Максимум доступно: {max_boxes} ящиков\n\n"
+            f"Выберите количество ящиков:",
+            reply_markup=keyboard
+        )
+    else:
+        from keyboards.main import get_back_to_start_keyboard
+        await query.edit_message_text(
+            "❌ Товар не найден.",
+            reply_markup=get_back_to_start_keyboard()
+        )
+
+
+@router.route("qty_{product_id:int}_{quantity:int}")
+async def handle_qty(update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int, quantity: int) -> None:
+    """Выбор количества ящиков"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    product = await db_async.get_product(product_id)
+    
+    if product:
+        session_id = product['session_id']
+        available = await db_async.get_user_available_boxes(user_id, session_id, product_id)
+        
+        if quantity > available:
+            await query.answer("❌ Недостаточно доступных ящиков!", show_alert=True)
+            return
+        
+        total_cost = quantity * product['price']
+        
+        # Сохраняем данные покупки. Цену не сохраняем: при оформлении заказа
+        # она берется из товара заново (place_order)
+        await conversation.begin(
+            user_id, 'purchase',
+            product_id=product_id,
+            session_id=session_id,
+            quantity=quantity
+        )
+        
+        from keyboards.products import get_confirm_phone_keyboard
+        keyboard = get_confirm_phone_keyboard(product_id, quantity)
+        info = await db_async.get_user_info(user_id)
+        if (info or {}).get('phone_number') and (info or {}).get('full_name'):
+            hint = "Телефон и ФИО будут взяты из вашего профиля. Нажмите кнопку для оформления заказа."
+        else:
+            hint = "Для продолжения введите или подтвердите номер телефона и ФИО:"
+        
+        await query.edit_message_text(
+            f"🛒 Подтверждение покупки\n\n"
+            f"Товар: {product['product_name']}\n"
+            f"Количество: {quantity} ящиков\n"
+            f"Цена за ящик: {product['price']}₽\n"
+            f"💰 Общая стоимость: {total_cost}₽\n\n"
+            f"{hint}",
+            reply_markup=keyboard
+        )
+    else:
+        await query.answer("❌ Товар не найден!", show_alert=True)
+
+
+@router.route("confirm_phone_{product_id:int}_{quantity:int}")
+async def handle_confirm_phone(update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int, quantity: int) -> None:
+    """Подтверждение заказа: используем телефон и ФИО из профиля, если есть"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    state = await conversation.get(user_id)
+    if state is None or state.name != 'purchase':
+        await query.answer("❌ Ошибка! Начните покупку заново.", show_alert=True)
+        return
+    
+    purchase_data = state.data
+    info = await db_async.get_user_info(user_id)
+    profile_phone = (info or {}).get('phone_number') or ''
+    profile_full_name = (info or {}).get('full_name') or ''
+    
+    # Если в профиле есть и телефон, и ФИО — создаём заказ сразу
+    if profile_phone and profile_full_name:
+        # Заказ и данные для сообщения о нем - одной транзакцией
+        receipt = await db_async.place_order_with_receipt(
+            user_id=user_id,
+            session_id=purchase_data['session_id'],
+            phone_number=profile_phone,
+            full_name=profile_full_name,
+            items=[{
+                'product_id': purchase_data['product_id'],
+                'quantity': purchase_data['quantity']
+            }]
+        )
+        placed = receipt['placed']
+        if placed['order_id']:
+            order = receipt['order']
+            order_items = receipt['items']
+            session = receipt['session']
+            limit = receipt['limit']
+            purchased = receipt['purchased']
+            available = limit - purchased if limit > 0 else 999999
+            items_text = "\n".join([
+                f"• {item['product_name']} x{item['quantity']} = {item['quantity'] * item['price']}₽"
+                for item in order_items
+            ])
+            continue_text = ""
+            back_keyboard = None
+            if limit == 0 or available > 0:
+                if limit > 0:
+                    continue_text = f"\n\n✅ У вас осталось {available} ящиков для покупки в этой сессии."
+                else:
+                    continue_text = "\n\n✅ Вы можете продолжить покупки в этой сессии."
+                from keyboards.orders import get_back_to_products_keyboard
+                back_keyboard = get_back_to_products_keyboard(purchase_data['session_id'])
+            from keyboards.products import get_products_keyboard
+            products_keyboard = await db_async.run(get_products_keyboard, purchase_data['session_id'])
+            import qr_code
+            qr_image = await cpu_pool.run(qr_code.generate_qr_code, order['order_number'])
+            
+            # Формируем номер заказа для отображения
+            table_number = order.get('session_order_number', '—')
+            order_code = order['order_number']
+            order_num_display = f"№{table_number} (код: {order_code})"
+            
+            await query.message.reply_photo(
+                photo=qr_image,
+                caption=(
+                    f"✅ Заказ успешно создан!\n\n"
+                    f"📋 Номер заказа: {order_num_display}\n"
+                    f"📦 Сессия: {session['session_name']}\n"
+                    f"👤 ФИО: {order['full_name']}\n"
+                    f"📱 Телефон: {order['phone_number']}\n\n"
+                    f"Товары:\n{items_text}\n\n"
+                    f"💰 Общая сумма: {order['total_amount']}₽{continue_text}"
+                ),
+                reply_markup=back_keyboard if back_keyboard else products_keyboard
+            )
+            await query.edit_message_text("✅ Заказ создан. QR-код отправлен выше.")
+            await state.end()
+        else:
+            error_text = await db_async.get_order_error_ru(placed)
+            await query.answer(error_text, show_alert=True)
+        return
+    
+    # Нет ФИО — запрашиваем только ФИО (телефон уже в профиле)
+    if profile_phone:
+        purchase_data['step'] = 'full_name'
+        purchase_data['phone_number'] = profile_phone
+        await state.save()
+        await query.edit_message_text(
+            f"📱 Телефон из профиля: {profile_phone}\n\n"
+            "Введите ваше ФИО (Фамилия Имя Отчество):"
+        )
+        return
+    
+    # Нет телефона в профиле — запрашиваем телефон и затем ФИО
+    purchase_data['step'] = 'phone'
+    await state.save()
+    await query.edit_message_text(
+        "📱 Введите ваш номер телефона (например: +79991234567):"
+    )
+
+
+@router.route("cart_{session_id:int}")
+async def handle_cart(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int) -> None:
+    """Показ корзины пользователя"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    session = await db_async.get_session(session_id)
+    
+    if session:
+        cart = await db_async.get_user_cart(user_id, session_id)
+        from keyboards.cart import get_cart_orders_keyboard
+        
+        if cart:
+            cart_text = "\n".join([
+                f"Заказ #{order['order_number']}\n"
+                f"Товары: {order['items']}\n"
+                f"Сумма: {order['total_amount']}₽\n"
+                f"Статус: {order['status']}\n"
+                for order in cart
+            ])
+            cart_keyboard = get_cart_orders_keyboard(session_id, cart)
+            await query.edit_message_text(
+                f"🛒 Корзина - {session['session_name']}\n\n{cart_text}\n\n"
+                f"Нажмите на заказ, чтобы получить QR-код:",
+                reply_markup=cart_keyboard
+            )
+        else:
+            from keyboards.products import get_products_keyboard
+            products_keyboard = await db_async.run(get_products_keyboard, session_id)
+            await query.edit_message_text(
+                f"🛒 Корзина - {session['session_name']}\n\n"
+                f"Ваша корзина пуста.",
+                reply_markup=products_keyboard
+            )
+    else:
+        await query.answer("❌ Сессия не найдена!", show_alert=True)
+
+
+@router.route("get_qr_{order_number}")
+async def handle_get_qr(update: Update, context: ContextTypes.DEFAULT_TYPE, order_number: str) -> None:
+    """Генерация и отправка QR-кода заказа"""
+    query = update.callback_query
+    order = await db_async.find_order_by_number(order_number)
+    
+    if order:
+        import qr_code
+        qr_image = await cpu_pool.run(qr_code.generate_qr_code, order_number)
+        
+        order_items = await db_async.get_order_items(order['order_id'])
+        session = await db_async.get_session(order['session_id'])
+        
+        items_text = "\n".join([
+            f"• {item['product_name']} x{item['quantity']} = {item['quantity'] * item['price']}₽"
+            for item in order_items
+        ])
+        
+        await query.message.reply_photo(
+            photo=qr_image,
+            caption=(
+                f"📱 QR-код заказа #{order_number}\n\n"
+                f"📦 Сессия: {session['session_name'] if session else 'Не найдена'}\n"
+                f"👤 ФИО: {order['full_name']}\n"
+                f"📱 Телефон: {order['phone_number']}\n"
+                f"📊 Статус: {database.get_order_status_ru(order['status'])}\n\n"
+                f"Товары:\n{items_text}\n\n"
+                f"💰 Общая сумма: {order['total_amount']}₽"
+            )
+        )
+        await query.answer("QR-код отправлен!")
+    else:
+        await query.answer("❌ Заказ не найден!", show_alert=True)
+
+
+@router.route("cart_back")
+async def handle_cart_back(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Возврат к корзине (обрабатывается через cart_)"""
+    query = update.callback_query
+    await query.answer()
@@ -0,0 +1,556 @@
+"""Кнопки отчетов и статуса продаж (админ-панель и панель менеджера)."""
+from telegram import Update
+from telegram.ext import ContextTypes
+from telegram.error import BadRequest
+import cpu_pool
+import database
+import db_async
+import logging
+from datetime import datetime
+from handlers.router import router
+from handlers import report_jobs
+from handlers.report_jobs import ReportFile, ReportResult
+
+logger = logging.getLogger(__name__)
+
+
+@router.admin("admin_sales_status")
+async def handle_admin_sales_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показываем список сессий для выбора"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    if await db_async.is_admin(user_id):
+        from keyboards.sessions_admin import get_sessions_keyboard_for_admin
+        sessions_keyboard = await db_async.run(get_sessions_keyboard_for_admin, "sales_status")
+        await query.edit_message_text(
+            "📊 Статус продаж\n\n"
+            "Выберите сессию для просмотра статистики:",
+            reply_markup=sessions_keyboard
+        )
+    else:
+        await query.answer("❌ У вас нет прав для просмотра статистики!", show_alert=True)
+
+
+@router.admin("admin_select_session_sales_status_{session_id:int}")
+async def handle_admin_select_session_sales_status(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int) -> None:
+    """Показываем статистику продаж по сессии"""
+    query = update.callback_query
+    session = await db_async.get_session(session_id)
+    
+    if session:
+        stats = await db_async.get_session_sales_stats(session_id)
+        
+        status_text = "✅ Активна" if session.get('is_active') else "❌ Остановлена"
+        
+        stats_message = (
+            f"📊 Статус продаж - {session['session_name']}\n"
+            f"Статус сессии: {status_text}\n\n"
+            f"📦 Всего заказов: {stats['total_orders']}\n"
+            f"✅ Выдано: {stats['completed_orders']}\n"
+            f"⏳ В обработке: {stats['processing_orders']}\n"
+            f"🕐 Ожидает обработки: {stats['pending_orders']}\n"
+            f"❌ Отменено: {stats['cancelled_orders']}\n\n"
+            f"💰 Общая выручка: {stats['total_revenue']:.2f}₽\n"
+            f"📦 Всего продано ящиков: {stats['total_boxes_sold']}\n"
+        )
+        
+        if stats['completed_orders'] > 0:
+            avg_check = stats['total_revenue'] / stats['completed_orders']
+            stats_message += f"💵 Средний чек: {avg_check:.2f}₽\n"
+        
+        stats_message += f"\n👥 Уникальных клиентов: {stats['unique_customers']}"
+        
+        # Добавляем информацию о товарах
+        if stats.get('products') and len(stats['products']) > 0:
+            stats_message += "\n\n📦 Товары:\n"
+            for product in stats['products']:
+                stats_message += (
+                    f"\n🛍️ {product['product_name']}\n"
+                    f"   💰 Цена: {product['price']:.2f}₽ за ящик\n"
+                    f"   📦 Начальное количество: {product['initial_boxes']} ящ.\n"
+                    f"   ✅ Продано: {product['sold_boxes']} ящ.\n"
+                    f"   📊 Остаток: {product['remaining_boxes']} ящ.\n"
+                )
+        else:
+            stats_message += "\n\n⚠️ Товары в сессии отсутствуют"
+        
+        from keyboards.admin import get_admin_keyboard
+        keyboard = get_admin_keyboard()
+        await query.edit_message_text(stats_message, reply_markup=keyboard)
+    else:
+        await query.answer("❌ Сессия не найдена!", show_alert=True)
+
+
+@router.admin("admin_reports")
+async def handle_admin_reports(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показываем выбор типа отчета"""
+    query = update.callback_query
+    from keyboards.reports import get_reports_type_keyboard
+    reports_keyboard = get_reports_type_keyboard()
+    await query.edit_message_text(
+        "📈 Отчеты\n\n"
+        "Выберите тип отчета:",
+        reply_markup=reports_keyboard
+    )
+
+
+@router.admin("admin_report_period")
+async def handle_admin_report_period(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показываем выбор периода для отчета"""
+    query = update.callback_query
+    from keyboards.reports import get_reports_period_keyboard
+    reports_keyboard = get_reports_period_keyboard()
+    await query.edit_message_text(
+        "📅 Отчет за период\n\n"
+        "Выберите период для формирования отчета:",
+        reply_markup=reports_keyboard
+    )
+
+
+@router.admin("admin_report_session")
+async def handle_admin_report_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Выбор сессии для отчета (такой же как у менеджера)"""
+    query = update.callback_query
+    from keyboards.sessions_admin import get_sessions_keyboard_for_admin
+    sessions_keyboard = await db_async.run(get_sessions_keyboard_for_admin, "report", back_callback="admin_reports")
+    try:
+        await query.edit_message_text(
+            "📊 Отчет по сессии\n\n"
+            "Выберите сессию для формирования отчета:",
+            reply_markup=sessions_keyboard
+        )
+    except BadRequest as e:
+        if "Message is not modified" in str(e):
+            # Игнорируем ошибку если сообщение не изменилось
+            pass
+        else:
+            raise
+
+
+@router.admin("admin_channel_report")
+async def handle_admin_channel_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Выбор сессии для отчета канала"""
+    query = update.callback_query
+    from keyboards.sessions_admin import get_sessions_keyboard_for_admin
+    sessions_keyboard = await db_async.run(get_sessions_keyboard_for_admin, "channel_report", back_callback="admin_reports")
+    try:
+        await query.edit_message_text(
+            "📺 Отчет для канала\n\n"
+            "Выберите сессию для формирования отчета:",
+            reply_markup=sessions_keyboard
+        )
+    except BadRequest as e:
+        if "Message is not modified" in str(e):
+            pass
+        else:
+            raise
+
+
+@router.admin("admin_full_data_report")
+async def handle_admin_full_data_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Выбор сессии для полного отчета с полными данными"""
+    query = update.callback_query
+    from keyboards.sessions_admin import get_sessions_keyboard_for_admin
+    sessions_keyboard = await db_async.run(get_sessions_keyboard_for_admin, "full_data_report", back_callback="admin_reports")
+    try:
+        await query.edit_message_text(
+            "📋 Полный отчет (2 столбца)\n\n"
+            "Выберите сессию для формирования отчета с полными данными:",
+            reply_markup=sessions_keyboard
+        )
+    except BadRequest as e:
+        if "Message is not modified" in str(e):
+            pass
+        else:
+            raise
+
+
+_PERIOD_NAMES = {
+    "week": "неделю",
+    "month": "месяц",
+    "year": "год",
+    "all_time": "все время"
+}
+
+
+async def _queue_period_report(query, period: str) -> None:
+    """Ставит в очередь Excel отчет за период (одинаковые запросы формируют его один раз)"""
+    async def build(progress):
+        import reports
+        excel_file = await cpu_pool.run(reports.generate_period_report_excel, period)
+        period_name = _PERIOD_NAMES.get(period, period)
+        return ReportResult(
+            [ReportFile('document', excel_file, f"📊 Отчет за {period_name}",
+                        f"Отчет_за_{period_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")],
+            f"✅ Отчет за {period_name} успешно сформирован!"
+        )
+
+    await report_jobs.queue.submit(query, f"period_report_{period}", build, "⏳ Формирование отчета...")
+
+
+@router.admin("admin_report_{period}")
+async def handle_admin_report_for_period(update: Update, context: ContextTypes.DEFAULT_TYPE, period: str) -> None:
+    """Обработка выбора периода отчета"""
+    await _queue_period_report(update.callback_query, period)
+
+
+@router.admin("manager_sales_status")
+async def handle_manager_sales_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показываем список сессий для выбора статуса продаж"""
+    query = update.callback_query
+    from keyboards.sessions_admin import get_sessions_keyboard_for_admin
+    sessions_keyboard = await db_async.run(get_sessions_keyboard_for_admin, "sales_status", back_callback="manager_back")
+    await query.edit_message_text(
+        "📊 Статус продаж\n\n"
+        "Выберите сессию для просмотра статистики:",
+        reply_markup=sessions_keyboard
+    )
+
+
+@router.admin("manager_reports")
+async def handle_manager_reports(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показываем выбор типа отчета для менеджера"""
+    query = update.callback_query
+    from keyboards.reports import get_manager_reports_type_keyboard
+    reports_keyboard = get_manager_reports_type_keyboard()
+    await query.edit_message_text(
+        "📈 Отчеты\n\n"
+        "Выберите тип отчета:",
+        reply_markup=reports_keyboard
+    )
+
+
+@router.admin("manager_report_period")
+async def handle_manager_report_period(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показываем выбор периода для отчета менеджера"""
+    query = update.callback_query
+    from keyboards.reports import get_manager_reports_period_keyboard
+    reports_keyboard = get_manager_reports_period_keyboard()
+    await query.edit_message_text(
+        "📅 Отчет за период\n\n"
+        "Выберите период для формирования отчета:",
+        reply_markup=reports_keyboard
+    )
+
+
+@router.admin("manager_report_session")
+async def handle_manager_report_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Выбор сессии для отчета менеджера"""
+    query = update.callback_query
+    from keyboards.sessions_admin import get_sessions_keyboard_for_admin
+    sessions_keyboard = await db_async.run(get_sessions_keyboard_for_admin, "manager_report", back_callback="manager_reports")
+    try:
+        await query.edit_message_text(
+            "📊 Отчет по сессии\n\n"
+            "Выберите сессию для формирования отчета:",
+            reply_markup=sessions_keyboard
+        )
+    except BadRequest as e:
+        if "Message is not modified" in str(e):
+            pass
+        else:
+            raise
+
+
+@router.admin("manager_channel_report")
+async def handle_manager_channel_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Выбор сессии для отчета канала менеджера"""
+    query = update.callback_query
+    from keyboards.sessions_admin import get_sessions_keyboard_for_admin
+    sessions_keyboard = await db_async.run(get_sessions_keyboard_for_admin, "manager_channel_report", back_callback="manager_reports")
+    try:
+        await query.edit_message_text(
+            "📺 Отчет для канала\n\n"
+            "Выберите сессию для формирования отчета:",
+            reply_markup=sessions_keyboard
+        )
+    except BadRequest as e:
+        if "Message is not modified" in str(e):
+            pass
+        else:
+            raise
+
+
+@router.admin("manager_full_data_report")
+async def handle_manager_full_data_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Выбор сессии для полного отчета менеджера"""
+    query = update.callback_query
+    from keyboards.sessions_admin import get_sessions_keyboard_for_admin
+    sessions_keyboard = await db_async.run(get_sessions_keyboard_for_admin, "manager_full_data_report", back_callback="manager_reports")
+    try:
+        await query.edit_message_text(
+            "📋 Полный отчет (2 столбца)\n\n"
+            "Выберите сессию для формирования отчета с полными данными:",
+            reply_markup=sessions_keyboard
+        )
+    except BadRequest as e:
+        if "Message is not modified" in str(e):
+            pass
+        else:
+            raise
+
+
+@router.admin("manager_report_{period}")
+async def handle_manager_report_for_period(update: Update, context: ContextTypes.DEFAULT_TYPE, period: str) -> None:
+    """Обработка выбора периода отчета для менеджера"""
+    await _queue_period_report(update.callback_query, period)
+
+
+@router.admin("manager_select_session_sales_status_{session_id:int}")
+async def handle_manager_select_session_sales_status(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int) -> None:
+    """Показываем статистику продаж по сессии для менеджера"""
+    query = update.callback_query
+    session = await db_async.get_session(session_id)
+    
+    if session:
+        stats = await db_async.get_session_sales_stats(session_id)
+        
+        status_text = "✅ Активна" if session.get('is_active') else "❌ Остановлена"
+        
+        stats_message = (
+            f"📊 Статус продаж - {session['session_name']}\n"
+            f"Статус сессии: {status_text}\n\n"
+            f"📦 Всего заказов: {stats['total_orders']}\n"
+            f"✅ Выдано: {stats['completed_orders']}\n"
+            f"⏳ В обработке: {stats['processing_orders']}\n"
+            f"🕐 Ожидает обработки: {stats['pending_orders']}\n"
+            f"❌ Отменено: {stats['cancelled_orders']}\n\n"
+            f"💰 Общая выручка: {stats['total_revenue']:.2f}₽\n"
+            f"📦 Всего продано ящиков: {stats['total_boxes_sold']}\n"
+        )
+        
+        if stats['completed_orders'] > 0:
+            avg_check = stats['total_revenue'] / stats['completed_orders']
+            stats_message += f"💵 Средний чек: {avg_check:.2f}₽\n"
+        
+        stats_message += f"\n👥 Уникальных клиентов: {stats['unique_customers']}"
+        
+        # Добавляем информацию о товарах
+        if stats.get('products') and len(stats['products']) > 0:
+            stats_message += "\n\n📦 Товары:\n"
+            for product in stats['products']:
+                stats_message += (
+                    f"\n🛍️ {product['product_name']}\n"
+                    f"   💰 Цена: {product['price']:.2f}₽ за ящик\n"
+                    f"   📦 Начальное количество: {product['initial_boxes']} ящ.\n"
+                    f"   ✅ Продано: {product['sold_boxes']} ящ.\n"
+                    f"   📊 Остаток: {product['remaining_boxes']} ящ.\n"
+                )
+        else:
+            stats_message += "\n\n⚠️ Товары в сессии отсутствуют"
+        
+        from keyboards.manager import get_manager_keyboard
+        keyboard = get_manager_keyboard()
+        await query.edit_message_text(stats_message, reply_markup=keyboard)
+    else:
+        await query.answer("❌ Сессия не найдена!", show_alert=True)
+
+
+async def _session_report_lines(session_id: int, session_name: str) -> list:
+    """Строки текстового отчета по сессии"""
+    # Заказы читаются пачками; счетчики по статусам считаются по ходу,
+    # заголовок отчета добавляется после прохода
+    status_counts = {'completed': 0, 'pending': 0, 'processing': 0, 'cancelled': 0}
+    orders_count = 0
+    order_lines = []
+    async for batch in db_async.iter_session_orders(session_id):
+        for order in batch:
+            orders_count += 1
+            if order['status'] in status_counts:
+                status_counts[order['status']] += 1
+            order_lines.append(f"Заказ #{order['order_number']}")
+            order_lines.append(f"ФИО: {order['full_name']}")
+            order_lines.append(f"Телефон: {order['phone_number']}")
+            order_lines.append(f"Статус: {database.get_order_status_ru(order['status'])}")
+            order_lines.append(f"Товары: {order['items']}")
+            order_lines.append(f"Сумма: {order['total_amount']}₽")
+            order_lines.append(f"Дата: {order['created_at']}")
+            order_lines.append("-" * 60)
+            order_lines.append("")
+
+    report_lines = []
+    report_lines.append(f"ОТЧЕТ ПО СЕССИИ: {session_name}")
+    report_lines.append("")
+    report_lines.append(f"Всего заказов: {orders_count}")
+    report_lines.append("")
+    report_lines.append(f"Выдано: {status_counts['completed']}")
+    report_lines.append(f"Ожидает обработки: {status_counts['pending']}")
+    report_lines.append(f"В обработке: {status_counts['processing']}")
+    report_lines.append(f"Отменено: {status_counts['cancelled']}")
+    report_lines.append("")
+    report_lines.append("=" * 60)
+    report_lines.append("")
+    report_lines.extend(order_lines)
+    return report_lines
+
+
+async def _queue_session_report(query, session_id: int, session_name: str) -> None:
+    """Ставит в очередь отчет по сессии в виде изображений"""
+    async def build(progress):
+        report_lines = await _session_report_lines(session_id, session_name)
+
+        # Генерируем изображения отчета (разбиваем на части)
+        try:
+            import reports
+            images_to_send = await cpu_pool.run(reports.render_session_report_images, session_name, report_lines)
+        except Exception as e:
+            logger.error(f"Ошибка при генерации изображения: {e}")
+            # Если не удалось создать изображение, отправляем текстовый отчет
+            report_text = "\n".join(report_lines)
+            return ReportResult([], f"📊 Отчет по сессии: {session_name}\n\n{report_text[:4000]}")
+
+        total_parts = len(images_to_send)
+        files = [
+            ReportFile('photo', img_bytes, f"📊 Отчет по сессии: {session_name}\nЧасть {idx + 1} из {total_parts}")
+            for idx, img_bytes in enumerate(images_to_send)
+        ]
+        return ReportResult(files, f"✅ Отчет успешно сформирован! Отправлено {total_parts} изображений.")
+
+    await report_jobs.queue.submit(query, f"session_report_{session_id}", build, "⏳ Формирование отчета...")
+
+
+async def _queue_channel_report(query, session_id: int, session_name: str) -> None:
+    """Ставит в очередь Excel отчет и скриншот для канала (с маскировкой данных)"""
+    async def build(progress):
+        import reports
+
+        # Генерируем Excel отчет
+        excel_file = await cpu_pool.run(reports.generate_channel_report_excel, session_id)
+        files = [ReportFile(
+            'document', excel_file, f"📺 Excel отчет для канала: {session_name}",
+            f"Отчет_для_канала_{session_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        )]
+
+        # Генерируем скриншот
+        await progress("⏳ Excel отчет готов, формирование скриншота для канала...")
+        try:
+            screenshot = await reports.generate_channel_report_screenshot(session_id)
+        except Exception as screenshot_error:
+            logger.error(f"Ошибка при создании скриншота: {screenshot_error}")
+            return ReportResult(
+                files,
+                f"✅ Excel отчет сформирован!\n"
+                f"⚠️ Не удалось создать скриншот: {str(screenshot_error)}\n"
+                f"Установите Playwright: playwright install chromium"
+            )
+        files.append(ReportFile('photo', screenshot, f"📸 Скриншот таблицы для канала: {session_name}"))
+        return ReportResult(files, "✅ Excel отчет и скриншот для канала успешно сформированы!")
+
+    await report_jobs.queue.submit(query, f"channel_report_{session_id}", build,
+                                   "⏳ Формирование Excel отчета и скриншота для канала...")
+
+
+async def _queue_full_data_report(query, session_id: int, session_name: str) -> None:
+    """Ставит в очередь полный Excel отчет и скриншот (без маскировки)"""
+    async def build(progress):
+        import reports
+
+        # Генерируем Excel отчет
+        excel_file = await cpu_pool.run(reports.generate_full_data_report_excel, session_id)
+        files = [ReportFile(
+            'document', excel_file, f"📋 Excel отчет (2 столбца): {session_name}",
+            f"Полный_отчет_{session_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        )]
+
+        # Генерируем скриншот
+        await progress("⏳ Excel отчет готов, формирование скриншота...")
+        try:
+            screenshot = await reports.generate_full_data_report_screenshot(session_id)
+        except Exception as screenshot_error:
+            logger.error(f"Ошибка при создании скриншота: {screenshot_error}")
+            return ReportResult(
+                files,
+                f"✅ Excel отчет сформирован!\n"
+                f"⚠️ Не удалось создать скриншот: {str(screenshot_error)}\n"
+                f"Установите Playwright: playwright install chromium"
+            )
+        files.append(ReportFile('photo', screenshot, f"📸 Скриншот таблицы: {session_name}"))
+        return ReportResult(files, "✅ Полный отчет и скриншот успешно сформированы!")
+
+    await report_jobs.queue.submit(query, f"full_data_report_{session_id}", build,
+                                   "⏳ Формирование полного отчета и скриншота...")
+
+
+@router.admin("manager_select_session_report_{session_id:int}")
+async def handle_manager_select_session_report(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int) -> None:
+    """Генерация отчета для сессии менеджера"""
+    query = update.callback_query
+    session = await db_async.get_session(session_id)
+    if session:
+        await _queue_session_report(query, session_id, session['session_name'])
+    else:
+        await query.answer("❌ Сессия не найдена!", show_alert=True)
+
+
+@router.admin("manager_select_session_channel_report_{session_id:int}")
+async def handle_manager_select_session_channel_report(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int) -> None:
+    """Генерация Excel отчета и скриншота для канала менеджера"""
+    query = update.callback_query
+    session = await db_async.get_session(session_id)
+    if session:
+        await _queue_channel_report(query, session_id, session['session_name'])
+    else:
+        await query.answer("❌ Сессия не найдена!", show_alert=True)
+
+
+@router.admin("manager_select_session_full_data_report_{session_id:int}")
+async def handle_manager_select_session_full_data_report(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int) -> None:
+    """Генерация полного Excel отчета и скриншота для менеджера"""
+    query = update.callback_query
+    session = await db_async.get_session(session_id)
+    if session:
+        await _queue_full_data_report(query, session_id, session['session_name'])
+    else:
+        await query.answer("❌ Сессия не найдена!", show_alert=True)
+
+
+@router.admin("manager_report")
+async def handle_manager_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Выбор сессии для отчета (старый обработчик, оставляем для совместимости)"""
+    query = update.callback_query
+    from keyboards.sessions_admin import get_sessions_keyboard_for_admin
+    sessions_keyboard = await db_async.run(get_sessions_keyboard_for_admin, "manager_report", back_callback="manager_back")
+    try:
+        await query.edit_message_text(
+            "📊 Отчет\n\n"
+            "Выберите сессию для формирования отчета:",
+            reply_markup=sessions_keyboard
+        )
+    except BadRequest as e:
+        if "Message is not modified" in str(e):
+            pass
+        else:
+            raise
+
+
+@router.admin("admin_select_session_report_{session_id:int}")
+async def handle_admin_select_session_report(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int) -> None:
+    """Генерация отчета для сессии"""
+    query = update.callback_query
+    session = await db_async.get_session(session_id)
+    if session:
+        await _queue_session_report(query, session_id, session['session_name'])
+    else:
+        await query.answer("❌ Сессия не найдена!", show_alert=True)
+
+
+@router.admin("admin_select_session_channel_report_{session_id:int}")
+async def handle_admin_select_session_channel_report(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int) -> None:
+    """Генерация Excel отчета и скриншота для канала с маскировкой данных"""
+    query = update.callback_query
+    session = await db_async.get_session(session_id)
+    if session:
+        await _queue_channel_report(query, session_id, session['session_name'])
+    else:
+        await query.answer("❌ Сессия не найдена!", show_alert=True)
+
+
+@router.admin("admin_select_session_full_data_report_{session_id:int}")
+async def handle_admin_select_session_full_data_report(update: Update, context: ContextTypes.DEFAULT_TYPE, session_id: int) -> None:
+    """Генерация полного Excel отчета и скриншота с полными данными (без маскировки)"""
+    query = update.callback_query
+    session = await db_async.get_session(session_id)
+    if session:
+        await _queue_full_data_report(query, session_id, session['session_name'])
+    else:
+        await query.answer("❌ Сессия не найдена!", show_alert=True)
@@ -1,11 +1,10 @@
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-import sqlite3
 import database
 
 
 def get_managers_keyboard(action: str) -> InlineKeyboardMarkup:
     """Создает клавиатуру с менеджерами"""
-    conn = sqlite3.connect(database.DB_NAME)
+    conn = database.get_connection()
     cursor = conn.cursor()
     cursor.execute("""
         SELECT m.user_id, u.first_name
@@ -0,0 +1,449 @@
+"""
+Версионные миграции схемы базы данных.
+
+Каждая миграция - функция (cursor), которая применяется один раз в своей
+транзакции. Номер примененной версии хранится в таблице schema_migrations.
+Новые изменения схемы добавляются в конец списка MIGRATIONS со следующим номером.
+"""
+import logging
+import secrets
+import sqlite3
+
+
+logger = logging.getLogger(__name__)
+
+
+def _column_exists(cursor, table: str, column: str) -> bool:
+    cursor.execute(f"PRAGMA table_info({table})")
+    return any(row[1] == column for row in cursor.fetchall())
+
+
+def _add_column_if_missing(cursor, table: str, column: str, definition: str):
+    """Добавляет колонку в существующую таблицу, если ее еще нет"""
+    if not _column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _migration_001_base_schema(cursor):
+    """Базовая схема: таблицы, которые раньше создавал init_database()"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT NOT NULL,
+            last_name TEXT,
+            language_code TEXT,
+            is_bot INTEGER DEFAULT 0,
+            is_premium INTEGER DEFAULT 0,
+            added_to_attachment_menu INTEGER DEFAULT 0,
+            can_join_groups INTEGER DEFAULT 1,
+            can_read_all_group_messages INTEGER DEFAULT 0,
+            supports_inline_queries INTEGER DEFAULT 0,
+            chat_id INTEGER,
+            first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            total_messages INTEGER DEFAULT 0
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS admins (
+            user_id INTEGER PRIMARY KEY,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS managers (
+            user_id INTEGER PRIMARY KEY,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_name TEXT NOT NULL UNIQUE,
+            is_active INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_by INTEGER,
+            FOREIGN KEY (created_by) REFERENCES users(user_id)
+        )
+    """)
+    # Поля, добавленные в sessions после первых версий бота
+    _add_column_if_missing(cursor, 'sessions', 'is_active', "INTEGER DEFAULT 0")
+    _add_column_if_missing(cursor, 'sessions', 'description', "TEXT DEFAULT ''")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS products (
+            product_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id INTEGER NOT NULL,
+            product_name TEXT NOT NULL,
+            price REAL NOT NULL,
+            boxes_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_by INTEGER,
+            FOREIGN KEY (session_id) REFERENCES sessions(session_id),
+            FOREIGN KEY (created_by) REFERENCES users(user_id)
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS settings (
+            setting_key TEXT PRIMARY KEY,
+            setting_value TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS orders (
+            order_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_number TEXT NOT NULL UNIQUE,
+            session_order_number INTEGER,
+            user_id INTEGER NOT NULL,
+            session_id INTEGER NOT NULL,
+            phone_number TEXT,
+            full_name TEXT,
+            total_amount REAL NOT NULL DEFAULT 0,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id),
+            FOREIGN KEY (session_id) REFERENCES sessions(session_id)
+        )
+    """)
+    _add_column_if_missing(cursor, 'orders', 'session_order_number', "INTEGER")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS order_items (
+            item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            price REAL NOT NULL,
+            FOREIGN KEY (order_id) REFERENCES orders(order_id),
+            FOREIGN KEY (product_id) REFERENCES products(product_id)
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_session_limits (
+            user_id INTEGER NOT NULL,
+            session_id INTEGER NOT NULL,
+            boxes_purchased INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, session_id),
+            FOREIGN KEY (user_id) REFERENCES users(user_id),
+            FOREIGN KEY (session_id) REFERENCES sessions(session_id)
+        )
+    """)
+
+    # Телефон и ФИО в профиле пользователя
+    _add_column_if_missing(cursor, 'users', 'phone_number', "TEXT")
+    _add_column_if_missing(cursor, 'users', 'full_name', "TEXT")
+
+    # Лимит на человека по умолчанию (0 - без ограничений)
+    cursor.execute("""
+        INSERT OR IGNORE INTO settings (setting_key, setting_value)
+        VALUES ('limit_per_person', '0')
+    """)
+
+
+def _migration_002_hot_query_indexes(cursor):
+    """Индексы для частых запросов по заказам, позициям и товарам"""
+    # Заказы сессии по порядку номеров, MAX(session_order_number), поиск по номерам в сессии
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_session_number
+        ON orders (session_id, session_order_number)
+    """)
+    # Счетчики по статусам и выручка сессии (покрывающий индекс)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_session_status
+        ON orders (session_id, status, total_amount)
+    """)
+    # Личный кабинет: заказы пользователя по статусу и сумма покупок (покрывающий индекс)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_user_status
+        ON orders (user_id, status, total_amount)
+    """)
+    # Корзина пользователя в сессии
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_user_session
+        ON orders (user_id, session_id)
+    """)
+    # Поиск заказа по номеру в сессии без указания сессии
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_session_order_number
+        ON orders (session_order_number)
+    """)
+    # Отчеты за период
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_created_at
+        ON orders (created_at)
+    """)
+    # Позиции заказа (покрывающий индекс для сумм количества)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_order_items_order
+        ON order_items (order_id, product_id, quantity)
+    """)
+    # Продажи по товару
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_order_items_product
+        ON order_items (product_id, quantity)
+    """)
+    # Товары сессии в порядке добавления
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_products_session
+        ON products (session_id, created_at)
+    """)
+
+
+def _migration_003_order_number_counters(cursor):
+    """Счетчики номеров заказов: порядковый номер в сессии и пул кодов заказа"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS session_order_counters (
+            session_id INTEGER PRIMARY KEY,
+            last_number INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (session_id) REFERENCES sessions(session_id)
+        )
+    """)
+    # Продолжаем нумерацию с уже выданных номеров
+    cursor.execute("""
+        INSERT OR IGNORE INTO session_order_counters (session_id, last_number)
+        SELECT session_id, MAX(session_order_number)
+        FROM orders
+        WHERE session_order_number IS NOT NULL
+        GROUP BY session_id
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS order_code_pool (
+            pool_id INTEGER PRIMARY KEY CHECK (pool_id = 1),
+            next_index INTEGER NOT NULL DEFAULT 0,
+            secret TEXT NOT NULL
+        )
+    """)
+    cursor.execute(
+        "INSERT OR IGNORE INTO order_code_pool (pool_id, next_index, secret) VALUES (1, 0, ?)",
+        (secrets.token_hex(16),)
+    )
+
+
+def _migration_004_session_sales_rollups(cursor):
+    """Сводные счетчики продаж по сессиям и товарам (см. rollups.py)"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS session_stats (
+            session_id INTEGER PRIMARY KEY,
+            total_orders INTEGER NOT NULL DEFAULT 0,
+            pending_orders INTEGER NOT NULL DEFAULT 0,
+            processing_orders INTEGER NOT NULL DEFAULT 0,
+            completed_orders INTEGER NOT NULL DEFAULT 0,
+            cancelled_orders INTEGER NOT NULL DEFAULT 0,
+            total_revenue REAL NOT NULL DEFAULT 0,
+            boxes_sold INTEGER NOT NULL DEFAULT 0,
+            unique_customers INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS session_customers (
+            session_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            orders_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (session_id, user_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS product_sales (
+            session_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            sold_boxes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (session_id, product_id)
+        ) WITHOUT ROWID
+    """)
+    # Заполняем по уже существующим заказам. Запросы - на схему версии 4 (orders и
+    # order_items), а не rollups.rebuild: миграция не должна меняться вместе с кодом
+    cursor.execute("DELETE FROM session_stats")
+    cursor.execute("DELETE FROM session_customers")
+    cursor.execute("DELETE FROM product_sales")
+    cursor.execute("""
+        INSERT INTO session_stats (
+            session_id, total_orders, pending_orders, processing_orders, completed_orders,
+            cancelled_orders, total_revenue, boxes_sold, unique_customers
+        )
+        SELECT
+            o.session_id,
+            COUNT(*),
+            SUM(o.status = 'pending'),
+            SUM(o.status = 'processing'),
+            SUM(o.status = 'completed'),
+            SUM(o.status = 'cancelled'),
+            COALESCE(SUM(CASE WHEN o.status = 'completed' THEN o.total_amount END), 0),
+            COALESCE(SUM(CASE WHEN o.status = 'completed' THEN (
+                SELECT SUM(oi.quantity) FROM order_items oi WHERE oi.order_id = o.order_id
+            ) END), 0),
+            COUNT(DISTINCT o.user_id)
+        FROM orders o
+        GROUP BY o.session_id
+    """)
+    cursor.execute("""
+        INSERT INTO session_customers (session_id, user_id, orders_count)
+        SELECT o.session_id, o.user_id, COUNT(*)
+        FROM orders o
+        GROUP BY o.session_id, o.user_id
+    """)
+    cursor.execute("""
+        INSERT INTO product_sales (session_id, product_id, sold_boxes)
+        SELECT o.session_id, oi.product_id, SUM(oi.quantity)
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.order_id
+        WHERE o.status = 'completed'
+        GROUP BY o.session_id, oi.product_id
+    """)
+
+
+def _migration_005_user_rollups(cursor):
+    """Счетчики покупок пользователя для личного кабинета (см. rollups.py)"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            completed_orders INTEGER NOT NULL DEFAULT 0,
+            open_orders INTEGER NOT NULL DEFAULT 0,
+            total_boxes INTEGER NOT NULL DEFAULT 0,
+            total_amount REAL NOT NULL DEFAULT 0
+        )
+    """)
+    # Заполняем по уже существующим заказам (запросы - на схему версии 5).
+    # user_session_limits раньше обновлялся вручную в каждой функции - пересчитываем
+    cursor.execute("DELETE FROM user_stats")
+    cursor.execute("DELETE FROM user_session_limits")
+    cursor.execute("""
+        INSERT INTO user_stats (user_id, completed_orders, open_orders, total_boxes, total_amount)
+        SELECT
+            o.user_id,
+            SUM(o.status = 'completed'),
+            SUM(o.status NOT IN ('completed', 'cancelled')),
+            COALESCE(SUM(CASE WHEN o.status = 'completed' THEN (
+                SELECT SUM(oi.quantity) FROM order_items oi WHERE oi.order_id = o.order_id
+            ) END), 0),
+            COALESCE(SUM(CASE WHEN o.status = 'completed' THEN o.total_amount END), 0)
+        FROM orders o
+        GROUP BY o.user_id
+    """)
+    cursor.execute("""
+        INSERT INTO user_session_limits (user_id, session_id, boxes_purchased)
+        SELECT o.user_id, o.session_id, SUM(oi.quantity)
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.order_id
+        WHERE o.status = 'completed'
+        GROUP BY o.user_id, o.session_id
+    """)
+
+
+def _migration_006_order_keyset_index(cursor):
+    """Индекс для постраничного чтения заказов сессии (database.iter_session_orders)"""
+    # У заказов, созданных до нумерации по сессиям, session_order_number пустой -
+    # COALESCE ставит их первыми, order_id (rowid) в индексе задает порядок при равенстве
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_session_keyset
+        ON orders (session_id, COALESCE(session_order_number, 0))
+    """)
+
+
+def _migration_007_session_archive_flag(cursor):
+    """Отметка о переносе сессии в архив (archive.py)"""
+    _add_column_if_missing(cursor, 'sessions', 'archived_at', "TIMESTAMP")
+
+
+def _migration_008_conversation_state(cursor):
+    """Текущее состояние диалога пользователя (handlers/conversation.py)"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_state (
+            user_id INTEGER PRIMARY KEY,
+            state TEXT NOT NULL,
+            data TEXT NOT NULL DEFAULT '{}',
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_conversation_state_expires ON conversation_state (expires_at)")
+
+
+def _migration_009_session_created_index(cursor):
+    """Индекс для отчета за все время по сессиям (database.iter_orders_by_period(by_session=True))"""
+    # Внутри сессии заказы идут по created_at, при равенстве - по order_id (rowid в индексе)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_session_created
+        ON orders (session_id, created_at)
+    """)
+
+
+# Список миграций: (версия, описание, функция). Порядок и номера не менять.
+MIGRATIONS = [
+    (1, "Базовая схема", _migration_001_base_schema),
+    (2, "Индексы для частых запросов", _migration_002_hot_query_indexes),
+    (3, "Счетчики номеров заказов", _migration_003_order_number_counters),
+    (4, "Счетчики продаж по сессиям", _migration_004_session_sales_rollups),
+    (5, "Счетчики покупок пользователей", _migration_005_user_rollups),
+    (6, "Индекс постраничного чтения заказов сессии", _migration_006_order_keyset_index),
+    (7, "Отметка об архивации сессии", _migration_007_session_archive_flag),
+    (8, "Состояние диалога пользователя", _migration_008_conversation_state),
+    (9, "Индекс заказов сессии по дате", _migration_009_session_created_index),
+]
+
+
+def get_schema_version(conn) -> int:
+    """Возвращает номер последней примененной миграции (0, если миграций не было)"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    return cursor.fetchone()[0]
+
+
+def migrate(conn) -> list:
+    """
+    Применяет все еще не примененные миграции.
+
+    Каждая миграция выполняется в своей транзакции (BEGIN IMMEDIATE), так что
+    два одновременно запущенных процесса не применят одну миграцию дважды.
+    После применения хотя бы одной миграции выполняется ANALYZE, иначе -
+    PRAGMA optimize. Возвращает список номеров примененных миграций.
+    """
+    current = get_schema_version(conn)
+    conn.commit()
+    applied = []
+    for version, name, apply in MIGRATIONS:
+        if version <= current:
+            continue
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute("SELECT 1 FROM schema_migrations WHERE version = ?", (version,))
+            if cursor.fetchone():
+                conn.rollback()
+                continue
+            apply(cursor)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (?, ?)",
+                (version, name)
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error(f"Ошибка миграции {version} ({name}): {e}")
+            raise
+        applied.append(version)
+        logger.info(f"Применена миграция {version}: {name}")
+
+    if applied:
+        # Обновляем статистику планировщика под новые индексы
+        conn.execute("ANALYZE")
+    else:
+        conn.execute("PRAGMA optimize")
+    conn.commit()
+    return applied
@@ -1,5 +1,6 @@
 import qrcode
 import io
+from typing import Optional
 from PIL import Image
 
 
@@ -24,6 +25,17 @@ def generate_qr_code(order_number: str) -> io.BytesIO:
     return qr_bytes
 
 
+def decode_qr_code(image_bytes: bytes) -> Optional[str]:
+    """Распознает QR-код на фото (pyzbar); возвращает текст первого найденного кода или None"""
+    from pyzbar import pyzbar
+
+    img = Image.open(io.BytesIO(image_bytes))
+    decoded_objects = pyzbar.decode(img)
+    if not decoded_objects:
+        return None
+    return decoded_objects[0].data.decode('utf-8')
+
+
 def mask_phone(phone: str) -> str:
     """Маскирует номер телефона звездочками"""
     if not phone or len(phone) < 4:
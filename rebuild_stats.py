@@ -0,0 +1,36 @@
+"""Пересчитывает счетчики (rollups.py) с нуля по таблицам заказов или сверяет их.
+
+Запуск:
+    python rebuild_stats.py [session_id]  - пересчет всех счетчиков или одной сессии
+    python rebuild_stats.py --check       - сверка счетчиков с заказами без изменений
+Нужен после изменения заказов в обход бота (ручные правки БД, старые скрипты).
+"""
+import sys
+import database
+
+
+def main():
+    database.init_database()
+    args = sys.argv[1:]
+    if args and args[0] == '--check':
+        problems = database.check_rollups()
+        if problems is None:
+            print("Ошибка при сверке счетчиков, подробности в логе.")
+            sys.exit(2)
+        if not problems:
+            print("Счетчики сходятся с заказами.")
+            return
+        for table, info in problems.items():
+            print(f"{table}: расходится строк - {info['mismatched']}, например {info['sample']}")
+        sys.exit(1)
+
+    session_id = int(args[0]) if args else None
+    if database.rebuild_session_stats(session_id):
+        target = f"сессии {session_id}" if session_id is not None else "всех сессий и пользователей"
+        print(f"Счетчики {target} пересчитаны.")
+    else:
+        print("Ошибка при пересчете счетчиков, подробности в логе.")
+
+
+if __name__ == '__main__':
+    main()
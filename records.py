@@ -0,0 +1,164 @@
+"""
+Компактные записи для строк БД.
+
+Раньше каждая функция database.py собирала из кортежа новый словарь
+с одним и тем же списком ключей. Записи хранят поля в __slots__ (без
+словаря на каждый экземпляр), поэтому отчеты, которые держат тысячи строк,
+расходуют заметно меньше памяти.
+
+Запись создается фабрикой строк курсора: имена полей берутся из имен
+колонок запроса (для выражений нужен AS), поэтому одна запись описывает
+любые выборки из таблицы:
+
+    cursor = conn.cursor()
+    cursor.row_factory = records.row_factory(records.Order)
+    cursor.execute("SELECT order_id, status FROM orders WHERE ...")
+    order = cursor.fetchone()
+    order.status, order['status'], order.get('full_name')  # None - колонка не выбиралась
+
+На время перехода запись ведет себя как словарь: order['status'],
+order.get(...), 'status' in order, dict(order). Ключами считаются только
+выбранные колонки, как у прежних словарей.
+"""
+
+
+class Record:
+    """Строка БД с доступом к полям как к атрибутам и как к ключам словаря"""
+
+    __slots__ = ('_fields',)
+
+    def __init__(self, fields: tuple, values):
+        """
+        Параметры:
+            fields - имена полей (должны быть в __slots__ класса)
+            values - значения в том же порядке
+        """
+        self._fields = fields
+        for name, value in zip(fields, values):
+            setattr(self, name, value)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """Запись из словаря"""
+        return cls(tuple(data), data.values())
+
+    def __getitem__(self, key):
+        if key in self._fields:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self._fields:
+            if key not in self.__slots__:
+                raise KeyError(key)
+            self._fields = self._fields + (key,)
+        setattr(self, key, value)
+
+    def __contains__(self, key) -> bool:
+        return key in self._fields
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+    def get(self, key, default=None):
+        """Как dict.get: значение поля или default, если поле не выбиралось"""
+        if key in self._fields:
+            return getattr(self, key)
+        return default
+
+    def keys(self) -> tuple:
+        """Имена выбранных полей"""
+        return self._fields
+
+    def to_dict(self) -> dict:
+        """Обычный словарь с теми же ключами"""
+        return {name: getattr(self, name) for name in self._fields}
+
+    def copy(self, **changes):
+        """Копия записи; changes - новые значения полей"""
+        record = self.__class__.__new__(self.__class__)
+        record._fields = self._fields + tuple(name for name in changes if name not in self._fields)
+        for name in self._fields:
+            setattr(record, name, getattr(self, name))
+        for name, value in changes.items():
+            setattr(record, name, value)
+        return record
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return self.__class__ is other.__class__ and self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self._fields)
+        return f"{self.__class__.__name__}({fields})"
+
+
+class Order(Record):
+    """Заказ (orders) и вычисляемые поля выборок: товары одной строкой, название сессии"""
+    __slots__ = (
+        'order_id', 'order_number', 'session_order_number', 'user_id', 'session_id',
+        'phone_number', 'full_name', 'total_amount', 'status', 'created_at',
+        'items', 'session_name',
+    )
+
+
+class OrderItem(Record):
+    """Позиция заказа (order_items) с названием товара"""
+    __slots__ = ('item_id', 'order_id', 'product_id', 'quantity', 'price', 'product_name')
+
+
+class Product(Record):
+    """Товар (products)"""
+    __slots__ = ('product_id', 'session_id', 'product_name', 'price', 'boxes_count', 'created_by', 'created_at')
+
+
+class Session(Record):
+    """Сессия продаж (sessions)"""
+    __slots__ = ('session_id', 'session_name', 'is_active', 'created_at', 'description', 'created_by', 'archived_at')
+
+
+class User(Record):
+    """Пользователь (users)"""
+    __slots__ = (
+        'user_id', 'username', 'first_name', 'last_name', 'language_code',
+        'is_bot', 'is_premium', 'added_to_attachment_menu',
+        'can_join_groups', 'can_read_all_group_messages',
+        'supports_inline_queries', 'chat_id', 'first_seen', 'last_seen', 'total_messages',
+        'phone_number', 'full_name',
+    )
+
+
+def _make_factory(cls):
+    # Имена колонок вычисляются один раз на запрос: description курсора -
+    # один и тот же объект для всех строк результата
+    layout = (None, ())
+
+    def make(cursor, row):
+        nonlocal layout
+        description, fields = layout
+        if description is not cursor.description:
+            description = cursor.description
+            fields = tuple(column[0] for column in description)
+            layout = (description, fields)
+        return cls(fields, row)
+
+    return make
+
+
+_factories = {}
+
+
+def row_factory(cls):
+    """Фабрика строк для cursor.row_factory: строка запроса -> запись cls"""
+    factory = _factories.get(cls)
+    if factory is None:
+        factory = _factories.setdefault(cls, _make_factory(cls))
+    return factory
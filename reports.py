@@ -1,5 +1,6 @@
 import sqlite3
 import database
+import db_async
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from openpyxl.utils import get_column_letter
@@ -8,14 +9,40 @@ import io
 import qr_code
 
 
+def _with_items(batch: list):
+    """Пары (заказ, товары заказа); товары всей пачки читаются одним запросом"""
+    items = database.get_order_items_bulk([order['order_id'] for order in batch])
+    for order in batch:
+        yield order, items.get(order['order_id'], [])
+
+
+def _session_orders(session_id: int, exclude_statuses: tuple = ()):
+    """
+    Заказы сессии с товарами по одному: (заказ, товары заказа).
+
+    Из БД читаются пачками (database.iter_session_orders), товары - одним
+    запросом на пачку. Заказы со статусами exclude_statuses пропускаются
+    до чтения товаров.
+    """
+    for batch in database.iter_session_orders(session_id):
+        if exclude_statuses:
+            batch = [order for order in batch if order['status'] not in exclude_statuses]
+        yield from _with_items(batch)
+
+
+def _period_orders(period: str, by_session: bool = False):
+    """Заказы за период с товарами по одному: (заказ, товары заказа); из БД читаются пачками"""
+    for batch in database.iter_orders_by_period(period, by_session=by_session):
+        yield from _with_items(batch)
+
+
 def generate_session_report_excel(session_id: int) -> io.BytesIO:
     """Генерирует полный Excel отчет по сессии"""
     session = database.get_session(session_id)
     if not session:
         raise ValueError("Сессия не найдена")
     
-    # Получаем данные
-    orders = database.get_session_orders(session_id)
+    # Заказы читаются пачками за один проход; итоги листов считаются по ходу
     products = database.get_products_by_session(session_id)
     
     # Создаем рабочую книгу
@@ -45,27 +72,6 @@ def generate_session_report_excel(session_id: int) -> io.BytesIO:
     
     ws_summary['A3'] = "Дата создания сессии:"
     ws_summary['B3'] = session['created_at']
-    ws_summary['A4'] = "Всего заказов:"
-    ws_summary['B4'] = len(orders)
-    
-    completed_orders = [o for o in orders if o['status'] == 'completed']
-    pending_orders = [o for o in orders if o['status'] == 'pending']
-    processing_orders = [o for o in orders if o['status'] == 'processing']
-    cancelled_orders = [o for o in orders if o['status'] == 'cancelled']
-    
-    ws_summary['A5'] = "Выдано заказов:"
-    ws_summary['B5'] = len(completed_orders)
-    ws_summary['A6'] = "Ожидает обработки:"
-    ws_summary['B6'] = len(pending_orders)
-    ws_summary['A7'] = "В обработке:"
-    ws_summary['B7'] = len(processing_orders)
-    ws_summary['A8'] = "Отменено:"
-    ws_summary['B8'] = len(cancelled_orders)
-    
-    total_revenue = sum(o['total_amount'] for o in completed_orders)
-    ws_summary['A9'] = "Выручка (выданные заказы):"
-    ws_summary['B9'] = total_revenue
-    ws_summary['B9'].number_format = '#,##0.00₽'
     
     # Лист 2: Продажи
     ws_sales = wb.create_sheet("Продажи")
@@ -79,12 +85,44 @@ def generate_session_report_excel(session_id: int) -> io.BytesIO:
         cell.alignment = center_align
         cell.border = border
     
-    row = 2
+    # Счетчики по статусам, проданное по товарам и клиенты
+    status_counts = {'completed': 0, 'pending': 0, 'processing': 0, 'cancelled': 0}
+    orders_count = 0
+    total_revenue = 0
     total_boxes_sold = 0
-    for order in orders:
-        order_items = database.get_order_items(order['order_id'])
+    product_sales = {}
+    customers_dict = {}
+    
+    row = 2
+    for order, order_items in _session_orders(session_id):
         boxes_in_order = sum(item['quantity'] for item in order_items)
-        total_boxes_sold += boxes_in_order if order['status'] == 'completed' else 0
+        
+        orders_count += 1
+        if order['status'] in status_counts:
+            status_counts[order['status']] += 1
+        if order['status'] == 'completed':
+            total_revenue += order['total_amount']
+            total_boxes_sold += boxes_in_order
+            for item in order_items:
+                sold = product_sales.setdefault(item['product_id'], {'count': 0, 'revenue': 0})
+                sold['count'] += item['quantity']
+                sold['revenue'] += item['quantity'] * item['price']
+        
+        # Группируем заказы по клиентам (комбинация ФИО и телефона как ключ)
+        customer_key = f"{order['full_name']}_{order['phone_number']}"
+        if customer_key not in customers_dict:
+            customers_dict[customer_key] = {
+                'full_name': order['full_name'],
+                'phone_number': order['phone_number'],
+                'user_id': order['user_id'],
+                'order_numbers': [],
+                'total_amount': 0,
+                'total_boxes': 0
+            }
+        customer = customers_dict[customer_key]
+        customer['order_numbers'].append(order['order_number'])
+        customer['total_amount'] += order['total_amount']
+        customer['total_boxes'] += boxes_in_order
         
         items_text = ", ".join([f"{item['product_name']} x{item['quantity']}" for item in order_items])
         
@@ -103,6 +141,23 @@ def generate_session_report_excel(session_id: int) -> io.BytesIO:
         
         row += 1
     
+    completed_count = status_counts['completed']
+    
+    ws_summary['A4'] = "Всего заказов:"
+    ws_summary['B4'] = orders_count
+    ws_summary['A5'] = "Выдано заказов:"
+    ws_summary['B5'] = completed_count
+    ws_summary['A6'] = "Ожидает обработки:"
+    ws_summary['B6'] = status_counts['pending']
+    ws_summary['A7'] = "В обработке:"
+    ws_summary['B7'] = status_counts['processing']
+    ws_summary['A8'] = "Отменено:"
+    ws_summary['B8'] = status_counts['cancelled']
+    
+    ws_summary['A9'] = "Выручка (выданные заказы):"
+    ws_summary['B9'] = total_revenue
+    ws_summary['B9'].number_format = '#,##0.00₽'
+    
     # Автоподбор ширины колонок
     for col in range(1, 9):
         ws_sales.column_dimensions[get_column_letter(col)].width = 15
@@ -121,16 +176,10 @@ def generate_session_report_excel(session_id: int) -> io.BytesIO:
     
     row = 2
     for product in products:
-        # Подсчитываем проданное количество
-        sold_count = 0
-        product_revenue = 0
-        
-        for order in completed_orders:
-            order_items = database.get_order_items(order['order_id'])
-            for item in order_items:
-                if item['product_id'] == product['product_id']:
-                    sold_count += item['quantity']
-                    product_revenue += item['quantity'] * item['price']
+        # Проданное количество посчитано при проходе по заказам
+        sold = product_sales.get(product['product_id'], {'count': 0, 'revenue': 0})
+        sold_count = sold['count']
+        product_revenue = sold['revenue']
         
         remaining = product['boxes_count']
         
@@ -164,45 +213,21 @@ def generate_session_report_excel(session_id: int) -> io.BytesIO:
         cell.alignment = center_align
         cell.border = border
     
-    # Группируем заказы по клиентам
-    customers_dict = {}
-    for order in orders:
-        # Используем комбинацию ФИО и телефона как ключ
-        customer_key = f"{order['full_name']}_{order['phone_number']}"
-        
-        if customer_key not in customers_dict:
-            customers_dict[customer_key] = {
-                'full_name': order['full_name'],
-                'phone_number': order['phone_number'],
-                'user_id': order['user_id'],
-                'orders': [],
-                'total_amount': 0,
-                'total_boxes': 0
-            }
-        
-        customers_dict[customer_key]['orders'].append(order)
-        customers_dict[customer_key]['total_amount'] += order['total_amount']
-        
-        # Подсчитываем ящики в заказе
-        order_items = database.get_order_items(order['order_id'])
-        boxes_in_order = sum(item['quantity'] for item in order_items)
-        customers_dict[customer_key]['total_boxes'] += boxes_in_order
-    
     # Сортируем клиентов по количеству заказов (от большего к меньшему)
     customers_list = sorted(
         customers_dict.values(),
-        key=lambda x: len(x['orders']),
+        key=lambda x: len(x['order_numbers']),
         reverse=True
     )
     
     row = 2
     for idx, customer in enumerate(customers_list, 1):
-        order_numbers = ", ".join([f"#{o['order_number']}" for o in customer['orders']])
+        order_numbers = ", ".join([f"#{number}" for number in customer['order_numbers']])
         
         ws_customers.cell(row=row, column=1).value = idx
         ws_customers.cell(row=row, column=2).value = customer['full_name']
         ws_customers.cell(row=row, column=3).value = customer['phone_number']
-        ws_customers.cell(row=row, column=4).value = len(customer['orders'])
+        ws_customers.cell(row=row, column=4).value = len(customer['order_numbers'])
         ws_customers.cell(row=row, column=5).value = order_numbers
         ws_customers.cell(row=row, column=6).value = customer['total_amount']
         ws_customers.cell(row=row, column=6).number_format = '#,##0.00₽'
@@ -231,17 +256,17 @@ def generate_session_report_excel(session_id: int) -> io.BytesIO:
     
     row = 3
     stats = [
-        ("Всего заказов", len(orders)),
-        ("Выдано заказов", len(completed_orders)),
-        ("Ожидает обработки", len(pending_orders)),
-        ("В обработке", len(processing_orders)),
-        ("Отменено", len(cancelled_orders)),
+        ("Всего заказов", orders_count),
+        ("Выдано заказов", completed_count),
+        ("Ожидает обработки", status_counts['pending']),
+        ("В обработке", status_counts['processing']),
+        ("Отменено", status_counts['cancelled']),
         ("", ""),
         ("Всего клиентов", len(customers_list)),
         ("", ""),
         ("Общая выручка", total_revenue),
         ("Всего продано ящиков", total_boxes_sold),
-        ("Средний чек", total_revenue / len(completed_orders) if completed_orders else 0),
+        ("Средний чек", total_revenue / completed_count if completed_count else 0),
     ]
     
     for label, value in stats:
@@ -265,15 +290,6 @@ def generate_session_report_excel(session_id: int) -> io.BytesIO:
 
 def generate_period_report_excel(period: str) -> io.BytesIO:
     """Генерирует полный Excel отчет за период по всем сессиям"""
-    from datetime import datetime, timedelta
-    
-    # Получаем данные за период
-    orders = database.get_orders_by_period(period)
-    
-    # Получаем все сессии, которые были в этом периоде
-    session_ids = list(set([o['session_id'] for o in orders]))
-    sessions = [database.get_session(sid) for sid in session_ids if database.get_session(sid)]
-    
     # Определяем название периода
     period_names = {
         "week": "неделю",
@@ -299,167 +315,66 @@ def generate_period_report_excel(period: str) -> io.BytesIO:
     )
     center_align = Alignment(horizontal='center', vertical='center')
     
-    # Лист 1: Общая информация
+    # Лист 1: Общая информация (заполняется после прохода по заказам)
     ws_summary = wb.create_sheet("Общая информация")
     
     ws_summary['A1'] = f"ОТЧЕТ ЗА {period_name.upper()}"
     ws_summary['A1'].font = title_font
     ws_summary.merge_cells('A1:D1')
     
-    completed_orders = [o for o in orders if o['status'] == 'completed']
-    pending_orders = [o for o in orders if o['status'] == 'pending']
-    processing_orders = [o for o in orders if o['status'] == 'processing']
-    cancelled_orders = [o for o in orders if o['status'] == 'cancelled']
-    
-    total_revenue = sum(o['total_amount'] for o in completed_orders)
-    total_boxes_sold = 0
-    for order in completed_orders:
-        order_items = database.get_order_items(order['order_id'])
-        total_boxes_sold += sum(item['quantity'] for item in order_items)
-    
-    ws_summary['A3'] = "Период:"
-    ws_summary['B3'] = period_name
-    ws_summary['A4'] = "Всего заказов:"
-    ws_summary['B4'] = len(orders)
-    ws_summary['A5'] = "Выдано заказов:"
-    ws_summary['B5'] = len(completed_orders)
-    ws_summary['A6'] = "Ожидает обработки:"
-    ws_summary['B6'] = len(pending_orders)
-    ws_summary['A7'] = "В обработке:"
-    ws_summary['B7'] = len(processing_orders)
-    ws_summary['A8'] = "Отменено:"
-    ws_summary['B8'] = len(cancelled_orders)
-    ws_summary['A9'] = "Всего сессий:"
-    ws_summary['B9'] = len(sessions)
-    ws_summary['A10'] = "Общая выручка:"
-    ws_summary['B10'] = total_revenue
-    ws_summary['B10'].number_format = '#,##0.00₽'
-    ws_summary['A11'] = "Всего продано ящиков:"
-    ws_summary['B11'] = total_boxes_sold
-    
     # Лист 2: Все заказы
     ws_orders = wb.create_sheet("Все заказы")
     
     headers_orders = ["№ заказа", "Сессия", "ФИО", "Телефон", "Товары", "Ящиков", "Сумма", "Статус", "Дата"]
     
-    # Если период "all_time", группируем по сессиям с заголовками
-    if period == "all_time":
-        row = 1
-        
-        # Группируем заказы по сессиям
-        orders_by_session = {}
-        for order in orders:
-            session_id = order['session_id']
-            if session_id not in orders_by_session:
-                orders_by_session[session_id] = []
-            orders_by_session[session_id].append(order)
-        
-        # Сортируем сессии по дате создания (если есть)
-        sorted_sessions = sorted(sessions, key=lambda s: s.get('created_at', ''), reverse=True)
-        
-        session_header_fill = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
-        session_header_font = Font(bold=True, size=13)
+    # Заказы читаются пачками за один проход; итоги, клиенты и статистика
+    # по сессиям считаются по ходу
+    status_counts = {'completed': 0, 'pending': 0, 'processing': 0, 'cancelled': 0}
+    orders_count = 0
+    total_revenue = 0
+    total_boxes_sold = 0
+    customers_dict = {}
+    # Итоги по существующим сессиям периода: session_id -> счетчики
+    session_totals = {}
+    
+    session_header_fill = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
+    session_header_font = Font(bold=True, size=13)
+    summary_fill = PatternFill(start_color="E6E6FA", end_color="E6E6FA", fill_type="solid")
+    summary_font = Font(bold=True, size=11)
+    
+    def write_session_summary(row: int, totals: dict):
+        """Строка итогов сессии под ее заказами"""
+        session = totals['session']
+        # Статус сессии
+        session_status = "Активна" if session.get('is_active') else "Закрыта"
+        # Дата завершения (дата последнего заказа или дата создания сессии)
+        session_end_date = totals['last_order_date'] or session.get('created_at', '')
         
-        for idx, session in enumerate(sorted_sessions):
-            session_id = session['session_id']
-            if session_id not in orders_by_session:
-                continue
-            
-            session_orders = orders_by_session[session_id]
-            
-            # Заголовок сессии (для каждой сессии, включая первую)
-            ws_orders.cell(row=row, column=1).value = f"СЕССИЯ: {session['session_name']}"
-            ws_orders.cell(row=row, column=1).font = session_header_font
-            ws_orders.cell(row=row, column=1).fill = session_header_fill
-            ws_orders.merge_cells(f'A{row}:I{row}')
-            row += 1
-            
-            # Заголовки таблицы для этой сессии (после каждого заголовка сессии)
-            for col, header in enumerate(headers_orders, 1):
-                cell = ws_orders.cell(row=row, column=col)
-                cell.value = header
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.alignment = center_align
-                cell.border = border
-            row += 1
-            
-            # Заказы этой сессии
-            session_total_amount = 0
-            session_total_boxes = 0
-            session_completed_count = 0
-            last_order_date = None
-            
-            for order in session_orders:
-                order_items = database.get_order_items(order['order_id'])
-                boxes_in_order = sum(item['quantity'] for item in order_items)
-                
-                ws_orders.cell(row=row, column=1).value = order['order_number']
-                ws_orders.cell(row=row, column=2).value = session['session_name']
-                ws_orders.cell(row=row, column=3).value = order['full_name']
-                ws_orders.cell(row=row, column=4).value = order['phone_number']
-                ws_orders.cell(row=row, column=5).value = order['items']
-                ws_orders.cell(row=row, column=6).value = boxes_in_order
-                ws_orders.cell(row=row, column=7).value = order['total_amount']
-                ws_orders.cell(row=row, column=7).number_format = '#,##0.00₽'
-                ws_orders.cell(row=row, column=8).value = database.get_order_status_ru(order['status'])
-                ws_orders.cell(row=row, column=9).value = order['created_at']
-                
-                # Подсчитываем статистику
-                session_total_amount += order['total_amount']
-                session_total_boxes += boxes_in_order
-                if order['status'] == 'completed':
-                    session_completed_count += 1
-                if not last_order_date or order['created_at'] > last_order_date:
-                    last_order_date = order['created_at']
-                
-                for col in range(1, 10):
-                    ws_orders.cell(row=row, column=col).border = border
-                
-                row += 1
-            
-            # Добавляем строку с итогами сессии
-            summary_fill = PatternFill(start_color="E6E6FA", end_color="E6E6FA", fill_type="solid")
-            summary_font = Font(bold=True, size=11)
-            
-            # Статус сессии
-            session_status = "Активна" if session.get('is_active') else "Закрыта"
-            # Дата завершения (дата последнего заказа или дата создания сессии)
-            session_end_date = last_order_date if last_order_date else session.get('created_at', '')
-            
-            ws_orders.cell(row=row, column=1).value = "ИТОГИ СЕССИИ:"
-            ws_orders.cell(row=row, column=1).font = summary_font
-            ws_orders.cell(row=row, column=1).fill = summary_fill
-            ws_orders.cell(row=row, column=2).value = f"Заказов: {len(session_orders)}"
-            ws_orders.cell(row=row, column=2).font = summary_font
-            ws_orders.cell(row=row, column=2).fill = summary_fill
-            ws_orders.cell(row=row, column=3).value = f"Выдано: {session_completed_count}"
-            ws_orders.cell(row=row, column=3).font = summary_font
-            ws_orders.cell(row=row, column=3).fill = summary_fill
-            ws_orders.cell(row=row, column=4).value = f"Ящиков: {session_total_boxes}"
-            ws_orders.cell(row=row, column=4).font = summary_font
-            ws_orders.cell(row=row, column=4).fill = summary_fill
-            ws_orders.cell(row=row, column=5).value = f"Выручка: {session_total_amount:.2f}₽"
-            ws_orders.cell(row=row, column=5).font = summary_font
-            ws_orders.cell(row=row, column=5).fill = summary_fill
-            ws_orders.cell(row=row, column=6).value = ""  # Пусто
-            ws_orders.cell(row=row, column=6).fill = summary_fill
-            ws_orders.cell(row=row, column=7).value = ""  # Пусто
-            ws_orders.cell(row=row, column=7).fill = summary_fill
-            ws_orders.cell(row=row, column=8).value = f"Статус: {session_status}"
-            ws_orders.cell(row=row, column=8).font = summary_font
-            ws_orders.cell(row=row, column=8).fill = summary_fill
-            ws_orders.cell(row=row, column=9).value = f"Дата: {session_end_date}"
-            ws_orders.cell(row=row, column=9).font = summary_font
-            ws_orders.cell(row=row, column=9).fill = summary_fill
-            
-            # Применяем границы и объединяем ячейки для лучшего вида
-            for col in range(1, 10):
-                ws_orders.cell(row=row, column=col).border = border
-            
-            row += 1
+        values = [
+            "ИТОГИ СЕССИИ:",
+            f"Заказов: {totals['orders']}",
+            f"Выдано: {totals['completed']}",
+            f"Ящиков: {totals['all_boxes']}",
+            f"Выручка: {totals['all_amount']:.2f}₽",
+            "",  # Пусто
+            "",  # Пусто
+            f"Статус: {session_status}",
+            f"Дата: {session_end_date}",
+        ]
+        for col, value in enumerate(values, 1):
+            cell = ws_orders.cell(row=row, column=col)
+            cell.value = value
+            if value:
+                cell.font = summary_font
+            cell.fill = summary_fill
+            cell.border = border
+    
+    # Если период "all_time", заказы идут по сессиям (от новых к старым),
+    # у каждой сессии свой заголовок и строка итогов
+    grouped = period == "all_time"
+    if grouped:
+        row = 1
     else:
-        # Для других периодов оставляем как было
         for col, header in enumerate(headers_orders, 1):
             cell = ws_orders.cell(row=1, column=col)
             cell.value = header
@@ -467,34 +382,131 @@ def generate_period_report_excel(period: str) -> io.BytesIO:
             cell.fill = header_fill
             cell.alignment = center_align
             cell.border = border
-        
         row = 2
-        for order in orders:
-            session = database.get_session(order['session_id'])
+    current_session_id = None
+    
+    for order, order_items in _period_orders(period, by_session=grouped):
+        boxes_in_order = sum(item['quantity'] for item in order_items)
+        session = database.get_session(order['session_id'])
+        
+        orders_count += 1
+        if order['status'] in status_counts:
+            status_counts[order['status']] += 1
+        if order['status'] == 'completed':
+            total_revenue += order['total_amount']
+            total_boxes_sold += boxes_in_order
+        
+        # Группируем заказы по клиентам
+        customer_key = f"{order['full_name']}_{order['phone_number']}"
+        if customer_key not in customers_dict:
+            customers_dict[customer_key] = {
+                'full_name': order['full_name'],
+                'phone_number': order['phone_number'],
+                'order_numbers': [],
+                'total_amount': 0,
+                'total_boxes': 0
+            }
+        customer = customers_dict[customer_key]
+        # При группировке по сессиям заказы идут не по дате - порядок восстанавливается при выводе:
+        # по убыванию created_at, при равенстве - по возрастанию order_id (как iter_orders_by_period)
+        customer['order_numbers'].append((order['created_at'], -order['order_id'], order['order_number']))
+        customer['total_amount'] += order['total_amount']
+        customer['total_boxes'] += boxes_in_order
+        
+        if session:
+            totals = session_totals.setdefault(order['session_id'], {
+                'session': session,
+                'orders': 0,
+                'completed': 0,
+                'revenue': 0,
+                'boxes_sold': 0,
+                'all_amount': 0,
+                'all_boxes': 0,
+                'last_order_date': None
+            })
+            totals['orders'] += 1
+            totals['all_amount'] += order['total_amount']
+            totals['all_boxes'] += boxes_in_order
+            if order['status'] == 'completed':
+                totals['completed'] += 1
+                totals['revenue'] += order['total_amount']
+                totals['boxes_sold'] += boxes_in_order
+            if not totals['last_order_date'] or order['created_at'] > totals['last_order_date']:
+                totals['last_order_date'] = order['created_at']
+        
+        if grouped:
+            # Заказы удаленных сессий учитываются только в итогах
+            if not session:
+                continue
+            if order['session_id'] != current_session_id:
+                if current_session_id is not None:
+                    write_session_summary(row, session_totals[current_session_id])
+                    row += 1
+                current_session_id = order['session_id']
+                
+                # Заголовок сессии
+                ws_orders.cell(row=row, column=1).value = f"СЕССИЯ: {session['session_name']}"
+                ws_orders.cell(row=row, column=1).font = session_header_font
+                ws_orders.cell(row=row, column=1).fill = session_header_fill
+                ws_orders.merge_cells(f'A{row}:I{row}')
+                row += 1
+                
+                # Заголовки таблицы для этой сессии
+                for col, header in enumerate(headers_orders, 1):
+                    cell = ws_orders.cell(row=row, column=col)
+                    cell.value = header
+                    cell.font = header_font
+                    cell.fill = header_fill
+                    cell.alignment = center_align
+                    cell.border = border
+                row += 1
+            session_name = session['session_name']
+        else:
             session_name = session['session_name'] if session else f"Сессия {order['session_id']}"
-            order_items = database.get_order_items(order['order_id'])
-            boxes_in_order = sum(item['quantity'] for item in order_items)
-            
-            ws_orders.cell(row=row, column=1).value = order['order_number']
-            ws_orders.cell(row=row, column=2).value = session_name
-            ws_orders.cell(row=row, column=3).value = order['full_name']
-            ws_orders.cell(row=row, column=4).value = order['phone_number']
-            ws_orders.cell(row=row, column=5).value = order['items']
-            ws_orders.cell(row=row, column=6).value = boxes_in_order
-            ws_orders.cell(row=row, column=7).value = order['total_amount']
-            ws_orders.cell(row=row, column=7).number_format = '#,##0.00₽'
-            ws_orders.cell(row=row, column=8).value = database.get_order_status_ru(order['status'])
-            ws_orders.cell(row=row, column=9).value = order['created_at']
-            
-            for col in range(1, 10):
-                ws_orders.cell(row=row, column=col).border = border
-            
-            row += 1
+        
+        ws_orders.cell(row=row, column=1).value = order['order_number']
+        ws_orders.cell(row=row, column=2).value = session_name
+        ws_orders.cell(row=row, column=3).value = order['full_name']
+        ws_orders.cell(row=row, column=4).value = order['phone_number']
+        ws_orders.cell(row=row, column=5).value = order['items']
+        ws_orders.cell(row=row, column=6).value = boxes_in_order
+        ws_orders.cell(row=row, column=7).value = order['total_amount']
+        ws_orders.cell(row=row, column=7).number_format = '#,##0.00₽'
+        ws_orders.cell(row=row, column=8).value = database.get_order_status_ru(order['status'])
+        ws_orders.cell(row=row, column=9).value = order['created_at']
+        
+        for col in range(1, 10):
+            ws_orders.cell(row=row, column=col).border = border
+        
+        row += 1
+    
+    if grouped and current_session_id is not None:
+        write_session_summary(row, session_totals[current_session_id])
     
     # Автоподбор ширины колонок
     for col in range(1, 10):
         ws_orders.column_dimensions[get_column_letter(col)].width = 15
     
+    ws_summary['A3'] = "Период:"
+    ws_summary['B3'] = period_name
+    ws_summary['A4'] = "Всего заказов:"
+    ws_summary['B4'] = orders_count
+    ws_summary['A5'] = "Выдано заказов:"
+    ws_summary['B5'] = status_counts['completed']
+    ws_summary['A6'] = "Ожидает обработки:"
+    ws_summary['B6'] = status_counts['pending']
+    ws_summary['A7'] = "В обработке:"
+    ws_summary['B7'] = status_counts['processing']
+    ws_summary['A8'] = "Отменено:"
+    ws_summary['B8'] = status_counts['cancelled']
+    ws_summary['A9'] = "Всего сессий:"
+    ws_summary['B9'] = len(session_totals)
+    ws_summary['A10'] = "Общая выручка:"
+    ws_summary['B10'] = total_revenue
+    ws_summary['B10'].number_format = '#,##0.00₽'
+    ws_summary['A11'] = "Всего продано ящиков:"
+    ws_summary['B11'] = total_boxes_sold
+    
     # Лист 3: Клиенты (отсортированные по количеству заказов)
     ws_customers = wb.create_sheet("Клиенты")
     
@@ -507,42 +519,21 @@ def generate_period_report_excel(period: str) -> io.BytesIO:
         cell.alignment = center_align
         cell.border = border
     
-    # Группируем заказы по клиентам
-    customers_dict = {}
-    for order in orders:
-        customer_key = f"{order['full_name']}_{order['phone_number']}"
-        
-        if customer_key not in customers_dict:
-            customers_dict[customer_key] = {
-                'full_name': order['full_name'],
-                'phone_number': order['phone_number'],
-                'orders': [],
-                'total_amount': 0,
-                'total_boxes': 0
-            }
-        
-        customers_dict[customer_key]['orders'].append(order)
-        customers_dict[customer_key]['total_amount'] += order['total_amount']
-        
-        order_items = database.get_order_items(order['order_id'])
-        boxes_in_order = sum(item['quantity'] for item in order_items)
-        customers_dict[customer_key]['total_boxes'] += boxes_in_order
-    
-    # Сортируем клиентов по количеству заказов
+    # Сортируем клиентов по количеству заказов, при равенстве - по первому в списке заказов
     customers_list = sorted(
         customers_dict.values(),
-        key=lambda x: len(x['orders']),
+        key=lambda x: (len(x['order_numbers']), max(x['order_numbers'])),
         reverse=True
     )
     
     row = 2
     for idx, customer in enumerate(customers_list, 1):
-        order_numbers = ", ".join([f"#{o['order_number']}" for o in customer['orders']])
+        order_numbers = ", ".join([f"#{number}" for _, _, number in sorted(customer['order_numbers'], reverse=True)])
         
         ws_customers.cell(row=row, column=1).value = idx
         ws_customers.cell(row=row, column=2).value = customer['full_name']
         ws_customers.cell(row=row, column=3).value = customer['phone_number']
-        ws_customers.cell(row=row, column=4).value = len(customer['orders'])
+        ws_customers.cell(row=row, column=4).value = len(customer['order_numbers'])
         ws_customers.cell(row=row, column=5).value = order_numbers
         ws_customers.cell(row=row, column=6).value = customer['total_amount']
         ws_customers.cell(row=row, column=6).number_format = '#,##0.00₽'
@@ -575,21 +566,13 @@ def generate_period_report_excel(period: str) -> io.BytesIO:
         cell.border = border
     
     row = 2
-    for session in sessions:
-        session_orders = [o for o in orders if o['session_id'] == session['session_id']]
-        session_completed = [o for o in session_orders if o['status'] == 'completed']
-        session_revenue = sum(o['total_amount'] for o in session_completed)
-        session_boxes = 0
-        for order in session_completed:
-            order_items = database.get_order_items(order['order_id'])
-            session_boxes += sum(item['quantity'] for item in order_items)
-        
-        ws_sessions.cell(row=row, column=1).value = session['session_name']
-        ws_sessions.cell(row=row, column=2).value = len(session_orders)
-        ws_sessions.cell(row=row, column=3).value = len(session_completed)
-        ws_sessions.cell(row=row, column=4).value = session_revenue
+    for totals in session_totals.values():
+        ws_sessions.cell(row=row, column=1).value = totals['session']['session_name']
+        ws_sessions.cell(row=row, column=2).value = totals['orders']
+        ws_sessions.cell(row=row, column=3).value = totals['completed']
+        ws_sessions.cell(row=row, column=4).value = totals['revenue']
         ws_sessions.cell(row=row, column=4).number_format = '#,##0.00₽'
-        ws_sessions.cell(row=row, column=5).value = session_boxes
+        ws_sessions.cell(row=row, column=5).value = totals['boxes_sold']
         
         for col in range(1, 6):
             ws_sessions.cell(row=row, column=col).border = border
@@ -614,8 +597,9 @@ def generate_channel_report_excel(session_id: int) -> io.BytesIO:
     if not session:
         raise ValueError("Сессия не найдена")
     
-    # Получаем данные
-    orders = database.get_session_orders(session_id)
+    # Количество заказов нужно заранее, чтобы разделить их на два столбца;
+    # сами заказы читаются пачками
+    total_orders = database.count_session_orders(session_id)
     
     # Создаем рабочую книгу
     wb = Workbook()
@@ -658,73 +642,31 @@ def generate_channel_report_excel(session_id: int) -> io.BytesIO:
         cell.alignment = center_align
         cell.border = border
     
-    # Разделяем заказы на две части для двух столбцов
-    total_orders = len(orders)
+    # Разделяем заказы на две части для двух столбцов: первая половина -
+    # левый столбец (колонки A-F), остальные - правый (колонки H-M),
+    # нумерация сквозная
     mid_point = (total_orders + 1) // 2  # Округляем вверх
     
-    orders_left = orders[:mid_point]
-    orders_right = orders[mid_point:]
-    
-    # Заполняем левый столбец
-    row = 2
-    row_number = 1
-    for order in orders_left:
-        # Маскируем данные
-        masked_name = qr_code.mask_name_channel(order['full_name'])
-        # Обрезаем ФИО до 8 символов
-        masked_name = masked_name[:8] if len(masked_name) > 8 else masked_name
-        masked_phone = qr_code.mask_phone_channel(order['phone_number'])
-        
-        # Получаем товары заказа
-        order_items = database.get_order_items(order['order_id'])
-        if order_items:
-            # Берем первый товар (или объединяем если несколько)
-            product_names = [item['product_name'] for item in order_items]
-            product_name = ", ".join(set(product_names))  # Убираем дубликаты
-            # Обрезаем до 3 символов
-            product_name = product_name[:3] if len(product_name) > 3 else product_name
-            total_quantity = sum(item['quantity'] for item in order_items)
+    rows_left = 0
+    rows_right = 0
+    for index, (order, order_items) in enumerate(_session_orders(session_id)):
+        if index < mid_point:
+            rows_left += 1
+            row = rows_left + 1
+            first_col = 1
         else:
-            product_name = ""
-            total_quantity = 0
-        
-        # Заполняем данные
-        ws.cell(row=row, column=1).value = row_number  # Номер строки
-        ws.cell(row=row, column=1).font = normal_font
-        ws.cell(row=row, column=2).value = masked_phone
-        ws.cell(row=row, column=2).font = phone_fio_font  # Увеличенный жирный шрифт для телефона
-        ws.cell(row=row, column=3).value = masked_name
-        ws.cell(row=row, column=3).font = phone_fio_font  # Увеличенный жирный шрифт для ФИО
-        ws.cell(row=row, column=4).value = product_name
-        ws.cell(row=row, column=4).font = normal_font
-        ws.cell(row=row, column=5).value = total_quantity
-        ws.cell(row=row, column=5).font = normal_font
-        # Форматируем сумму с пробелом как разделителем тысяч
-        amount_value = int(order['total_amount'])
-        ws.cell(row=row, column=6).value = amount_value
-        ws.cell(row=row, column=6).number_format = '# ##0'  # Формат с пробелом как разделителем тысяч
-        ws.cell(row=row, column=6).font = normal_font
+            rows_right += 1
+            row = rows_right + 1
+            first_col = 8
+        row_number = index + 1
         
-        # Применяем границы
-        for col in range(1, 7):
-            ws.cell(row=row, column=col).border = border
-        
-        row += 1
-        row_number += 1
-    
-    # Заполняем правый столбец (продолжаем нумерацию с левой таблицы)
-    row = 2
-    # Продолжаем нумерацию с того места, где закончилась левая таблица
-    row_number = len(orders_left) + 1
-    for order in orders_right:
         # Маскируем данные
         masked_name = qr_code.mask_name_channel(order['full_name'])
         # Обрезаем ФИО до 8 символов
         masked_name = masked_name[:8] if len(masked_name) > 8 else masked_name
         masked_phone = qr_code.mask_phone_channel(order['phone_number'])
         
-        # Получаем товары заказа
-        order_items = database.get_order_items(order['order_id'])
+        # Товары заказа
         if order_items:
             # Берем первый товар (или объединяем если несколько)
             product_names = [item['product_name'] for item in order_items]
@@ -736,29 +678,26 @@ def generate_channel_report_excel(session_id: int) -> io.BytesIO:
             product_name = ""
             total_quantity = 0
         
-        # Заполняем данные (начинаем с колонки H, т.е. колонка 8)
-        ws.cell(row=row, column=8).value = row_number  # Номер строки
-        ws.cell(row=row, column=8).font = normal_font
-        ws.cell(row=row, column=9).value = masked_phone
-        ws.cell(row=row, column=9).font = phone_fio_font  # Увеличенный жирный шрифт для телефона
-        ws.cell(row=row, column=10).value = masked_name
-        ws.cell(row=row, column=10).font = phone_fio_font  # Увеличенный жирный шрифт для ФИО
-        ws.cell(row=row, column=11).value = product_name
-        ws.cell(row=row, column=11).font = normal_font
-        ws.cell(row=row, column=12).value = total_quantity
-        ws.cell(row=row, column=12).font = normal_font
+        # Заполняем данные
+        ws.cell(row=row, column=first_col).value = row_number  # Номер строки
+        ws.cell(row=row, column=first_col).font = normal_font
+        ws.cell(row=row, column=first_col + 1).value = masked_phone
+        ws.cell(row=row, column=first_col + 1).font = phone_fio_font  # Увеличенный жирный шрифт для телефона
+        ws.cell(row=row, column=first_col + 2).value = masked_name
+        ws.cell(row=row, column=first_col + 2).font = phone_fio_font  # Увеличенный жирный шрифт для ФИО
+        ws.cell(row=row, column=first_col + 3).value = product_name
+        ws.cell(row=row, column=first_col + 3).font = normal_font
+        ws.cell(row=row, column=first_col + 4).value = total_quantity
+        ws.cell(row=row, column=first_col + 4).font = normal_font
         # Форматируем сумму с пробелом как разделителем тысяч
         amount_value = int(order['total_amount'])
-        ws.cell(row=row, column=13).value = amount_value
-        ws.cell(row=row, column=13).number_format = '# ##0'  # Формат с пробелом как разделителем тысяч
-        ws.cell(row=row, column=13).font = normal_font
+        ws.cell(row=row, column=first_col + 5).value = amount_value
+        ws.cell(row=row, column=first_col + 5).number_format = '# ##0'  # Формат с пробелом как разделителем тысяч
+        ws.cell(row=row, column=first_col + 5).font = normal_font
         
         # Применяем границы
-        for col in range(8, 14):
+        for col in range(first_col, first_col + 6):
             ws.cell(row=row, column=col).border = border
-        
-        row += 1
-        row_number += 1
     
     # Настраиваем ширину колонок (максимально сжато)
     column_widths = {
@@ -781,9 +720,7 @@ def generate_channel_report_excel(session_id: int) -> io.BytesIO:
         ws.column_dimensions[col_letter].width = width
     
     # Определяем количество строк с данными
-    max_row_left = len(orders_left) + 1 if orders_left else 1  # +1 для заголовка
-    max_row_right = len(orders_right) + 1 if orders_right else 1  # +1 для заголовка
-    max_row = max(max_row_left, max_row_right)
+    max_row = max(rows_left, rows_right) + 1  # +1 для заголовка
     
     # Устанавливаем область печати как один непрерывный диапазон от A до M
     # Это включает обе таблицы (левая A-F, правая H-M) и пустую колонку G между ними
@@ -819,8 +756,9 @@ def generate_full_data_report_excel(session_id: int) -> io.BytesIO:
     if not session:
         raise ValueError("Сессия не найдена")
     
-    # Получаем данные
-    orders = database.get_session_orders(session_id)
+    # Количество заказов нужно заранее, чтобы разделить их на два столбца;
+    # сами заказы читаются пачками
+    total_orders = database.count_session_orders(session_id)
     
     # Создаем рабочую книгу
     wb = Workbook()
@@ -863,73 +801,31 @@ def generate_full_data_report_excel(session_id: int) -> io.BytesIO:
         cell.alignment = center_align
         cell.border = border
     
-    # Разделяем заказы на две части для двух столбцов
-    total_orders = len(orders)
+    # Разделяем заказы на две части для двух столбцов: первая половина -
+    # левый столбец (колонки A-F), остальные - правый (колонки H-M),
+    # нумерация сквозная
     mid_point = (total_orders + 1) // 2  # Округляем вверх
     
-    orders_left = orders[:mid_point]
-    orders_right = orders[mid_point:]
-    
-    # Заполняем левый столбец
-    row = 2
-    row_number = 1
-    for order in orders_left:
-        # Используем полные данные без маскировки
-        full_name = order['full_name'] or ""
-        # Обрезаем ФИО до 8 символов
-        full_name = full_name[:8] if len(full_name) > 8 else full_name
-        full_phone = order['phone_number'] or ""
-        
-        # Получаем товары заказа
-        order_items = database.get_order_items(order['order_id'])
-        if order_items:
-            # Берем первый товар (или объединяем если несколько)
-            product_names = [item['product_name'] for item in order_items]
-            product_name = ", ".join(set(product_names))  # Убираем дубликаты
-            # Обрезаем до 3 символов
-            product_name = product_name[:3] if len(product_name) > 3 else product_name
-            total_quantity = sum(item['quantity'] for item in order_items)
+    rows_left = 0
+    rows_right = 0
+    for index, (order, order_items) in enumerate(_session_orders(session_id)):
+        if index < mid_point:
+            rows_left += 1
+            row = rows_left + 1
+            first_col = 1
         else:
-            product_name = ""
-            total_quantity = 0
-        
-        # Заполняем данные (убрали колонку "осн")
-        ws.cell(row=row, column=1).value = row_number  # Номер строки
-        ws.cell(row=row, column=1).font = normal_font
-        ws.cell(row=row, column=2).value = full_phone
-        ws.cell(row=row, column=2).font = phone_fio_font  # Увеличенный жирный шрифт для телефона
-        ws.cell(row=row, column=3).value = full_name
-        ws.cell(row=row, column=3).font = phone_fio_font  # Увеличенный жирный шрифт для ФИО
-        ws.cell(row=row, column=4).value = product_name
-        ws.cell(row=row, column=4).font = normal_font
-        ws.cell(row=row, column=5).value = total_quantity
-        ws.cell(row=row, column=5).font = normal_font
-        # Форматируем сумму с пробелом как разделителем тысяч
-        amount_value = int(order['total_amount'])
-        ws.cell(row=row, column=6).value = amount_value
-        ws.cell(row=row, column=6).number_format = '# ##0'  # Формат с пробелом как разделителем тысяч
-        ws.cell(row=row, column=6).font = normal_font
+            rows_right += 1
+            row = rows_right + 1
+            first_col = 8
+        row_number = index + 1
         
-        # Применяем границы
-        for col in range(1, 7):
-            ws.cell(row=row, column=col).border = border
-        
-        row += 1
-        row_number += 1
-    
-    # Заполняем правый столбец (продолжаем нумерацию с левой таблицы)
-    row = 2
-    # Продолжаем нумерацию с того места, где закончилась левая таблица
-    row_number = len(orders_left) + 1
-    for order in orders_right:
         # Используем полные данные без маскировки
         full_name = order['full_name'] or ""
         # Обрезаем ФИО до 8 символов
         full_name = full_name[:8] if len(full_name) > 8 else full_name
         full_phone = order['phone_number'] or ""
         
-        # Получаем товары заказа
-        order_items = database.get_order_items(order['order_id'])
+        # Товары заказа
         if order_items:
             # Берем первый товар (или объединяем если несколько)
             product_names = [item['product_name'] for item in order_items]
@@ -941,29 +837,26 @@ def generate_full_data_report_excel(session_id: int) -> io.BytesIO:
             product_name = ""
             total_quantity = 0
         
-        # Заполняем данные (начинаем с колонки H, т.е. колонка 8, убрали колонку "осн")
-        ws.cell(row=row, column=8).value = row_number  # Номер строки
-        ws.cell(row=row, column=8).font = normal_font
-        ws.cell(row=row, column=9).value = full_phone
-        ws.cell(row=row, column=9).font = phone_fio_font  # Увеличенный жирный шрифт для телефона
-        ws.cell(row=row, column=10).value = full_name
-        ws.cell(row=row, column=10).font = phone_fio_font  # Увеличенный жирный шрифт для ФИО
-        ws.cell(row=row, column=11).value = product_name
-        ws.cell(row=row, column=11).font = normal_font
-        ws.cell(row=row, column=12).value = total_quantity
-        ws.cell(row=row, column=12).font = normal_font
+        # Заполняем данные
+        ws.cell(row=row, column=first_col).value = row_number  # Номер строки
+        ws.cell(row=row, column=first_col).font = normal_font
+        ws.cell(row=row, column=first_col + 1).value = full_phone
+        ws.cell(row=row, column=first_col + 1).font = phone_fio_font  # Увеличенный жирный шрифт для телефона
+        ws.cell(row=row, column=first_col + 2).value = full_name
+        ws.cell(row=row, column=first_col + 2).font = phone_fio_font  # Увеличенный жирный шрифт для ФИО
+        ws.cell(row=row, column=first_col + 3).value = product_name
+        ws.cell(row=row, column=first_col + 3).font = normal_font
+        ws.cell(row=row, column=first_col + 4).value = total_quantity
+        ws.cell(row=row, column=first_col + 4).font = normal_font
         # Форматируем сумму с пробелом как разделителем тысяч
         amount_value = int(order['total_amount'])
-        ws.cell(row=row, column=13).value = amount_value
-        ws.cell(row=row, column=13).number_format = '# ##0'  # Формат с пробелом как разделителем тысяч
-        ws.cell(row=row, column=13).font = normal_font
+        ws.cell(row=row, column=first_col + 5).value = amount_value
+        ws.cell(row=row, column=first_col + 5).number_format = '# ##0'  # Формат с пробелом как разделителем тысяч
+        ws.cell(row=row, column=first_col + 5).font = normal_font
         
         # Применяем границы
-        for col in range(8, 14):
+        for col in range(first_col, first_col + 6):
             ws.cell(row=row, column=col).border = border
-        
-        row += 1
-        row_number += 1
     
     # Настраиваем ширину колонок (максимально сжато, как в отчете для канала)
     column_widths = {
@@ -986,9 +879,7 @@ def generate_full_data_report_excel(session_id: int) -> io.BytesIO:
         ws.column_dimensions[col_letter].width = width
     
     # Определяем количество строк с данными
-    max_row_left = len(orders_left) + 1 if orders_left else 1  # +1 для заголовка
-    max_row_right = len(orders_right) + 1 if orders_right else 1  # +1 для заголовка
-    max_row = max(max_row_left, max_row_right)
+    max_row = max(rows_left, rows_right) + 1  # +1 для заголовка
     
     # Устанавливаем область печати как один непрерывный диапазон от A до M
     # Это включает обе таблицы (левая A-F, правая H-M) и пустую колонку G между ними
@@ -1017,23 +908,120 @@ def generate_full_data_report_excel(session_id: int) -> io.BytesIO:
     return excel_bytes
 
 
+def render_session_report_images(session_name: str, report_lines: list) -> list:
+    """
+    Рисует текстовый отчет по сессии картинками PNG (Pillow), не больше 100 строк
+    на картинку. Первая начинается с заголовка и статистики (строки до разделителя
+    "=" * 60), следующие - с заголовка "(продолжение)". Возвращает список io.BytesIO.
+    """
+    from PIL import Image, ImageDraw, ImageFont
+
+    # Параметры изображения
+    img_width = 1000
+    line_height = 25
+    padding = 20
+    max_lines_per_image = 100  # Максимум строк на одно изображение
+
+    # Заголовок и статистика (первые строки до разделителя)
+    header_lines = []
+    header_end_idx = 0
+    separator = "=" * 60
+    for i, line in enumerate(report_lines):
+        header_lines.append(line)
+        if line == separator:
+            header_end_idx = i + 2  # +2 чтобы включить пустую строку после разделителя
+            break
+
+    # Заказы (остальные строки после заголовка)
+    if header_end_idx > 0:
+        order_lines = report_lines[header_end_idx:]
+    else:
+        # Если разделитель не найден, берем все строки после заголовка
+        order_lines = report_lines[len(header_lines):]
+
+    # Разбиваем на части
+    image_parts = []
+
+    # Если нет заказов, рисуем только заголовок
+    if not order_lines:
+        image_parts.append(header_lines)
+    else:
+        # Вычисляем сколько строк заказов поместится в первую часть
+        header_size = len(header_lines)
+        available_lines = max_lines_per_image - header_size
+
+        if available_lines > 0:
+            # Первая часть: заголовок + первые заказы
+            first_part = header_lines.copy()
+            first_part.extend(order_lines[:available_lines])
+            image_parts.append(first_part)
+
+            # Остальные части: только заказы
+            remaining_lines = order_lines[available_lines:]
+        else:
+            # Если заголовок слишком большой, начинаем с него
+            image_parts.append(header_lines)
+            remaining_lines = order_lines
+
+        # Разбиваем оставшиеся заказы на части
+        while remaining_lines:
+            part = remaining_lines[:max_lines_per_image]
+            # Добавляем заголовок в начало каждой части
+            part_with_header = [f"ОТЧЕТ ПО СЕССИИ: {session_name} (продолжение)", ""] + part
+            image_parts.append(part_with_header)
+            remaining_lines = remaining_lines[max_lines_per_image:]
+
+    # Генерируем шрифт
+    try:
+        font = ImageFont.truetype("arial.ttf", 14)
+    except:
+        try:
+            font = ImageFont.truetype("C:/Windows/Fonts/arial.ttf", 14)
+        except:
+            font = ImageFont.load_default()
+
+    # Создаем изображения
+    images = []
+    for part_lines in image_parts:
+        # Вычисляем высоту изображения
+        img_height = len(part_lines) * line_height + padding * 2
+
+        # Создаем изображение
+        img = Image.new('RGB', (img_width, img_height), color='white')
+        draw = ImageDraw.Draw(img)
+
+        # Рисуем строки
+        y = padding
+        for line in part_lines:
+            # Обрезаем длинные строки
+            if len(line) > 80:
+                line = line[:77] + "..."
+            draw.text((padding, y), line, fill='black', font=font)
+            y += line_height
+
+        # Сохраняем в байты
+        img_bytes = io.BytesIO()
+        img.save(img_bytes, format='PNG')
+        img_bytes.seek(0)
+        images.append(img_bytes)
+
+    return images
+
+
 def generate_full_data_report_html(session_id: int) -> str:
     """Генерирует HTML страницу с таблицей с полными данными (без маскировки)"""
     session = database.get_session(session_id)
     if not session:
         raise ValueError("Сессия не найдена")
     
-    # Получаем данные
-    orders = database.get_session_orders(session_id)
-    
-    # Используем полные данные без маскировки
-    full_orders = []
-    for order in orders:
+    # Строки таблицы формируются сразу при чтении заказов пачками
+    order_rows = []
+    for index, (order, order_items) in enumerate(_session_orders(session_id)):
+        # Используем полные данные без маскировки
         full_name = order['full_name'] or ""
         full_phone = order['phone_number'] or ""
         
-        # Получаем товары заказа
-        order_items = database.get_order_items(order['order_id'])
+        # Товары заказа
         if order_items:
             product_names = [item['product_name'] for item in order_items]
             product_name = ", ".join(set(product_names))
@@ -1044,20 +1032,23 @@ def generate_full_data_report_html(session_id: int) -> str:
             product_name = "Нет товаров"
             total_quantity = 0
         
-        full_orders.append({
-            'order_number': order['order_number'],  # Основной номер
-            'session_order_number': order.get('session_order_number') or '',  # Номер по сессии
-            'phone': full_phone,
-            'name': full_name,
-            'product': product_name,
-            'quantity': total_quantity,
-            'amount': int(order['total_amount'])
-        })
+        # Используем номер по сессии, если есть, иначе порядковый номер строки
+        session_num = order.get('session_order_number') or index + 1
+        order_rows.append(f"""                    <tr>
+                        <td>{session_num}</td>
+                        <td>{order['order_number']}</td>
+                        <td>{full_phone}</td>
+                        <td>{full_name}</td>
+                        <td>{product_name}</td>
+                        <td>{total_quantity}</td>
+                        <td>{int(order['total_amount'])}</td>
+                    </tr>
+""")
     
-    # Разделяем на две части
-    mid_point = (len(full_orders) + 1) // 2
-    orders_left = full_orders[:mid_point]
-    orders_right = full_orders[mid_point:]
+    # Разделяем на две части (нумерация сквозная)
+    mid_point = (len(order_rows) + 1) // 2
+    rows_left = order_rows[:mid_point]
+    rows_right = order_rows[mid_point:]
     
     # Генерируем HTML
     html = f"""<!DOCTYPE html>
@@ -1132,21 +1123,7 @@ def generate_full_data_report_html(session_id: int) -> str:
 """
     
     # Левая таблица
-    row_number = 1
-    for order in orders_left:
-        # Используем номер по сессии, если есть, иначе порядковый номер строки
-        session_num = order.get('session_order_number') or row_number
-        html += f"""                    <tr>
-                        <td>{session_num}</td>
-                        <td>{order['order_number']}</td>
-                        <td>{order['phone']}</td>
-                        <td>{order['name']}</td>
-                        <td>{order['product']}</td>
-                        <td>{order['quantity']}</td>
-                        <td>{order['amount']}</td>
-                    </tr>
-"""
-        row_number += 1
+    html += "".join(rows_left)
     
     html += """                </tbody>
             </table>
@@ -1167,22 +1144,8 @@ def generate_full_data_report_html(session_id: int) -> str:
                 <tbody>
 """
     
-    # Правая таблица (продолжаем нумерацию с левой таблицы)
-    row_number = len(orders_left) + 1
-    for order in orders_right:
-        # Используем номер по сессии, если есть, иначе порядковый номер строки
-        session_num = order.get('session_order_number') or row_number
-        html += f"""                    <tr>
-                        <td>{session_num}</td>
-                        <td>{order['order_number']}</td>
-                        <td>{order['phone']}</td>
-                        <td>{order['name']}</td>
-                        <td>{order['product']}</td>
-                        <td>{order['quantity']}</td>
-                        <td>{order['amount']}</td>
-                    </tr>
-"""
-        row_number += 1
+    # Правая таблица (нумерация продолжает левую)
+    html += "".join(rows_right)
     
     html += """                </tbody>
             </table>
@@ -1200,19 +1163,16 @@ def generate_channel_report_html(session_id: int) -> str:
     if not session:
         raise ValueError("Сессия не найдена")
     
-    # Получаем данные
-    orders = database.get_session_orders(session_id)
-    
-    # Маскируем данные
-    masked_orders = []
-    for order in orders:
+    # Строки таблицы формируются сразу при чтении заказов пачками
+    order_rows = []
+    for index, (order, order_items) in enumerate(_session_orders(session_id)):
+        # Маскируем данные
         masked_name = qr_code.mask_name_channel(order['full_name'])
         # Обрезаем ФИО до 8 символов
         masked_name = masked_name[:8] if len(masked_name) > 8 else masked_name
         masked_phone = qr_code.mask_phone_channel(order['phone_number'])
         
-        # Получаем товары заказа
-        order_items = database.get_order_items(order['order_id'])
+        # Товары заказа
         if order_items:
             product_names = [item['product_name'] for item in order_items]
             product_name = ", ".join(set(product_names))
@@ -1223,19 +1183,20 @@ def generate_channel_report_html(session_id: int) -> str:
             product_name = ""
             total_quantity = 0
         
-        masked_orders.append({
-            'order_number': order['order_number'],
-            'phone': masked_phone,
-            'name': masked_name,
-            'product': product_name,
-            'quantity': total_quantity,
-            'amount': int(order['total_amount'])
-        })
+        order_rows.append(f"""                    <tr>
+                        <td>{index + 1}</td>
+                        <td class="phone">{masked_phone}</td>
+                        <td class="fio">{masked_name}</td>
+                        <td>{product_name}</td>
+                        <td>{total_quantity}</td>
+                        <td>{int(order['total_amount'])}</td>
+                    </tr>
+""")
     
-    # Разделяем на две части
-    mid_point = (len(masked_orders) + 1) // 2
-    orders_left = masked_orders[:mid_point]
-    orders_right = masked_orders[mid_point:]
+    # Разделяем на две части (нумерация сквозная)
+    mid_point = (len(order_rows) + 1) // 2
+    rows_left = order_rows[:mid_point]
+    rows_right = order_rows[mid_point:]
     
     # Генерируем HTML
     html = f"""<!DOCTYPE html>
@@ -1315,18 +1276,7 @@ def generate_channel_report_html(session_id: int) -> str:
 """
     
     # Левая таблица
-    row_number = 1
-    for order in orders_left:
-        html += f"""                    <tr>
-                        <td>{row_number}</td>
-                        <td class="phone">{order['phone']}</td>
-                        <td class="fio">{order['name']}</td>
-                        <td>{order['product']}</td>
-                        <td>{order['quantity']}</td>
-                        <td>{order['amount']}</td>
-                    </tr>
-"""
-        row_number += 1
+    html += "".join(rows_left)
     
     html += """                </tbody>
             </table>
@@ -1346,19 +1296,8 @@ def generate_channel_report_html(session_id: int) -> str:
                 <tbody>
 """
     
-    # Правая таблица (продолжаем нумерацию с левой таблицы)
-    row_number = len(orders_left) + 1
-    for order in orders_right:
-        html += f"""                    <tr>
-                        <td>{row_number}</td>
-                        <td class="phone">{order['phone']}</td>
-                        <td class="fio">{order['name']}</td>
-                        <td>{order['product']}</td>
-                        <td>{order['quantity']}</td>
-                        <td>{order['amount']}</td>
-                    </tr>
-"""
-        row_number += 1
+    # Правая таблица (нумерация продолжает левую)
+    html += "".join(rows_right)
     
     html += """                </tbody>
             </table>
@@ -1378,7 +1317,7 @@ async def generate_channel_report_screenshot(session_id: int) -> io.BytesIO:
         import os
         
         # Генерируем HTML
-        html_content = generate_channel_report_html(session_id)
+        html_content = await db_async.run(generate_channel_report_html, session_id)
         
         # Создаем временный HTML файл
         with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False, encoding='utf-8') as f:
@@ -1423,7 +1362,7 @@ async def generate_full_data_report_screenshot(session_id: int) -> io.BytesIO:
         import os
         
         # Генерируем HTML
-        html_content = generate_full_data_report_html(session_id)
+        html_content = await db_async.run(generate_full_data_report_html, session_id)
         
         # Создаем временный HTML файл
         with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False, encoding='utf-8') as f:
@@ -1466,13 +1405,39 @@ def generate_pending_orders_html(session_id: int) -> str:
     if not session:
         raise ValueError("Сессия не найдена")
     
-    # Получаем все заказы сессии
-    all_orders = database.get_session_orders(session_id)
-    
-    # Фильтруем только не выданные заказы (статус != 'completed' и != 'cancelled')
-    pending_orders = [o for o in all_orders if o['status'] != 'completed' and o['status'] != 'cancelled']
+    # Строки таблицы не выданных заказов (статус не completed и не cancelled)
+    # формируются сразу при чтении заказов пачками
+    order_rows = []
+    for order, order_items in _session_orders(session_id, exclude_statuses=('completed', 'cancelled')):
+        # Используем полные данные без маскировки
+        full_name = order['full_name'] or ""
+        full_phone = order['phone_number'] or ""
+        
+        # Товары заказа
+        if order_items:
+            product_names = [item['product_name'] for item in order_items]
+            product_name = ", ".join(set(product_names))
+            # Обрезаем до 9 символов
+            product_name = product_name[:9] if len(product_name) > 9 else product_name
+            total_quantity = sum(item['quantity'] for item in order_items)
+        else:
+            product_name = "Нет товаров"
+            total_quantity = 0
+        
+        # Используем номер по сессии, если есть, иначе порядковый номер
+        session_num = order.get('session_order_number') or len(order_rows) + 1
+        order_rows.append(f"""                    <tr>
+                        <td>{session_num}</td>
+                        <td>{order['order_number']}</td>
+                        <td>{full_phone}</td>
+                        <td>{full_name}</td>
+                        <td>{product_name}</td>
+                        <td>{total_quantity}</td>
+                        <td>{int(order['total_amount'])}</td>
+                    </tr>
+""")
     
-    if not pending_orders:
+    if not order_rows:
         return f"""<!DOCTYPE html>
 <html>
 <head>
@@ -1498,42 +1463,10 @@ def generate_pending_orders_html(session_id: int) -> str:
 </body>
 </html>"""
     
-    # Используем полные данные без маскировки
-    full_orders = []
-    for order in pending_orders:
-        full_name = order['full_name'] or ""
-        full_phone = order['phone_number'] or ""
-        
-        # Получаем товары заказа
-        order_items = database.get_order_items(order['order_id'])
-        if order_items:
-            product_names = [item['product_name'] for item in order_items]
-            product_name = ", ".join(set(product_names))
-            # Обрезаем до 9 символов
-            product_name = product_name[:9] if len(product_name) > 9 else product_name
-            total_quantity = sum(item['quantity'] for item in order_items)
-        else:
-            product_name = "Нет товаров"
-            total_quantity = 0
-        
-        # Используем номер по сессии, если есть, иначе порядковый номер
-        session_num = order.get('session_order_number') or len(full_orders) + 1
-        
-        full_orders.append({
-            'order_number': order['order_number'],  # Основной номер
-            'session_order_number': session_num,  # Номер по сессии
-            'phone': full_phone,
-            'name': full_name,
-            'product': product_name,
-            'quantity': total_quantity,
-            'amount': int(order['total_amount']),
-            'status': order['status']
-        })
-    
     # Разделяем на две части
-    mid_point = (len(full_orders) + 1) // 2
-    orders_left = full_orders[:mid_point]
-    orders_right = full_orders[mid_point:]
+    mid_point = (len(order_rows) + 1) // 2
+    rows_left = order_rows[:mid_point]
+    rows_right = order_rows[mid_point:]
     
     # Генерируем HTML
     html = f"""<!DOCTYPE html>
@@ -1608,19 +1541,7 @@ def generate_pending_orders_html(session_id: int) -> str:
 """
     
     # Левая таблица
-    row_number = 1
-    for order in orders_left:
-        html += f"""                    <tr>
-                        <td>{order['session_order_number']}</td>
-                        <td>{order['order_number']}</td>
-                        <td>{order['phone']}</td>
-                        <td>{order['name']}</td>
-                        <td>{order['product']}</td>
-                        <td>{order['quantity']}</td>
-                        <td>{order['amount']}</td>
-                    </tr>
-"""
-        row_number += 1
+    html += "".join(rows_left)
     
     html += """                </tbody>
             </table>
@@ -1641,20 +1562,8 @@ def generate_pending_orders_html(session_id: int) -> str:
                 <tbody>
 """
     
-    # Правая таблица (продолжаем нумерацию с левой таблицы)
-    row_number = len(orders_left) + 1
-    for order in orders_right:
-        html += f"""                    <tr>
-                        <td>{order['session_order_number']}</td>
-                        <td>{order['order_number']}</td>
-                        <td>{order['phone']}</td>
-                        <td>{order['name']}</td>
-                        <td>{order['product']}</td>
-                        <td>{order['quantity']}</td>
-                        <td>{order['amount']}</td>
-                    </tr>
-"""
-        row_number += 1
+    # Правая таблица
+    html += "".join(rows_right)
     
     html += """                </tbody>
             </table>
@@ -1674,7 +1583,7 @@ async def generate_pending_orders_screenshot(session_id: int) -> io.BytesIO:
         import os
         
         # Генерируем HTML
-        html_content = generate_pending_orders_html(session_id)
+        html_content = await db_async.run(generate_pending_orders_html, session_id)
         
         # Создаем временный HTML файл
         with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False, encoding='utf-8') as f:
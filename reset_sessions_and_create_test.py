@@ -13,12 +13,15 @@ def main():
 
     cursor.execute("DELETE FROM order_items")
     cursor.execute("DELETE FROM orders")
-    cursor.execute("DELETE FROM user_session_limits")
     cursor.execute("DELETE FROM products")
     cursor.execute("DELETE FROM sessions")
     conn.commit()
     cursor.execute("PRAGMA foreign_keys = ON")
     conn.close()
+    # Счетчики (rollups.py, в т.ч. user_stats) пересчитываются по оставшимся заказам
+    if not database.rebuild_session_stats():
+        print("Ошибка: не удалось пересчитать счетчики заказов.")
+        return
     print("Все сессии и связанные данные удалены.")
 
     conn = sqlite3.connect(DB_NAME)
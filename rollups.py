@@ -0,0 +1,375 @@
+"""
+Сводные счетчики продаж, которые ведутся вместе с заказами.
+
+Функции принимают курсор и выполняются внутри транзакции функции
+database.py, которая меняет заказ:
+
+    before = rollups.order_snapshot(cursor, order_id)
+    ... изменение заказа ...
+    rollups.apply_change(cursor, before, rollups.order_snapshot(cursor, order_id))
+
+Вклад заказа в счетчики считается по его состоянию до и после изменения,
+в таблицы записывается только разница. Для нового заказа before=None,
+для удаленного after=None.
+
+Массовые изменения снимают состояния всех заказов сразу (order_snapshots)
+и записывают суммарную разницу одним apply_deltas(collect_deltas(...)).
+
+Таблицы:
+    session_stats - счетчики заказов, выручка и проданные ящики по сессии
+    session_customers - число заказов покупателя в сессии (для уникальных клиентов)
+    product_sales - продано ящиков товара в выданных заказах сессии
+    user_stats - выданные и незавершенные заказы, ящики и сумма покупок пользователя
+    user_session_limits - куплено ящиков пользователем в сессии (для лимита на человека)
+
+Ожидаемое содержимое всех таблиц по orders и order_items описано в EXPECTED:
+по нему таблицы пересчитываются с нуля (rebuild) и сверяются (check).
+Запросы EXPECTED читают представления all_orders и all_order_items - заказы
+сессий, перенесенных в архив (archive.py), остаются в счетчиках.
+"""
+from typing import Optional
+
+# Статусы заказа, для которых в session_stats есть отдельный счетчик
+STATUS_COLUMNS = {
+    'pending': 'pending_orders',
+    'processing': 'processing_orders',
+    'completed': 'completed_orders',
+    'cancelled': 'cancelled_orders',
+}
+
+# Статусы, при которых заказ не считается незавершенным
+CLOSED_STATUSES = ('completed', 'cancelled')
+
+
+def order_snapshot(cursor, order_id: int) -> Optional[dict]:
+    """Состояние заказа, влияющее на счетчики (None, если заказа нет)"""
+    cursor.execute(
+        "SELECT session_id, user_id, status, total_amount FROM orders WHERE order_id = ?",
+        (order_id,)
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    cursor.execute("""
+        SELECT product_id, SUM(quantity)
+        FROM order_items
+        WHERE order_id = ?
+        GROUP BY product_id
+    """, (order_id,))
+    return {
+        'session_id': row[0],
+        'user_id': row[1],
+        'status': row[2],
+        'total_amount': row[3] or 0,
+        'items': dict(cursor.fetchall()),
+    }
+
+
+def order_snapshots(cursor, order_ids: list) -> dict:
+    """Состояния нескольких заказов двумя запросами: {order_id: снимок}; отсутствующих заказов нет в словаре"""
+    order_ids = list(dict.fromkeys(order_ids))
+    if not order_ids:
+        return {}
+    placeholders = ','.join(['?'] * len(order_ids))
+    cursor.execute(f"""
+        SELECT order_id, session_id, user_id, status, total_amount
+        FROM orders
+        WHERE order_id IN ({placeholders})
+    """, order_ids)
+    snapshots = {
+        row[0]: {
+            'session_id': row[1],
+            'user_id': row[2],
+            'status': row[3],
+            'total_amount': row[4] or 0,
+            'items': {},
+        }
+        for row in cursor.fetchall()
+    }
+    if snapshots:
+        placeholders = ','.join(['?'] * len(snapshots))
+        cursor.execute(f"""
+            SELECT order_id, product_id, SUM(quantity)
+            FROM order_items
+            WHERE order_id IN ({placeholders})
+            GROUP BY order_id, product_id
+        """, list(snapshots))
+        for order_id, product_id, quantity in cursor.fetchall():
+            snapshots[order_id]['items'][product_id] = quantity
+    return snapshots
+
+
+def _contribution(snapshot: Optional[dict], sign: int, deltas: dict):
+    """Добавляет вклад заказа (со знаком sign) в накопитель разниц"""
+    if snapshot is None:
+        return
+    session_id = snapshot['session_id']
+    completed = snapshot['status'] == 'completed'
+
+    session = deltas['sessions'].setdefault(session_id, {
+        'total_orders': 0, 'pending_orders': 0, 'processing_orders': 0,
+        'completed_orders': 0, 'cancelled_orders': 0,
+        'total_revenue': 0.0, 'boxes_sold': 0,
+    })
+    session['total_orders'] += sign
+    column = STATUS_COLUMNS.get(snapshot['status'])
+    if column:
+        session[column] += sign
+    if completed:
+        session['total_revenue'] += sign * snapshot['total_amount']
+        session['boxes_sold'] += sign * sum(snapshot['items'].values())
+        for product_id, quantity in snapshot['items'].items():
+            key = (session_id, product_id)
+            deltas['products'][key] = deltas['products'].get(key, 0) + sign * quantity
+
+    key = (session_id, snapshot['user_id'])
+    deltas['customers'][key] = deltas['customers'].get(key, 0) + sign
+
+    user = deltas['users'].setdefault(snapshot['user_id'], {
+        'completed_orders': 0, 'open_orders': 0, 'total_boxes': 0, 'total_amount': 0.0,
+    })
+    if snapshot['status'] not in CLOSED_STATUSES:
+        user['open_orders'] += sign
+    if completed:
+        boxes = sum(snapshot['items'].values())
+        user['completed_orders'] += sign
+        user['total_boxes'] += sign * boxes
+        user['total_amount'] += sign * snapshot['total_amount']
+        deltas['user_sessions'][key] = deltas['user_sessions'].get(key, 0) + sign * boxes
+
+
+def collect_deltas(changes) -> dict:
+    """Суммарная разница вкладов для пар (before, after) нескольких заказов"""
+    deltas = {'sessions': {}, 'products': {}, 'customers': {}, 'users': {}, 'user_sessions': {}}
+    for before, after in changes:
+        _contribution(before, -1, deltas)
+        _contribution(after, 1, deltas)
+    return deltas
+
+
+def change_deltas(before: Optional[dict], after: Optional[dict]) -> dict:
+    """Разница вкладов заказа в счетчики: after минус before"""
+    return collect_deltas([(before, after)])
+
+
+def apply_change(cursor, before: Optional[dict], after: Optional[dict]):
+    """Записывает в счетчики разницу между состояниями заказа до и после изменения"""
+    apply_deltas(cursor, change_deltas(before, after))
+
+
+def apply_deltas(cursor, deltas: dict):
+    """Записывает накопленные разницы в таблицы счетчиков"""
+    unique = {}
+    for (session_id, user_id), delta in deltas['customers'].items():
+        if delta == 0:
+            continue
+        cursor.execute("""
+            INSERT INTO session_customers (session_id, user_id, orders_count)
+            VALUES (?, ?, ?)
+            ON CONFLICT(session_id, user_id) DO UPDATE SET orders_count = orders_count + excluded.orders_count
+            RETURNING orders_count
+        """, (session_id, user_id, delta))
+        orders_count = cursor.fetchone()[0]
+        previous = orders_count - delta
+        if previous <= 0 < orders_count:
+            # Первый заказ покупателя в сессии
+            unique[session_id] = unique.get(session_id, 0) + 1
+        elif orders_count <= 0:
+            cursor.execute(
+                "DELETE FROM session_customers WHERE session_id = ? AND user_id = ?",
+                (session_id, user_id)
+            )
+            if previous > 0:
+                unique[session_id] = unique.get(session_id, 0) - 1
+
+    for session_id, delta in deltas['sessions'].items():
+        delta = dict(delta, unique_customers=unique.pop(session_id, 0))
+        if not any(delta.values()):
+            continue
+        cursor.execute("INSERT OR IGNORE INTO session_stats (session_id) VALUES (?)", (session_id,))
+        cursor.execute(f"""
+            UPDATE session_stats SET
+                {", ".join(f"{column} = {column} + ?" for column in delta)}
+            WHERE session_id = ?
+        """, tuple(delta.values()) + (session_id,))
+
+    cursor.executemany("""
+        INSERT INTO product_sales (session_id, product_id, sold_boxes)
+        VALUES (?, ?, ?)
+        ON CONFLICT(session_id, product_id) DO UPDATE SET sold_boxes = sold_boxes + excluded.sold_boxes
+    """, [
+        (session_id, product_id, delta)
+        for (session_id, product_id), delta in deltas['products'].items() if delta != 0
+    ])
+
+    cursor.executemany("""
+        INSERT INTO user_stats (user_id, completed_orders, open_orders, total_boxes, total_amount)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            completed_orders = completed_orders + excluded.completed_orders,
+            open_orders = open_orders + excluded.open_orders,
+            total_boxes = total_boxes + excluded.total_boxes,
+            total_amount = total_amount + excluded.total_amount
+    """, [
+        (user_id, delta['completed_orders'], delta['open_orders'], delta['total_boxes'], delta['total_amount'])
+        for user_id, delta in deltas['users'].items() if any(delta.values())
+    ])
+
+    cursor.executemany("""
+        INSERT INTO user_session_limits (user_id, session_id, boxes_purchased)
+        VALUES (?, ?, ?)
+        ON CONFLICT(user_id, session_id) DO UPDATE SET boxes_purchased = boxes_purchased + excluded.boxes_purchased
+    """, [
+        (user_id, session_id, delta)
+        for (session_id, user_id), delta in deltas['user_sessions'].items() if delta != 0
+    ])
+
+
+# Ожидаемое содержимое таблиц счетчиков, посчитанное по orders (o) и order_items (oi):
+# таблица -> (колонки, запрос, условие "строка не пустая"). {filter} в запросе -
+# дополнительное условие на заказы (например, AND o.session_id = ?) или пустая строка.
+EXPECTED = {
+    'session_stats': (
+        ('session_id', 'total_orders', 'pending_orders', 'processing_orders', 'completed_orders',
+         'cancelled_orders', 'total_revenue', 'boxes_sold', 'unique_customers'),
+        """
+        SELECT
+            o.session_id,
+            COUNT(*),
+            SUM(o.status = 'pending'),
+            SUM(o.status = 'processing'),
+            SUM(o.status = 'completed'),
+            SUM(o.status = 'cancelled'),
+            COALESCE(SUM(CASE WHEN o.status = 'completed' THEN o.total_amount END), 0),
+            COALESCE(SUM(CASE WHEN o.status = 'completed' THEN (
+                SELECT SUM(oi.quantity) FROM all_order_items oi WHERE oi.order_id = o.order_id
+            ) END), 0),
+            COUNT(DISTINCT o.user_id)
+        FROM all_orders o
+        WHERE 1 = 1 {filter}
+        GROUP BY o.session_id
+        """,
+        "total_orders != 0",
+    ),
+    'session_customers': (
+        ('session_id', 'user_id', 'orders_count'),
+        """
+        SELECT o.session_id, o.user_id, COUNT(*)
+        FROM all_orders o
+        WHERE 1 = 1 {filter}
+        GROUP BY o.session_id, o.user_id
+        """,
+        "orders_count != 0",
+    ),
+    'product_sales': (
+        ('session_id', 'product_id', 'sold_boxes'),
+        """
+        SELECT o.session_id, oi.product_id, SUM(oi.quantity)
+        FROM all_orders o
+        JOIN all_order_items oi ON oi.order_id = o.order_id
+        WHERE o.status = 'completed' {filter}
+        GROUP BY o.session_id, oi.product_id
+        """,
+        "sold_boxes != 0",
+    ),
+    'user_session_limits': (
+        ('user_id', 'session_id', 'boxes_purchased'),
+        """
+        SELECT o.user_id, o.session_id, SUM(oi.quantity)
+        FROM all_orders o
+        JOIN all_order_items oi ON oi.order_id = o.order_id
+        WHERE o.status = 'completed' {filter}
+        GROUP BY o.user_id, o.session_id
+        """,
+        "boxes_purchased != 0",
+    ),
+    'user_stats': (
+        ('user_id', 'completed_orders', 'open_orders', 'total_boxes', 'total_amount'),
+        """
+        SELECT
+            o.user_id,
+            SUM(o.status = 'completed'),
+            SUM(o.status NOT IN ('completed', 'cancelled')),
+            COALESCE(SUM(CASE WHEN o.status = 'completed' THEN (
+                SELECT SUM(oi.quantity) FROM all_order_items oi WHERE oi.order_id = o.order_id
+            ) END), 0),
+            COALESCE(SUM(CASE WHEN o.status = 'completed' THEN o.total_amount END), 0)
+        FROM all_orders o
+        WHERE 1 = 1 {filter}
+        GROUP BY o.user_id
+        """,
+        "completed_orders != 0 OR open_orders != 0 OR total_boxes != 0 OR total_amount != 0",
+    ),
+}
+
+# Таблицы, которые можно пересчитать для одной сессии
+SESSION_TABLES = ('session_stats', 'session_customers', 'product_sales', 'user_session_limits')
+
+# Денежные колонки сверяются с точностью до копейки
+_MONEY_COLUMNS = ('total_revenue', 'total_amount')
+
+
+def _expected_sql(table: str, session_id: Optional[int]) -> tuple:
+    """Ожидаемый запрос для таблицы и его параметры"""
+    query = EXPECTED[table][1]
+    if session_id is None:
+        return query.format(filter=""), ()
+    return query.format(filter="AND o.session_id = ?"), (session_id,)
+
+
+def rebuild(cursor, session_id: Optional[int] = None, tables=None):
+    """
+    Пересчитывает таблицы счетчиков с нуля по orders и order_items.
+
+    По умолчанию пересчитываются все таблицы EXPECTED. С session_id -
+    только строки этой сессии, поэтому допустимы лишь таблицы SESSION_TABLES.
+    """
+    if tables is None:
+        tables = EXPECTED if session_id is None else SESSION_TABLES
+    for table in tables:
+        columns = EXPECTED[table][0]
+        query, params = _expected_sql(table, session_id)
+        if session_id is None:
+            cursor.execute(f"DELETE FROM {table}")
+        else:
+            cursor.execute(f"DELETE FROM {table} WHERE session_id = ?", (session_id,))
+        cursor.execute(f"INSERT INTO {table} ({', '.join(columns)}) {query}", params)
+
+
+def rebuild_session_stats(cursor, session_id: Optional[int] = None):
+    """Пересчитывает таблицы по сессиям (все сессии или одну) с нуля"""
+    rebuild(cursor, session_id, SESSION_TABLES)
+
+
+def check(cursor, sample_size: int = 10) -> dict:
+    """
+    Сверяет таблицы счетчиков с orders и order_items, по одному запросу на таблицу.
+
+    Возвращает {таблица: {'mismatched': число расходящихся ключей, 'sample': [ключи]}}
+    только для таблиц с расхождениями. Нулевые строки не учитываются.
+    """
+    problems = {}
+    for table, (columns, query, not_empty) in EXPECTED.items():
+        projection = ", ".join(
+            f"ROUND({column}, 2)" if column in _MONEY_COLUMNS else column for column in columns
+        )
+        cursor.execute(f"""
+            WITH expected ({", ".join(columns)}) AS ({query.format(filter="")})
+            SELECT * FROM (
+                SELECT {projection} FROM expected WHERE {not_empty}
+                EXCEPT
+                SELECT {projection} FROM {table} WHERE {not_empty}
+            )
+            UNION ALL
+            SELECT * FROM (
+                SELECT {projection} FROM {table} WHERE {not_empty}
+                EXCEPT
+                SELECT {projection} FROM expected WHERE {not_empty}
+            )
+        """)
+        rows = cursor.fetchall()
+        if rows:
+            key_size = 1 if table in ('session_stats', 'user_stats') else 2
+            keys = sorted({row[:key_size] for row in rows})
+            problems[table] = {'mismatched': len(keys), 'sample': keys[:sample_size]}
+    return problems
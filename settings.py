@@ -0,0 +1,90 @@
+"""
+Настройки бота из таблицы settings, загруженные в память.
+
+Все строки settings читаются один раз при первом обращении, дальше чтение
+настройки не обращается к БД. Запись идет сначала в БД, затем в память
+(database.set_setting), поэтому бот всегда видит свое последнее значение.
+
+Тип и значение по умолчанию известных настроек описаны в SETTINGS. Новая
+настройка добавляется одной строкой сюда - отдельные функции чтения и записи
+для нее не нужны. Неизвестные ключи хранятся как строки.
+"""
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Известные настройки: ключ -> (тип, значение по умолчанию)
+SETTINGS = {
+    # Лимит ящиков на одного человека в сессии (0 - без ограничений)
+    'limit_per_person': (int, 0),
+}
+
+
+def parse_value(key: str, raw):
+    """Переводит строку из settings в значение нужного типа (при ошибке - значение по умолчанию)"""
+    value_type, default = SETTINGS.get(key, (str, None))
+    if raw is None:
+        return default
+    try:
+        if value_type is bool:
+            return str(raw).strip().lower() in ('1', 'true', 'yes', 'on')
+        return value_type(raw)
+    except (ValueError, TypeError):
+        logger.warning(f"Некорректное значение настройки {key}={raw!r}, используем {default!r}")
+        return default
+
+
+def format_value(key: str, value) -> str:
+    """Переводит значение в строку для settings; ValueError, если тип не подходит"""
+    value_type, _ = SETTINGS.get(key, (str, None))
+    if value_type is bool:
+        return '1' if value else '0'
+    try:
+        return str(value_type(value))
+    except (ValueError, TypeError):
+        raise ValueError(f"Настройка {key} должна иметь тип {value_type.__name__}, получено {value!r}")
+
+
+class SettingsStore:
+    """Значения настроек в памяти процесса"""
+
+    def __init__(self):
+        self._values = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self, rows):
+        """Заменяет все значения строками (setting_key, setting_value) из БД"""
+        values = {key: parse_value(key, raw) for key, raw in rows}
+        with self._lock:
+            self._values = values
+            self._loaded = True
+
+    def get(self, key: str):
+        """Значение настройки; для отсутствующей - значение по умолчанию"""
+        value = self._values.get(key, None)
+        if value is None:
+            return SETTINGS.get(key, (str, None))[1]
+        return value
+
+    def put(self, key: str, raw: str):
+        """Запоминает значение, уже записанное в БД"""
+        with self._lock:
+            self._values[key] = parse_value(key, raw)
+
+    def clear(self):
+        """Забывает все значения: следующее чтение загрузит их из БД заново"""
+        with self._lock:
+            self._values = {}
+            self._loaded = False
+
+    def as_dict(self) -> dict:
+        """Все настройки: известные (с учетом значений по умолчанию) и сохраненные в БД"""
+        result = {key: default for key, (_, default) in SETTINGS.items()}
+        result.update(self._values)
+        return result
@@ -0,0 +1,103 @@
+"""
+Параллельная обработка обновлений telegram с порядком по пользователям.
+
+По умолчанию Application обрабатывает обновления по одному: пока менеджер
+ждет скриншот таблицы, нажатия всех покупателей стоят в очереди.
+UserOrderedUpdateProcessor (Application.builder().concurrent_updates(...))
+обрабатывает обновления разных пользователей одновременно:
+
+- обновления одного пользователя выполняются строго по порядку (замок на
+  пользователя; замок удаляется, когда у пользователя не осталось обновлений);
+- одновременно выполняется не больше config.UPDATE_CONCURRENCY обновлений;
+- всего в обработке и в очереди - не больше config.UPDATE_MAX_PENDING
+  обновлений, дальше Application ждет, не читая новые.
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class _Lane:
+    """Очередь обновлений одного пользователя"""
+
+    __slots__ = ('lock', 'updates')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.updates = 0
+
+
+class UserOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений разных пользователей, по порядку - одного"""
+
+    __slots__ = ('_concurrency', '_slots', '_lanes', '_running')
+
+    def __init__(self, concurrency: int, max_pending: int):
+        """
+        Параметры:
+            concurrency - сколько обновлений выполняется одновременно
+            max_pending - сколько обновлений может быть в обработке и в очереди всего
+        """
+        super().__init__(max(max_pending, concurrency))
+        if concurrency < 1:
+            raise ValueError("concurrency должно быть положительным")
+        self._concurrency = concurrency
+        self._slots = asyncio.Semaphore(concurrency)
+        self._lanes = {}
+        self._running = 0
+
+    @staticmethod
+    def _user_key(update) -> Optional[int]:
+        if isinstance(update, Update) and update.effective_user is not None:
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update, coroutine) -> None:
+        """Ждет предыдущие обновления пользователя и свободный слот, затем выполняет обновление"""
+        key = self._user_key(update)
+        if key is None:
+            await self._execute(update, coroutine)
+            return
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane()
+        lane.updates += 1
+        try:
+            async with lane.lock:
+                await self._execute(update, coroutine)
+        finally:
+            lane.updates -= 1
+            if not lane.updates:
+                del self._lanes[key]
+
+    async def _execute(self, update, coroutine) -> None:
+        async with self._slots:
+            self._running += 1
+            try:
+                await coroutine
+            finally:
+                self._running -= 1
+
+    def stats(self) -> dict:
+        """
+        Снимок нагрузки: running - выполняется сейчас, pending - всего в обработке
+        и в очереди, users - пользователей с обновлениями в обработке
+        """
+        return {
+            'concurrency': self._concurrency,
+            'running': self._running,
+            'pending': self.current_concurrent_updates,
+            'max_pending': self.max_concurrent_updates,
+            'users': len(self._lanes),
+        }
+
+    async def initialize(self) -> None:
+        """Ничего не делает"""
+
+    async def shutdown(self) -> None:
+        """Ничего не делает"""
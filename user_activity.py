@@ -0,0 +1,125 @@
+"""
+Буфер активности пользователей (отложенная запись).
+
+/start вызывается чаще всего, и раньше каждый вызов делал SELECT и UPDATE
+или INSERT в users с фиксацией транзакции. Теперь активность копится
+в памяти по пользователю, а database.flush_user_activity() записывает
+накопленное пачкой UPSERT-ов: по таймеру, при переполнении буфера и при
+остановке бота.
+
+Пока запись не в БД, database.get_user_info() накладывает ее поверх строки
+из users, поэтому бот сразу видит свои изменения.
+"""
+import threading
+from datetime import datetime, timezone
+
+# Поля профиля из telegram.User, которые записываются в users как есть
+PROFILE_FIELDS = (
+    'username', 'first_name', 'last_name', 'language_code',
+    'is_bot', 'is_premium', 'added_to_attachment_menu',
+    'can_join_groups', 'can_read_all_group_messages',
+    'supports_inline_queries', 'chat_id',
+)
+
+
+def _now() -> str:
+    # Тот же формат и часовой пояс, что у CURRENT_TIMESTAMP в SQLite
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def profile_from_user(user, chat_id: int) -> dict:
+    """Поля профиля из объекта пользователя telegram"""
+    return {
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'language_code': user.language_code,
+        'is_bot': 1 if user.is_bot else 0,
+        'is_premium': 1 if getattr(user, 'is_premium', False) else 0,
+        'added_to_attachment_menu': 1 if getattr(user, 'added_to_attachment_menu', False) else 0,
+        'can_join_groups': 1 if getattr(user, 'can_join_groups', True) else 0,
+        'can_read_all_group_messages': 1 if getattr(user, 'can_read_all_group_messages', False) else 0,
+        'supports_inline_queries': 1 if getattr(user, 'supports_inline_queries', False) else 0,
+        'chat_id': chat_id,
+    }
+
+
+def _merge(older: dict, newer: dict) -> dict:
+    """Объединяет две записи одного пользователя: профиль из новой, счетчик - сумма"""
+    merged = dict(newer)
+    merged['first_seen'] = min(older['first_seen'], newer['first_seen'])
+    merged['messages'] = older['messages'] + newer['messages']
+    return merged
+
+
+class ActivityBuffer:
+    """Накопленная, но еще не записанная в БД активность пользователей"""
+
+    def __init__(self):
+        self._pending = {}
+        # Записи, которые сейчас записываются в БД (видны читателям до фиксации)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.flushed = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def record(self, user, chat_id: int) -> int:
+        """Запоминает обращение пользователя; возвращает число пользователей в буфере"""
+        now = _now()
+        entry = profile_from_user(user, chat_id)
+        entry.update(user_id=user.id, first_seen=now, last_seen=now, messages=1)
+        with self._lock:
+            previous = self._pending.get(user.id)
+            self._pending[user.id] = _merge(previous, entry) if previous else entry
+            self.recorded += 1
+            return len(self._pending)
+
+    def drain(self, user_id=None) -> list:
+        """Забирает записи для записи в БД (все или одного пользователя)"""
+        with self._lock:
+            if user_id is None:
+                taken, self._pending = self._pending, {}
+            else:
+                entry = self._pending.pop(user_id, None)
+                taken = {user_id: entry} if entry else {}
+            self._inflight.update(taken)
+            return list(taken.values())
+
+    def done(self, entries: list):
+        """Записи зафиксированы в БД"""
+        with self._lock:
+            for entry in entries:
+                if self._inflight.get(entry['user_id']) is entry:
+                    del self._inflight[entry['user_id']]
+            self.flushed += len(entries)
+
+    def restore(self, entries: list):
+        """Запись в БД не удалась - возвращаем записи в буфер до следующей попытки"""
+        with self._lock:
+            for entry in entries:
+                user_id = entry['user_id']
+                if self._inflight.get(user_id) is entry:
+                    del self._inflight[user_id]
+                newer = self._pending.get(user_id)
+                self._pending[user_id] = _merge(entry, newer) if newer else entry
+
+    def pending(self, user_id: int):
+        """Незаписанная активность пользователя или None"""
+        with self._lock:
+            inflight = self._inflight.get(user_id)
+            pending = self._pending.get(user_id)
+        if inflight and pending:
+            return _merge(inflight, pending)
+        return pending or inflight
+
+    def stats(self) -> dict:
+        """Статистика буфера: ждут записи, всего обращений, записано пользователей"""
+        with self._lock:
+            return {
+                'pending': len(self._pending) + len(self._inflight),
+                'recorded': self.recorded,
+                'flushed': self.flushed,
+            }